@@ -0,0 +1,185 @@
+import bisect
+import os
+import time
+
+import numpy as np
+
+from metrics import timed
+from transcription import decode_audio, encode_wav
+
+# Local preprocessing before transcription: downmix to mono, resample to 16 kHz (what the ASR model
+# works at anyway) and cut long silences found by a simple energy-based voice-activity detector.
+# The cuts are recorded in a timestamp map so times in the processed audio can be mapped back to
+# the original recording.
+PREPROCESS_SAMPLE_RATE = int(os.getenv("PREPROCESS_SAMPLE_RATE", "16000"))
+# Resampling works this many seconds at a time, which bounds its temporaries. The whole recording is
+# still held once as mono float32 (to_mono's output, 4 bytes per sample at the original rate) next to the
+# decoded PCM, until it is resampled.
+PREPROCESS_BLOCK_SECONDS = 60
+VAD_FRAME_MS = 30
+# Silences shorter than this are kept; longer ones are cut down to the padding on either side
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "700"))
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# A frame is speech when it is this much louder than the quiet frames (10th percentile)...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+# ...and louder than this absolute level (dBFS), so dither and hiss in a quiet room don't count
+VAD_FLOOR_DB = float(os.getenv("VAD_FLOOR_DB", "-50"))
+
+
+# Function to convert interleaved PCM frames to mono float32 samples in [-1, 1]
+def to_mono(frames, channels, sample_width):
+    if sample_width == 1:
+        samples, offset, scale = np.frombuffer(frames, dtype=np.uint8), 128, 128
+    elif sample_width == 2:
+        samples, offset, scale = np.frombuffer(frames, dtype="<i2"), 0, 32768
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples, offset, scale = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8, 0, 8388608
+    elif sample_width == 4:
+        samples, offset, scale = np.frombuffer(frames, dtype="<i4"), 0, 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    # Averaging the channels straight from the integers avoids a float copy of every channel
+    samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    samples -= offset
+    samples /= scale
+    return samples
+
+
+# Function to convert float samples back to 16-bit PCM bytes (the inverse of to_mono for 16-bit input,
+# so audio that needed no conversion comes back bit for bit)
+def to_pcm16(samples):
+    return np.clip(np.round(samples * 32768), -32768, 32767).astype("<i2").tobytes()
+
+
+# Function to resample mono audio. Downsampling first averages over the rate ratio so content above
+# the new Nyquist frequency doesn't fold back into the speech band, then interpolates linearly.
+# Converted in blocks; returns float32 samples.
+def resample(samples, from_rate, to_rate, block_seconds=PREPROCESS_BLOCK_SECONDS):
+    if from_rate == to_rate:
+        return samples.astype(np.float32, copy=False)
+    width = int(round(from_rate / to_rate))
+    kernel = np.ones(width, dtype=np.float32) / width if width > 1 else None
+    ratio = from_rate / to_rate
+    output = np.empty(int(len(samples) / ratio), dtype=np.float32)
+    block = block_seconds * to_rate
+    for start in range(0, len(output), block):
+        positions = np.arange(start, min(start + block, len(output))) * ratio
+        # Include a few samples either side so the filter and interpolation are seamless across blocks
+        first = max(0, int(positions[0]) - width)
+        last = min(len(samples), int(positions[-1]) + width + 2)
+        chunk = samples[first:last]
+        if kernel is not None:
+            chunk = np.convolve(chunk, kernel, mode="same")
+        output[start:start + len(positions)] = np.interp(positions - first, np.arange(len(chunk)), chunk)
+    return output
+
+
+# Function to find the stretches of audio to keep: returns a list of (start, end) sample indexes.
+# Frames are classed as speech by energy, then each speech run is padded and silences shorter than
+# VAD_MIN_SILENCE_MS are bridged.
+def detect_speech(samples, frame_rate, frame_ms=VAD_FRAME_MS, min_silence_ms=VAD_MIN_SILENCE_MS, padding_ms=VAD_PADDING_MS,
+                  margin_db=VAD_MARGIN_DB, floor_db=VAD_FLOOR_DB):
+    frame_length = max(1, frame_rate * frame_ms // 1000)
+    count = len(samples) // frame_length
+    if count == 0:
+        return [(0, len(samples))] if len(samples) else []
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy_db = 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+
+    quiet, loud = np.percentile(energy_db, [10, 95])
+    # Without that much contrast there is no telling speech from silence (a silent file, or steady noise
+    # or speech throughout); keep everything rather than cut at an arbitrary level
+    if loud - quiet < margin_db:
+        return [(0, len(samples))]
+    # In a recording that is nearly all speech the quiet frames are speech too; never set the bar above
+    # a margin below the loud frames
+    threshold = min(max(quiet + margin_db, floor_db), loud - margin_db)
+    speech = energy_db > threshold
+
+    # Pad each speech run, then bridge gaps shorter than the minimum silence
+    padding = int(np.ceil(padding_ms / frame_ms))
+    if padding:
+        speech = np.convolve(speech, np.ones(2 * padding + 1), mode="same") > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    runs = list(zip(edges[::2], edges[1::2]))
+    min_gap = int(np.ceil(min_silence_ms / frame_ms))
+    merged = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    keep = [(int(start) * frame_length, min(len(samples), int(end) * frame_length)) for start, end in merged]
+    # The trailing partial frame follows whatever the last full frame was
+    if keep and keep[-1][1] == count * frame_length:
+        keep[-1] = (keep[-1][0], len(samples))
+    return keep
+
+
+# Function to map a time in the processed audio back to the original recording.
+# timestamp_map is a list of (processed_start, original_start) pairs in seconds, one per kept stretch.
+def to_original_time(timestamp_map, seconds):
+    if not timestamp_map:
+        return seconds
+    index = max(0, bisect.bisect_right([processed for processed, _ in timestamp_map], seconds) - 1)
+    processed_start, original_start = timestamp_map[index]
+    return original_start + seconds - processed_start
+
+
+# Function to prepare an upload for transcription: mono, PREPROCESS_SAMPLE_RATE, long silences cut.
+# Returns {"audio", "file_name", "timestamp_map", "stats"} with 16-bit WAV bytes, or None if the
+# upload can't be decoded (then it should be sent as it is).
+@timed("audio_preprocessing")
+def preprocess_audio(audio_bytes, file_name, sample_rate=PREPROCESS_SAMPLE_RATE, trim_silence=True):
+    start_time = time.perf_counter()
+    decoded = decode_audio(audio_bytes, file_name)
+    if decoded is None:
+        return None
+    channels, sample_width, frame_rate, frames = decoded
+    original_seconds = len(frames) // (channels * sample_width) / frame_rate
+
+    samples = resample(to_mono(frames, channels, sample_width), frame_rate, sample_rate)
+    del frames
+    keep = detect_speech(samples, sample_rate) if trim_silence else [(0, len(samples))]
+
+    timestamp_map = []
+    pieces = []
+    processed = 0
+    for start, end in keep:
+        timestamp_map.append((processed / sample_rate, start / sample_rate))
+        pieces.append(samples[start:end])
+        processed += end - start
+    trimmed = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+    pcm = to_pcm16(trimmed)
+
+    name = os.path.splitext(os.path.basename(file_name))[0] + ".wav"
+    audio = encode_wav(1, 2, sample_rate, pcm, name).getvalue()
+    processed_seconds = len(trimmed) / sample_rate
+    return {
+        "audio": audio,
+        "file_name": name,
+        "timestamp_map": timestamp_map,
+        "stats": {
+            "original_bytes": len(audio_bytes),
+            "processed_bytes": len(audio),
+            "bytes_saved": len(audio_bytes) - len(audio),
+            "original_seconds": original_seconds,
+            "processed_seconds": processed_seconds,
+            "seconds_saved": original_seconds - processed_seconds,
+            "cuts": max(0, len(keep) - 1),
+            "processing_seconds": time.perf_counter() - start_time,
+        },
+    }
+
+
+# Function to report preprocessing savings in one line
+def describe_savings(stats):
+    byte_share = stats["bytes_saved"] / stats["original_bytes"] if stats["original_bytes"] else 0.0
+    second_share = stats["seconds_saved"] / stats["original_seconds"] if stats["original_seconds"] else 0.0
+    return (
+        f"Upload {stats['original_bytes'] / 2**20:.1f} MiB -> {stats['processed_bytes'] / 2**20:.1f} MiB ({byte_share:.0%} saved), "
+        f"audio {stats['original_seconds']:.0f}s -> {stats['processed_seconds']:.0f}s ({second_share:.0%} saved, "
+        f"{stats['cuts']} silences cut) in {stats['processing_seconds']:.2f}s"
+    )
@@ -0,0 +1,171 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import as_completed, ProcessPoolExecutor
+
+import chart_renderer
+from document_export import EXPORTERS
+from document_generator import DEFAULT_MAX_CONCURRENCY, DOCUMENT_SECTIONS, generate_document
+from document_model import build_document
+from rate_limiter import OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, RateLimiter, set_rate_limiter
+
+# Headless batch generation: one document per CSV row, without Streamlit.
+#     python batch_generate.py plans.csv --output-dir plans --workers 4
+# Columns are the form's fields (document_type, language, writing_person, writing_style, document_length,
+# template, business_type, bee_level, directors, staffing, funding_amount, grant_amount, finance_term,
+# business_overview) plus an optional "name" for the output files; missing columns take the form's
+# defaults. Documents run on a process pool, each generating its sections concurrently, and share the
+# API rate limits between them. Every finished document is written (and recorded in the manifest) as
+# soon as it is done, and rows whose files already exist are skipped, so an interrupted batch can
+# simply be run again.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+BATCH_MANIFEST = "batch_manifest.jsonl"
+
+# The first option of each field on the home page form
+BATCH_DEFAULTS = {
+    "document_type": "Business Plan",
+    "language": "UK English",
+    "writing_person": "1st Person",
+    "writing_style": "Formal",
+    "document_length": "Short",
+    "template": "Standard",
+    "business_type": "Start-up",
+    "bee_level": "Level 1",
+    "directors": "",
+    "staffing": "",
+    "funding_amount": "",
+    "grant_amount": "",
+    "finance_term": "",
+    "business_overview": "",
+}
+
+
+# Function to read the batch CSV into (name, inputs) pairs.
+# A name already used by an earlier row gets the row number appended, so rows never share output files;
+# the suffix depends only on the row's position, so running the same CSV again finds the same files.
+def read_batch_csv(path):
+    rows, taken = [], set()
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for number, row in enumerate(csv.DictReader(file), start=1):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            inputs = {key: row.get(key) or default for key, default in BATCH_DEFAULTS.items()}
+            name = output_name(number, row.get("name"), inputs["document_type"])
+            while name.lower() in taken:
+                name = f"{name}_{number:04d}"
+            # Compared case-insensitively, as the output directory may be on a case-insensitive filesystem
+            taken.add(name.lower())
+            rows.append((name, inputs))
+    return rows
+
+
+def output_name(number, name, document_type):
+    name = name or f"{number:04d}_{document_type}"
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or f"{number:04d}"
+
+
+def output_paths(output_dir, name, formats):
+    return {export_format: os.path.join(output_dir, f"{name}.{export_format}") for export_format in formats}
+
+
+# Runs once in every batch worker. Documents already run in parallel, so charts render in-process,
+# and each worker gets an equal share of the API limits so together they stay within them.
+def _init_worker(workers):
+    chart_renderer.CHART_POOL_WORKERS = 1
+    rpm = max(1, OPENAI_RPM_LIMIT // workers) if OPENAI_RPM_LIMIT else 0
+    tpm = max(1, OPENAI_TPM_LIMIT // workers) if OPENAI_TPM_LIMIT else 0
+    set_rate_limiter(RateLimiter(rpm, tpm))
+
+
+# Function to generate and export one document; returns a manifest record and never raises
+def generate_one(name, inputs, output_dir, formats, max_concurrency=DEFAULT_MAX_CONCURRENCY, bypass_cache=False):
+    start = time.perf_counter()
+    record = {"name": name, "document_type": inputs["document_type"], "status": "done", "error": None, "files": []}
+    try:
+        if inputs["document_type"] not in DOCUMENT_SECTIONS:
+            raise ValueError(f"Unknown document type {inputs['document_type']!r}")
+        document_parts, _, section_stats = generate_document(inputs, max_concurrency=max_concurrency, bypass_cache=bypass_cache)
+        document = build_document(inputs["document_type"], DOCUMENT_SECTIONS[inputs["document_type"]], document_parts)
+        for export_format, path in output_paths(output_dir, name, formats).items():
+            # Write then rename so a crash never leaves a half-written file that looks finished
+            with EXPORTERS[export_format](document) as spool, open(f"{path}.tmp", "wb") as file:
+                shutil.copyfileobj(spool, file)
+            os.replace(f"{path}.tmp", path)
+            record["files"].append(path)
+        record["cached_sections"] = sum(stats["cached"] for stats in section_stats)
+        record["completion_tokens"] = sum(stats["completion_tokens"] for stats in section_stats)
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+# Function to generate every (name, inputs) row into output_dir on a pool of worker processes.
+# on_result(record, summary) is called in this process as each document finishes.
+# Returns a summary with counts, elapsed time and documents per hour.
+def generate_batch(rows, output_dir, formats=("docx", "pdf"), workers=BATCH_WORKERS, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                   bypass_cache=False, overwrite=False, on_result=None):
+    duplicates = sorted(name for name, count in Counter(name.lower() for name, _ in rows).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Rows would write to the same files: {', '.join(duplicates)}")
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [
+        (name, inputs) for name, inputs in rows
+        if overwrite or not all(os.path.exists(path) for path in output_paths(output_dir, name, formats).values())
+    ]
+    summary = {"total": len(rows), "skipped": len(rows) - len(pending), "done": 0, "failed": 0, "seconds": 0.0, "documents_per_hour": 0.0}
+    start = time.perf_counter()
+    workers = max(1, min(workers, len(pending) or 1))
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(workers,)) as pool, \
+            open(os.path.join(output_dir, BATCH_MANIFEST), "a", encoding="utf-8") as manifest:
+        futures = [
+            pool.submit(generate_one, name, inputs, output_dir, list(formats), max_concurrency, bypass_cache)
+            for name, inputs in pending
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+
+            summary[record["status"]] += 1
+            summary["seconds"] = time.perf_counter() - start
+            summary["documents_per_hour"] = summary["done"] / summary["seconds"] * 3600
+            if on_result:
+                on_result(record, summary)
+    return summary
+
+
+def print_result(record, summary):
+    finished = summary["done"] + summary["failed"]
+    pending = summary["total"] - summary["skipped"]
+    status = "done" if record["status"] == "done" else f"FAILED ({record['error']})"
+    print(f"[{finished}/{pending}] {record['name']} {status} in {record['seconds']:.1f}s  "
+          f"({summary['documents_per_hour']:.1f} documents/hour)", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate one document per row of a CSV without the Streamlit app.")
+    parser.add_argument("csv", help="CSV with one row per document; columns are the form's fields")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--formats", nargs="+", default=["docx", "pdf"], choices=list(EXPORTERS))
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Documents generated at once, one process each")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Concurrent section calls per document")
+    parser.add_argument("--regenerate", action="store_true", help="Ignore cached sections")
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate documents whose files already exist")
+    args = parser.parse_args()
+
+    rows = read_batch_csv(args.csv)
+    summary = generate_batch(rows, args.output_dir, args.formats, args.workers, args.concurrency, args.regenerate, args.overwrite,
+                             on_result=print_result)
+    print(f"{summary['done']} done, {summary['failed']} failed, {summary['skipped']} already present; "
+          f"{summary['seconds']:.1f}s, {summary['documents_per_hour']:.1f} documents/hour")
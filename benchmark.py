@@ -0,0 +1,1042 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from io import BytesIO
+
+import numpy as np
+import openai
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io
+import plotly.tools
+
+import bulk_ratios
+import chart_renderer
+import interactive_charts
+import llm_retry
+import monte_carlo
+import summarizer
+import transcription
+from live_transcription import LiveMeeting, LiveTranscriber
+from audio_preprocessing import describe_savings, preprocess_audio, resample, to_mono, to_original_time
+from document_export import clear_export_caches, EXPORTERS
+from document_generator import collect_charts, DOCUMENT_SECTIONS, generate_document, SectionGenerationError
+from document_model import build_document, document_from_text, update_section
+from document_store import DocumentStore
+from fake_openai_server import FILLER_WORDS, start_fake_server
+from financial_engine import compute_ratios
+from llm_cache import LLMCache, set_cache
+from prompt_builder import savings_report, set_usage_stats, UsageStats
+from rate_limiter import RateLimiter, rate_limit_session, set_rate_limiter
+
+# Sample form inputs used for benchmark documents
+SAMPLE_INPUTS = {
+    "document_type": "Business Plan",
+    "language": "UK English",
+    "writing_person": "1st Person",
+    "writing_style": "Formal",
+    "document_length": "Long",
+    "template": "Standard",
+    "business_type": "Start-up",
+    "bee_level": "Level 1",
+    "directors": "Jane Doe",
+    "staffing": "12 staff",
+    "funding_amount": "£500,000",
+    "grant_amount": "£100,000",
+    "finance_term": "5 years",
+    "business_overview": "A bakery chain expanding into three new cities."
+}
+
+
+# Function to point the openai client at a fake server for the benchmark.
+# Responses and section usage go to throwaway stores so benchmark runs never pollute the real ones.
+def use_fake_api(api_base):
+    openai.api_base = api_base
+    openai.api_key = "fake-key"
+    directory = tempfile.mkdtemp()
+    set_cache(LLMCache(path=os.path.join(directory, "bench_cache.sqlite3")))
+    set_usage_stats(UsageStats(path=os.path.join(directory, "bench_usage.sqlite3")))
+
+
+# Benchmark sequential vs concurrent section generation
+def benchmark_generation(concurrency_levels, latency, document_type="Business Plan"):
+    server, api_base = start_fake_server(latency=latency)
+    use_fake_api(api_base)
+    inputs = dict(SAMPLE_INPUTS, document_type=document_type)
+
+    results = {}
+    try:
+        for max_concurrency in concurrency_levels:
+            start = time.perf_counter()
+            generate_document(inputs, max_concurrency=max_concurrency, bypass_cache=True)
+            results[max_concurrency] = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    baseline = results[concurrency_levels[0]]
+    print(f"Document generation ({document_type}, {latency:.2f}s per call)")
+    for max_concurrency, elapsed in results.items():
+        print(f"  concurrency={max_concurrency:<3} {elapsed:7.2f}s  speedup x{baseline / elapsed:.1f}")
+    return results
+
+
+# Benchmark streamed generation: time-to-first-token and tokens/sec per section
+def benchmark_streaming(latency, token_latency, max_concurrency, document_type="Business Plan"):
+    server, api_base = start_fake_server(latency=latency, token_latency=token_latency)
+    use_fake_api(api_base)
+    inputs = dict(SAMPLE_INPUTS, document_type=document_type)
+
+    first_token_at = []
+    start = time.perf_counter()
+
+    def on_token(index, section, delta):
+        if not first_token_at:
+            first_token_at.append(time.perf_counter() - start)
+
+    try:
+        _, _, section_stats = generate_document(
+            inputs, max_concurrency=max_concurrency, bypass_cache=True, stream=True, on_token=on_token
+        )
+    finally:
+        server.shutdown()
+    total = time.perf_counter() - start
+
+    print(f"Streamed generation ({document_type}, concurrency={max_concurrency})")
+    print(f"  first token on page after {first_token_at[0]:.2f}s, document complete after {total:.2f}s")
+    for stats in section_stats:
+        print(f"  {stats['section']:<36} ttft {stats['time_to_first_token']:5.2f}s  {stats['tokens_per_second']:7.1f} tok/s")
+    return section_stats
+
+
+# Benchmark serial vs process-pool rendering of the full charts_to_generate list
+def benchmark_charts(repeat=3, document_type="Business Plan"):
+    charts_to_generate = collect_charts(document_type, DOCUMENT_SECTIONS[document_type])
+    chart_types = [chart_type for chart_type, _ in charts_to_generate]
+
+    start = time.perf_counter()
+    pool_ready = chart_renderer.warm_up_chart_pool()
+    warm_up = time.perf_counter() - start
+
+    serial, parallel = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for chart_type in chart_types:
+            chart_renderer.draw_chart_png(chart_type, chart_renderer.CHART_DATA[chart_type])
+        serial.append(time.perf_counter() - start)
+
+        chart_renderer.clear_chart_cache()
+        start = time.perf_counter()
+        chart_renderer.render_charts(charts_to_generate)
+        parallel.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    chart_renderer.render_charts(charts_to_generate)
+    cached = time.perf_counter() - start
+
+    print(f"Chart rendering ({len(chart_types)} charts, best of {repeat})")
+    print(f"  pool workers: {chart_renderer.CHART_POOL_WORKERS if pool_ready else 0} (warm-up {warm_up:.2f}s)")
+    print(f"  serial:   {min(serial):.3f}s")
+    print(f"  parallel: {min(parallel):.3f}s  speedup x{min(serial) / min(parallel):.1f}")
+    print(f"  cached:   {cached * 1000:.2f} ms")
+    return {"serial": min(serial), "parallel": min(parallel), "cached": cached, "warm_up": warm_up}
+
+
+# Function to turn a figure into the JSON Streamlit sends to the browser, the way st.plotly_chart does
+def plotly_payload(fig):
+    return plotly.io.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+# Benchmark interactive chart payload and build time as series grow: full-resolution SVG traces against
+# downsampled WebGL traces, plus a rerun served from the figure cache. Also checks that min/max
+# downsampling keeps the series' extremes.
+def benchmark_interactive_charts(lengths, method=interactive_charts.CHART_DOWNSAMPLE_METHOD, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    print(f"Interactive charts ({method} downsampling to {interactive_charts.CHART_PIXEL_WIDTH}px, best of {repeat})")
+    for length in lengths:
+        x = np.arange(length)
+        y = np.cumsum(rng.normal(0, 1, length))
+        row = {}
+        for label, build in (
+            ("full", lambda: go.Figure(go.Scatter(x=x, y=y, mode="lines"))),
+            ("downsampled", lambda: go.Figure(interactive_charts.line_trace(x, y, method=method, mode="lines"))),
+        ):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                payload = plotly_payload(build())
+                times.append(time.perf_counter() - start)
+            row[f"{label}_seconds"] = min(times)
+            row[f"{label}_bytes"] = len(payload)
+
+        interactive_charts.clear_figure_cache()
+        build = lambda: go.Figure(interactive_charts.line_trace(x, y, method=method, mode="lines"))
+        interactive_charts.cached_figure("benchmark", (y,), build)
+        start = time.perf_counter()
+        fig = interactive_charts.cached_figure("benchmark", (y,), build)
+        plotly_payload(fig)
+        row["cached_seconds"] = time.perf_counter() - start
+        drawn = np.asarray(fig.data[0].y)
+        row["extremes_kept"] = bool(drawn.min() == y.min() and drawn.max() == y.max())
+        results[length] = row
+        print(f"  {length:>9,} points: full {row['full_seconds'] * 1000:8.1f} ms {row['full_bytes'] / 2**20:7.2f} MiB   "
+              f"downsampled {row['downsampled_seconds'] * 1000:6.1f} ms {row['downsampled_bytes'] / 2**10:6.1f} KiB   "
+              f"cached rerun {row['cached_seconds'] * 1000:5.1f} ms   extremes kept: {row['extremes_kept']}")
+    return results
+
+
+# Sample company used for the financial benchmarks
+SAMPLE_FINANCIALS = {
+    "Revenue": 1_000_000.0,
+    "Expenses": 650_000.0,
+    "Assets": 5_000_000.0,
+    "Liabilities": 2_000_000.0,
+    "Equity": 3_000_000.0,
+    "Profit": 350_000.0,
+}
+
+
+# Benchmark Monte Carlo throughput (paths/sec) and peak traced memory
+def benchmark_monte_carlo(paths, periods, seed=0):
+    chunk_size = monte_carlo.auto_chunk_size(periods)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = monte_carlo.simulate(SAMPLE_FINANCIALS, paths, periods=periods, seed=seed, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Everything beyond the per-metric histograms should be one chunk's working set, whatever the number of paths
+    stored = monte_carlo.HISTOGRAM_BINS * 8 * len(result["final"])
+    budget = monte_carlo.MONTE_CARLO_CHUNK_BYTES + stored
+    print(f"Monte Carlo ({paths:,} paths x {periods} periods, chunks of {chunk_size:,})")
+    print(f"  {elapsed:.2f}s  {paths / elapsed:,.0f} paths/sec")
+    print(f"  peak memory {peak / 2**20:.1f} MiB (chunk budget {monte_carlo.MONTE_CARLO_CHUNK_BYTES / 2**20:.0f} MiB "
+          f"+ histograms {stored / 2**20:.1f} MiB) {'OK' if peak <= budget else 'OVER BUDGET'}")
+    print(f"  profit P5/P50/P95: {result['final']['Profit'][5]:,.0f} / {result['final']['Profit'][50]:,.0f} / {result['final']['Profit'][95]:,.0f}")
+    return {"seconds": elapsed, "paths_per_second": paths / elapsed, "peak_bytes": peak}
+
+
+# Function to synthesize a noise-filled mono WAV recording of the given length
+def synthetic_wav(seconds, frame_rate=16000, seed=0):
+    samples = np.random.default_rng(seed).integers(-3000, 3000, int(seconds * frame_rate), dtype=np.int16)
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+# Benchmark chunked transcription at several concurrency levels against the fake ASR endpoint,
+# checking that the stitched transcript matches a single-request transcript of the same audio
+def benchmark_transcription(minutes, concurrency_levels, asr_realtime_factor, segment_seconds=transcription.SEGMENT_SECONDS):
+    server, api_base = start_fake_server(latency=0.2, asr_realtime_factor=asr_realtime_factor)
+    use_fake_api(api_base)
+    audio_bytes = synthetic_wav(minutes * 60)
+
+    results = {}
+    try:
+        reference, _ = transcription.transcribe_audio(audio_bytes, "meeting.wav", segment_seconds=minutes * 60, overlap_seconds=0)
+        for max_concurrency in concurrency_levels:
+            start = time.perf_counter()
+            transcript, segment_stats = transcription.transcribe_audio(
+                audio_bytes, "meeting.wav", max_concurrency=max_concurrency, segment_seconds=segment_seconds
+            )
+            results[max_concurrency] = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    baseline = results[concurrency_levels[0]]
+    print(f"Transcription ({minutes} min audio, {len(segment_stats)} segments of {segment_seconds}s)")
+    for max_concurrency, elapsed in results.items():
+        print(f"  concurrency={max_concurrency:<3} {elapsed:7.2f}s  speedup x{baseline / elapsed:.1f}")
+    print(f"  stitched transcript matches single request: {transcript == reference}")
+    return results
+
+
+# Function to build stereo meeting audio: speech-like bursts (a modulated voiced tone plus noise)
+# separated by pauses of random length over a faint noise floor. Returns (wav bytes, [(start, end)]
+# of every burst in seconds).
+def synthetic_meeting_wav(seconds, frame_rate=48000, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 30, int(seconds * frame_rate)).astype(np.float32)
+    bursts = []
+    position = rng.uniform(0.5, 3)
+    while position < seconds - 1:
+        length = min(rng.uniform(1, 8), seconds - position)
+        start, end = int(position * frame_rate), int((position + length) * frame_rate)
+        t = np.arange(end - start) / frame_rate
+        pitch = rng.uniform(100, 250)
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * t) ** 2
+        voice = np.sin(2 * np.pi * pitch * t) + 0.5 * np.sin(4 * np.pi * pitch * t) + 0.3 * rng.normal(0, 1, len(t))
+        samples[start:end] += (rng.uniform(2000, 8000) * syllables * voice).astype(np.float32)
+        bursts.append((position, position + length))
+        position += length + rng.choice([rng.uniform(0.1, 0.5), rng.uniform(1, 12)])
+    frames = np.repeat(np.clip(samples, -32768, 32767).astype("<i2")[:, None], channels, axis=1)
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(frames.tobytes())
+    return buffer.getvalue(), bursts
+
+
+# Benchmark the audio preprocessing stage on a synthetic meeting: bytes and seconds saved, and
+# transcription time against the fake ASR endpoint with and without it. Also checks that every burst
+# of speech survives and that the timestamp map lines the processed audio up with the original.
+def benchmark_preprocessing(minutes, asr_realtime_factor, seed=0):
+    audio_bytes, bursts = synthetic_meeting_wav(minutes * 60, seed=seed)
+    prepared = preprocess_audio(audio_bytes, "meeting.wav")
+    stats = prepared["stats"]
+    timestamp_map = prepared["timestamp_map"]
+    print(f"Audio preprocessing ({minutes} min stereo 48 kHz, {len(bursts)} speech bursts)")
+    print(f"  {describe_savings(stats)}")
+
+    # Every burst must fall inside kept audio
+    kept = [(original, original + (next_processed - processed))
+            for (processed, original), next_processed in zip(timestamp_map, [p for p, _ in timestamp_map[1:]] + [stats["processed_seconds"]])]
+    lost = sum(1 for start, end in bursts if not any(keep_start <= start and end <= keep_end for keep_start, keep_end in kept))
+    # Samples at a processed time must be the samples at its mapped original time
+    with wave.open(BytesIO(audio_bytes)) as wav:
+        reference = resample(to_mono(wav.readframes(wav.getnframes()), wav.getnchannels(), wav.getsampwidth()), wav.getframerate(), 16000)
+    with wave.open(BytesIO(prepared["audio"])) as wav:
+        processed = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2").astype(np.float32) / 32768
+    probes = np.random.default_rng(seed).integers(0, len(processed) - 160, 50)
+    misaligned = 0
+    for start in probes:
+        original = int(round(to_original_time(timestamp_map, start / 16000) * 16000))
+        if not np.allclose(processed[start:start + 160], reference[original:original + 160], atol=1e-3):
+            misaligned += 1
+    print(f"  speech bursts lost: {lost}  misaligned probes: {misaligned}/{len(probes)}  "
+          f"{'OK' if not lost and not misaligned else 'MISMATCH'}")
+
+    server, api_base = start_fake_server(latency=0.2, asr_realtime_factor=asr_realtime_factor)
+    use_fake_api(api_base)
+    try:
+        start = time.perf_counter()
+        transcription.transcribe_audio(audio_bytes, "meeting.wav")
+        original_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        transcription.transcribe_audio(prepared["audio"], prepared["file_name"])
+        processed_seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    print(f"  transcription: original {original_seconds:.2f}s, preprocessed {processed_seconds:.2f}s "
+          f"(+{stats['processing_seconds']:.2f}s preprocessing)")
+    return {
+        "preprocessing_seconds": stats["processing_seconds"],
+        "bytes_saved_ratio": stats["bytes_saved"] / stats["original_bytes"],
+        "seconds_saved_ratio": stats["seconds_saved"] / stats["original_seconds"],
+        "transcription_original_seconds": original_seconds,
+        "transcription_preprocessed_seconds": processed_seconds,
+        "lost_bursts": lost,
+        "misaligned_probes": misaligned,
+    }
+
+
+# Benchmark live transcription by replaying synthetic meetings into a LiveTranscriber against the fake
+# API (speed > 1 replays faster than real time). Reports how long after the meeting ends the notes are
+# ready, compared with transcribing and summarizing the whole recording then, and the peak memory for
+# each meeting length, which should stay flat. Also checks the live transcript matches a batch
+# transcript of the same audio cut into the same chunks.
+def benchmark_live(minutes_levels, speed, latency, asr_realtime_factor, chunk_seconds=20, overlap_seconds=2, summary_seconds=120):
+    server, api_base = start_fake_server(latency=latency, asr_realtime_factor=asr_realtime_factor)
+    use_fake_api(api_base)
+    results = {}
+    try:
+        print(f"Live transcription (replayed at x{speed:g}, {chunk_seconds}s chunks, summary every {summary_seconds}s)")
+        for minutes in minutes_levels:
+            audio_bytes = synthetic_wav(minutes * 60, seed=minutes)
+            transcriber = LiveTranscriber(chunk_seconds=chunk_seconds, overlap_seconds=overlap_seconds, summary_seconds=summary_seconds)
+            tracemalloc.start()
+            meeting = LiveMeeting(transcriber, wav_bytes=audio_bytes, speed=speed)
+            while meeting.running():
+                time.sleep(0.05)
+            transcript, summary = meeting.stop()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            reference, _ = transcription.transcribe_audio(audio_bytes, "meeting.wav", segment_seconds=chunk_seconds, overlap_seconds=overlap_seconds)
+            summarizer.summarize_transcript(reference, bypass_cache=True)
+            after_meeting = time.perf_counter() - start
+
+            stats = transcriber.stats
+            results[minutes] = {
+                "notes_ready_seconds": stats["final_seconds"],
+                "batch_after_meeting_seconds": after_meeting,
+                "peak_mib": peak / 2**20,
+                "chunks": stats["chunks"],
+                "summary_updates": stats["summary_updates"],
+                "transcript_matches": transcript == reference,
+            }
+            print(f"  {minutes:>3} min: notes ready {stats['final_seconds']:5.2f}s after the end (batch: {after_meeting:6.2f}s)  "
+                  f"peak {peak / 2**20:5.2f} MiB  {stats['chunks']} chunks  {stats['summary_updates']} summary updates  "
+                  f"transcript matches batch: {transcript == reference}")
+    finally:
+        server.shutdown()
+    return results
+
+
+# Function to build a long multi-speaker meeting transcript
+def synthetic_transcript(turns, words_per_turn=60):
+    speakers = ["Alice", "Bob", "Chen", "Dineo"]
+    words = "we agreed the budget for the next quarter and asked finance to review the supplier contracts".split()
+    lines = []
+    for turn in range(turns):
+        sentence = " ".join(words[(turn + i) % len(words)] for i in range(words_per_turn))
+        lines.append(f"{speakers[turn % len(speakers)]}: {sentence.capitalize()}.")
+    return "\n".join(lines)
+
+
+# Benchmark map-reduce summarization of a long transcript against the fake completion endpoint
+def benchmark_summarization(turns, latency, max_concurrency):
+    server, api_base = start_fake_server(latency=latency, completion_tokens=400)
+    use_fake_api(api_base)
+    transcript = synthetic_transcript(turns)
+    try:
+        start = time.perf_counter()
+        _, stage_stats = summarizer.summarize_transcript(transcript, bypass_cache=True, max_concurrency=max_concurrency)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    print(f"Summarization ({summarizer.count_tokens(transcript):,} transcript tokens, concurrency={max_concurrency})")
+    for stats in stage_stats:
+        print(f"  {stats['stage']:<18} {stats['calls']:3} calls  {stats['seconds']:6.2f}s  "
+              f"{stats['prompt_tokens']:7,} prompt / {stats['completion_tokens']:6,} completion tokens")
+    print(f"  total {elapsed:.2f}s")
+    return stage_stats
+
+
+# Benchmark generation against a fault-injecting API.
+# With retries on, every section should arrive and only streams that broke part-way waste tokens,
+# at most one section's worth per retry. With retries off, a run fails part-way and resuming it
+# should request only the sections that are missing.
+def benchmark_faults(failure_rate, seed, document_type="Business Plan"):
+    server, api_base = start_fake_server(latency=0.05, token_latency=0.001, failure_rate=failure_rate, retry_after=0.1, seed=seed)
+    use_fake_api(api_base)
+    inputs = dict(SAMPLE_INPUTS, document_type=document_type)
+    retry_settings = (llm_retry.RETRY_MAX_ATTEMPTS, llm_retry.RETRY_BASE_DELAY)
+    llm_retry.RETRY_MAX_ATTEMPTS, llm_retry.RETRY_BASE_DELAY = 10, 0.05
+
+    try:
+        start = time.perf_counter()
+        _, _, section_stats = generate_document(inputs, bypass_cache=True, stream=True)
+        elapsed = time.perf_counter() - start
+        served = server.counters["served_tokens"]
+        kept = sum(stats["completion_tokens"] for stats in section_stats)
+        retries = sum(stats["retries"] for stats in section_stats)
+        wasted_bound = sum(stats["retries"] * stats["max_tokens"] for stats in section_stats)
+        reported_waste = sum(stats["wasted_tokens"] for stats in section_stats)
+
+        llm_retry.RETRY_MAX_ATTEMPTS = 1
+        saved = {}
+        failed_sections = []
+        try:
+            generate_document(inputs, bypass_cache=True,
+                              on_progress=lambda index, section, completed, total, stats, text: saved.__setitem__(index, (text, stats)))
+        except SectionGenerationError as e:
+            failed_sections = e.failed_sections
+        server.config["failure_rate"] = 0.0
+        requests_before = server.counters["requests"]
+        parts, _, _ = generate_document(inputs, bypass_cache=True, completed_parts=saved)
+        resume_requests = server.counters["requests"] - requests_before
+    finally:
+        llm_retry.RETRY_MAX_ATTEMPTS, llm_retry.RETRY_BASE_DELAY = retry_settings
+        server.shutdown()
+
+    wasted = served - kept
+    results = {
+        "seconds": elapsed,
+        "retries": retries,
+        "served_tokens": served,
+        "kept_tokens": kept,
+        "wasted_tokens": wasted,
+        "wasted_bound": wasted_bound,
+        "failed_sections": len(failed_sections),
+        "resume_requests": resume_requests,
+    }
+    print(f"Fault injection ({document_type}, failure rate {failure_rate:.0%}, seed {seed})")
+    print(f"  with retries: {elapsed:.2f}s, {retries} retries, {served:,} tokens served, {kept:,} kept")
+    print(f"  wasted tokens: {wasted:,} (reported by sections: {reported_waste:,}, bound {results['wasted_bound']:,}) "
+          f"{'OK' if wasted <= results['wasted_bound'] and wasted == reported_waste else 'FAILED'}")
+    print(f"  without retries: {len(failed_sections)} of {len(parts)} sections failed; resume made {resume_requests} requests "
+          f"{'OK' if resume_requests == len(failed_sections) and all(parts) else 'FAILED'}")
+    return results
+
+
+# Benchmark several users generating at once against an API that enforces a requests/min limit,
+# without the shared scheduler (everyone retries 429s) and with it (calls are paced and interleaved)
+def benchmark_rate_limit(users, rpm_limit, latency, document_type="Business Plan"):
+    inputs = dict(SAMPLE_INPUTS, document_type=document_type)
+    retry_settings = llm_retry.RETRY_MAX_ATTEMPTS
+    llm_retry.RETRY_MAX_ATTEMPTS = 50
+    results = {}
+    try:
+        for label, limiter_rpm in (("no scheduler", 0), ("scheduler", rpm_limit)):
+            server, api_base = start_fake_server(latency=latency, retry_after=1, rpm_limit=rpm_limit)
+            use_fake_api(api_base)
+            limiter = RateLimiter(requests_per_minute=limiter_rpm, tokens_per_minute=0)
+            set_rate_limiter(limiter)
+            finished = {}
+            start = time.perf_counter()
+
+            def run_user(user):
+                with rate_limit_session(f"user-{user}"):
+                    generate_document(inputs, bypass_cache=True)
+                finished[user] = time.perf_counter() - start
+
+            threads = [threading.Thread(target=run_user, args=(user,)) for user in range(users)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.2)  # Users arrive one after another
+            for thread in threads:
+                thread.join()
+            server.shutdown()
+
+            results[label] = {
+                "seconds": time.perf_counter() - start,
+                "requests": server.counters["requests"],
+                "rate_limited": server.counters["rate_limited"],
+                "user_seconds": [finished[user] for user in range(users)],
+                "max_queue_depth": limiter.stats()["max_queue_depth"],
+            }
+    finally:
+        llm_retry.RETRY_MAX_ATTEMPTS = retry_settings
+        set_rate_limiter(None)
+
+    print(f"{users} users generating a {document_type} at once, API limit {rpm_limit} requests/min")
+    for label, result in results.items():
+        user_times = ", ".join(f"{seconds:.1f}" for seconds in result["user_seconds"])
+        print(f"  {label:<13} {result['seconds']:6.1f}s  {result['requests']:4} requests  {result['rate_limited']:4} x 429  "
+              f"peak queue {result['max_queue_depth']:3}  per-user finish: {user_times}")
+    return results
+
+
+# Report prompt and completion-limit tokens per document type, before and after the prompt builder
+def benchmark_prompts(document_length):
+    rows = savings_report(dict(SAMPLE_INPUTS, document_length=document_length), DOCUMENT_SECTIONS)
+    print(f"Prompt tokens and max completion tokens per document ({document_length}), legacy -> current")
+    for row in rows:
+        print(f"  {row['document_type']:<18} prompt {row['legacy_prompt_tokens']:6,} -> {row['prompt_tokens']:6,}  "
+              f"max completion {row['legacy_max_completion_tokens']:6,} -> {row['max_completion_tokens']:6,}  "
+              f"worst-case cost ${row['legacy_cost']:.2f} -> ${row['cost']:.2f} (saves ${row['cost_saved']:.2f})")
+    return rows
+
+
+# Function to build a long document of filler paragraphs, about words_per_page words per page
+def synthetic_document(pages, words_per_page=500, pages_per_section=5, seed=0):
+    rng = np.random.default_rng(seed)
+    paragraphs = []
+    for page in range(pages):
+        if page % pages_per_section == 0:
+            paragraphs.append(f"# Section {page // pages_per_section + 1}")
+        for _ in range(5):
+            words = rng.choice(FILLER_WORDS, words_per_page // 5)
+            paragraphs.append(" ".join(words).capitalize() + ".")
+    return "\n\n".join(paragraphs)
+
+
+# Benchmark end-to-end generation of each document type: sections, charts, then DOCX and PDF export
+def benchmark_documents(latency, completion_tokens, max_concurrency):
+    server, api_base = start_fake_server(latency=latency, completion_tokens=completion_tokens)
+    use_fake_api(api_base)
+    results = {}
+    try:
+        for document_type in DOCUMENT_SECTIONS:
+            inputs = dict(SAMPLE_INPUTS, document_type=document_type)
+            chart_renderer.clear_chart_cache()
+            start = time.perf_counter()
+            document_parts, charts_to_generate, _ = generate_document(inputs, max_concurrency=max_concurrency, bypass_cache=True)
+            generated = time.perf_counter()
+            chart_renderer.render_charts(charts_to_generate)
+            charted = time.perf_counter()
+            document = build_document(document_type, DOCUMENT_SECTIONS[document_type], document_parts)
+            for export_format in EXPORTERS:
+                EXPORTERS[export_format](document).close()
+            exported = time.perf_counter()
+            results[document_type] = {
+                "sections": len(document_parts),
+                "charts": len(charts_to_generate),
+                "generation_seconds": generated - start,
+                "chart_seconds": charted - generated,
+                "export_seconds": exported - charted,
+                "total_seconds": exported - start,
+            }
+    finally:
+        server.shutdown()
+
+    print(f"End-to-end documents ({latency:.2f}s per call, {completion_tokens} tokens per section, concurrency={max_concurrency})")
+    for document_type, result in results.items():
+        print(f"  {document_type:<18} total {result['total_seconds']:6.2f}s  generation {result['generation_seconds']:5.2f}s  "
+              f"charts {result['chart_seconds']:5.2f}s  export {result['export_seconds']:5.2f}s")
+    return results
+
+
+# Benchmark DOCX and PDF export of a large document: time, output size and peak traced memory of a
+# full export, then the time to export it again after editing one section
+def benchmark_export(pages, document_type="Business Plan"):
+    charts_to_generate = collect_charts(document_type, DOCUMENT_SECTIONS[document_type])
+    document = document_from_text(synthetic_document(pages), charts_to_generate)
+    chart_renderer.render_charts(charts_to_generate)  # Measure the export, not the chart rendering
+    edited = list(document)
+    edited[len(edited) // 2] = update_section(edited[len(edited) // 2], edited[len(edited) // 2]["text"] + "\n\nOne more sentence.")
+
+    results = {}
+    for export_format, exporter in EXPORTERS.items():
+        clear_export_caches()
+        start = time.perf_counter()
+        with exporter(document) as output:
+            elapsed = time.perf_counter() - start
+            size = output.seek(0, os.SEEK_END)
+        start = time.perf_counter()
+        exporter(edited).close()
+        edit = time.perf_counter() - start
+        # Memory is measured in a second run: tracemalloc slows pure-Python code (e.g. PNG decoding) a lot
+        clear_export_caches()
+        tracemalloc.start()
+        exporter(document).close()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[export_format] = {"seconds": elapsed, "edit_seconds": edit, "bytes": size, "peak_bytes": peak}
+
+    words = sum(len(section["text"].split()) for section in document)
+    print(f"Export ({pages} pages, {len(document)} sections, {words:,} words, {len(charts_to_generate)} charts)")
+    for export_format, result in results.items():
+        print(f"  {export_format:<5} {result['seconds']:6.2f}s  after editing one section {result['edit_seconds']:6.2f}s  "
+              f"{result['bytes'] / 2**20:6.2f} MiB output  peak memory {result['peak_bytes'] / 2**20:6.1f} MiB")
+    return results
+
+
+# Benchmark the document store: documents of `pages` pages, each edited `edits` times (one paragraph
+# of one section per edit). Reports stored bytes against keeping every version in full, and the time
+# to save a version, open the latest and the first version cold and warm, and search.
+def benchmark_document_store(documents, pages, edits, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "documents.sqlite3")
+        store = DocumentStore(path)
+        document_ids, full_copies, save_times = [], 0, []
+        for number in range(documents):
+            document = document_from_text(synthetic_document(pages, seed=seed + number))
+            document_id = store.create("benchmark", document, "Business Plan", {"number": number}, f"Business Plan {number}")
+            document_ids.append(document_id)
+            full_copies += sum(len(section["text"].encode("utf-8")) for section in document)
+            for edit in range(edits):
+                index = int(rng.integers(len(document)))
+                paragraphs = document[index]["text"].split("\n\n")
+                paragraphs[int(rng.integers(len(paragraphs)))] += f" Edit {edit} of document {number}."
+                document = list(document)
+                document[index] = update_section(document[index], "\n\n".join(paragraphs))
+                start = time.perf_counter()
+                store.save_version("benchmark", document_id, document)
+                save_times.append(time.perf_counter() - start)
+                full_copies += sum(len(section["text"].encode("utf-8")) for section in document)
+        final_document = document
+        stats = store.stats()
+
+        timings = {}
+        for label, version in (("latest", None), ("first", 1)):
+            cold_store = DocumentStore(path)
+            start = time.perf_counter()
+            loaded = cold_store.load("benchmark", document_ids[-1], version)
+            timings[f"open_{label}_cold"] = time.perf_counter() - start
+            start = time.perf_counter()
+            cold_store.load("benchmark", document_ids[-1], version)
+            timings[f"open_{label}_warm"] = time.perf_counter() - start
+            if version is None:
+                matches = loaded == final_document
+        start = time.perf_counter()
+        hits = store.search("benchmark", f"Edit 0 of document {documents - 1}")
+        timings["search"] = time.perf_counter() - start
+        start = time.perf_counter()
+        store.list_recent("benchmark")
+        timings["list"] = time.perf_counter() - start
+        file_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    results = {
+        "full_copy_bytes": full_copies,
+        "stored_bytes": stats["stored_bytes"],
+        "file_bytes": file_bytes,
+        "delta_sections": stats["delta_sections"],
+        "save_version_seconds": sum(save_times) / len(save_times) if save_times else 0.0,
+        **timings,
+    }
+    print(f"Document store ({documents} documents of {pages} pages, {edits} edits each = {stats['versions']} versions)")
+    print(f"  every version in full: {full_copies / 2**20:8.2f} MiB")
+    print(f"  stored sections:       {stats['stored_bytes'] / 2**20:8.2f} MiB ({stats['sections']} sections, {stats['delta_sections']} as deltas); "
+          f"database incl. search index {file_bytes / 2**20:.2f} MiB")
+    print(f"  save version: {results['save_version_seconds'] * 1000:.1f} ms   "
+          f"open latest: {timings['open_latest_cold'] * 1000:.1f} ms cold / {timings['open_latest_warm'] * 1000:.2f} ms warm   "
+          f"open first: {timings['open_first_cold'] * 1000:.1f} ms cold")
+    print(f"  search: {timings['search'] * 1000:.1f} ms ({len(hits)} hits)   list: {timings['list'] * 1000:.2f} ms   "
+          f"latest version round-trips: {matches}")
+    return results
+
+
+# Benchmark the headless batch entry point: the same CSV of documents with different numbers of worker
+# processes, each run as its own batch_generate.py process against the fake API with throwaway stores
+def benchmark_batch(documents, workers_levels, latency, completion_tokens, max_concurrency):
+    server, api_base = start_fake_server(latency=latency, completion_tokens=completion_tokens)
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "batch.csv")
+    with open(source, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(SAMPLE_INPUTS))
+        writer.writeheader()
+        for number in range(documents):
+            writer.writerow(dict(SAMPLE_INPUTS, document_type=["Business Plan", "Feasibility Study"][number % 2],
+                                 business_overview=f"{SAMPLE_INPUTS['business_overview']} Variant {number}."))
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_generate.py")
+    results = {}
+    try:
+        for workers in workers_levels:
+            run_directory = tempfile.mkdtemp(dir=directory)
+            env = dict(os.environ, OPENAI_API_BASE=api_base, OPENAI_API_KEY="fake-key",
+                       LLM_CACHE_PATH=os.path.join(run_directory, "cache.sqlite3"),
+                       PROMPT_USAGE_STATS_PATH=os.path.join(run_directory, "usage.sqlite3"))
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, source, "--output-dir", os.path.join(run_directory, "out"),
+                            "--workers", str(workers), "--concurrency", str(max_concurrency)],
+                           env=env, cwd=run_directory, check=True, capture_output=True)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(run_directory, "out", "batch_manifest.jsonl")) as file:
+                records = [json.loads(line) for line in file]
+            done = sum(record["status"] == "done" for record in records)
+            results[f"workers_{workers}"] = {"seconds": elapsed, "done": done, "documents_per_hour": done / elapsed * 3600}
+    finally:
+        server.shutdown()
+
+    print(f"Batch generation ({documents} documents, {latency:.2f}s per call, {max_concurrency} concurrent sections each)")
+    for name, result in results.items():
+        print(f"  {name:<10} {result['seconds']:6.1f}s  {result['done']} done  {result['documents_per_hour']:8.0f} documents/hour")
+    return results
+
+
+# Benchmark ratio computations: one vectorized pass over many entities, and the chunked bulk analysis of a CSV
+def benchmark_ratios(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    portfolio = pd.DataFrame({
+        "Revenue": rng.uniform(1e5, 1e7, rows),
+        "Expenses": rng.uniform(1e5, 1e7, rows),
+        "Assets": rng.uniform(1e6, 1e8, rows),
+        "Liabilities": rng.uniform(0, 5e7, rows),
+        "Equity": rng.uniform(-1e6, 5e7, rows),
+    })
+
+    start = time.perf_counter()
+    compute_ratios({**{name: portfolio[name].to_numpy() for name in portfolio.columns},
+                    "Profit": (portfolio["Revenue"] - portfolio["Expenses"]).to_numpy()})
+    vectorized = time.perf_counter() - start
+
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "portfolio.csv")
+    portfolio.to_csv(source, index=False)
+    start = time.perf_counter()
+    bulk_ratios.analyze_portfolio(source, "portfolio.csv", os.path.join(directory, "ratios.csv"))
+    bulk = time.perf_counter() - start
+
+    print(f"Financial ratios ({rows:,} entities)")
+    print(f"  vectorized compute_ratios: {vectorized * 1000:8.1f} ms  {rows / vectorized:,.0f} rows/sec")
+    print(f"  bulk CSV analysis:         {bulk * 1000:8.1f} ms  {rows / bulk:,.0f} rows/sec")
+    return {"vectorized_seconds": vectorized, "bulk_seconds": bulk, "bulk_rows_per_second": rows / bulk}
+
+
+# The module each page of app2.py imports on first use
+PAGE_MODULES = {"home": "home_page", "financial_model": "financial_modeling", "meeting_note_taker": "meeting_note_taker"}
+# Dependencies that should only be loaded by the pages that use them (recent Streamlit versions import plotly themselves)
+HEAVY_MODULES = ["openai", "matplotlib", "docx", "fpdf", "pandas", "plotly", "pyarrow"]
+
+# Run in a fresh interpreter: time importing a page's module once streamlit itself is loaded
+IMPORT_PROBE = """
+import importlib, json, sys, time
+import streamlit
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(json.dumps({"import_seconds": time.perf_counter() - start}))
+"""
+
+# Run in a fresh interpreter: check the installed Streamlit can render the app headless
+APP_TEST_PROBE = """
+import json
+import streamlit
+version = tuple(int(part) for part in streamlit.__version__.split(".")[:2])
+print(json.dumps({"app_test": version >= (1, 36)}))
+"""
+
+# Run in a fresh interpreter: render app2.py on one page, then rerun it with everything imported
+RENDER_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.session_state["page"] = sys.argv[2]
+start = time.perf_counter()
+app.run()
+first_render = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+print(json.dumps({
+    "first_render_seconds": first_render,
+    "rerun_seconds": rerun,
+    "heavy_modules": [name for name in json.loads(sys.argv[3]) if name in sys.modules],
+    "errors": [str(error.value) for error in app.exception],
+}))
+"""
+
+
+def run_probe(script, *args):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-c", script, *args], capture_output=True, text=True, check=True, cwd=directory)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# Benchmark cold start per page, each in a fresh interpreter: import time of the page's module and the
+# first render of app2.py on that page (which includes its imports), plus the heavy dependencies it loaded.
+# Rendering uses streamlit.testing.v1.AppTest, as in the pinned Streamlit (1.36). Older versions either
+# lack it (before 1.28) or fail on radio buttons with a format_func; then only imports are timed.
+def benchmark_startup(repeat=3):
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app2.py")
+    can_render = run_probe(APP_TEST_PROBE)["app_test"]
+    results = {}
+    for page, module in PAGE_MODULES.items():
+        imports = [run_probe(IMPORT_PROBE, module)["import_seconds"] for _ in range(repeat)]
+        if not can_render:
+            results[page] = {"import_seconds": min(imports)}
+            continue
+        renders = [run_probe(RENDER_PROBE, app_path, page, json.dumps(HEAVY_MODULES)) for _ in range(repeat)]
+        results[page] = {
+            "import_seconds": min(imports),
+            "first_render_seconds": min(render["first_render_seconds"] for render in renders),
+            "rerun_seconds": min(render["rerun_seconds"] for render in renders),
+            "heavy_modules": renders[0]["heavy_modules"],
+            "errors": renders[0]["errors"],
+        }
+
+    print(f"Cold start per page (best of {repeat} fresh processes)")
+    if not can_render:
+        print(f"  first render not measured: needs the Streamlit in requirements.txt (1.36) for AppTest")
+        for page, result in results.items():
+            print(f"  {page:<19} import {result['import_seconds']:5.2f}s")
+        return results
+    for page, result in results.items():
+        print(f"  {page:<19} import {result['import_seconds']:5.2f}s  first render {result['first_render_seconds']:5.2f}s  "
+              f"rerun {result['rerun_seconds']:5.2f}s  loads: {', '.join(result['heavy_modules']) or '-'}")
+        for error in result["errors"]:
+            print(f"    error: {error}")
+    return results
+
+
+# Function to describe the machine and code a suite run was measured on
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {name: value for name, value in vars(args).items() if name != "benchmark"},
+    }
+
+
+# Function to flatten nested results into {"a.b.c": number}
+def flatten_results(results, prefix=""):
+    flat = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+# Print every timing that changed by more than threshold against a baseline run;
+# timings under min_seconds in both runs are too noisy to compare
+def compare_results(results, baseline, threshold=0.1, min_seconds=0.005):
+    current = flatten_results(results)
+    previous = flatten_results(baseline)
+    print(f"Compared with {baseline.get('meta', {}).get('timestamp', 'baseline')} ({baseline.get('meta', {}).get('commit') or 'unknown commit'})")
+    regressions = 0
+    for path in sorted(current):
+        if not path.endswith("seconds") or not previous.get(path) or max(current[path], previous[path]) < min_seconds:
+            continue
+        change = current[path] / previous[path] - 1
+        if abs(change) >= threshold:
+            regressions += change > 0
+            print(f"  {'SLOWER' if change > 0 else 'faster'} {path}: {previous[path]:.4f}s -> {current[path]:.4f}s ({change:+.0%})")
+    print(f"  {regressions} timings slower by {threshold:.0%} or more")
+    return regressions
+
+
+# Function to run the full suite headless and write its results as JSON
+def run_suite(args):
+    results = {
+        "documents": benchmark_documents(args.latency, args.completion_tokens, args.concurrency),
+        "streaming": benchmark_streaming(args.latency, 0.001, args.concurrency),
+        "charts": benchmark_charts(repeat=3),
+        "interactive_charts": benchmark_interactive_charts([1_000, 100_000], repeat=1),
+        "export": benchmark_export(args.pages),
+        "document_store": benchmark_document_store(10, 30, 10, args.seed),
+        "summarization": benchmark_summarization(args.turns, args.latency, args.concurrency),
+        "transcription": benchmark_transcription(args.minutes, [1, args.concurrency], 0.01),
+        "preprocessing": benchmark_preprocessing(args.minutes, 0.01, args.seed),
+        "ratios": benchmark_ratios(args.rows, args.seed),
+        "monte_carlo": benchmark_monte_carlo(args.paths, 5, args.seed),
+        "startup": benchmark_startup(repeat=1),
+    }
+    report = {"meta": run_metadata(args), "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, default=float)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        compare_results(report["results"], baseline.get("results", {}) | {"meta": baseline.get("meta", {})})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the document generator against a fake OpenAI server.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    generation = subparsers.add_parser("generation", help="Sequential vs concurrent section generation")
+    generation.add_argument("--latency", type=float, default=0.5, help="Fake API latency per call in seconds")
+    generation.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    generation.add_argument("--document-type", default="Business Plan")
+
+    streaming = subparsers.add_parser("streaming", help="Time-to-first-token and tokens/sec with stream=True")
+    streaming.add_argument("--latency", type=float, default=0.5, help="Fake API latency before the first token")
+    streaming.add_argument("--token-latency", type=float, default=0.01, help="Fake API delay between tokens")
+    streaming.add_argument("--concurrency", type=int, default=4)
+    streaming.add_argument("--document-type", default="Business Plan")
+
+    charts = subparsers.add_parser("charts", help="Serial vs process-pool chart rendering")
+    charts.add_argument("--repeat", type=int, default=3)
+
+    plots = subparsers.add_parser("interactive-charts", help="Plotly payload and build time by series length, full vs downsampled")
+    plots.add_argument("--lengths", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    plots.add_argument("--method", default=interactive_charts.CHART_DOWNSAMPLE_METHOD, choices=interactive_charts.DOWNSAMPLE_METHODS)
+    plots.add_argument("--repeat", type=int, default=3)
+
+    simulation = subparsers.add_parser("monte-carlo", help="Monte Carlo throughput and peak memory")
+    simulation.add_argument("--paths", type=int, default=1_000_000)
+    simulation.add_argument("--periods", type=int, default=5)
+    simulation.add_argument("--seed", type=int, default=0)
+
+    asr = subparsers.add_parser("transcription", help="Chunked concurrent transcription with the fake ASR endpoint")
+    asr.add_argument("--minutes", type=int, default=30)
+    asr.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    asr.add_argument("--asr-realtime-factor", type=float, default=0.01, help="Fake ASR seconds per second of audio")
+
+    preprocess = subparsers.add_parser("preprocess", help="Audio preprocessing savings, alignment and transcription time")
+    preprocess.add_argument("--minutes", type=int, default=30)
+    preprocess.add_argument("--asr-realtime-factor", type=float, default=0.01, help="Fake ASR seconds per second of audio")
+    preprocess.add_argument("--seed", type=int, default=0)
+
+    live = subparsers.add_parser("live", help="Live transcription: notes-ready time after the meeting and memory by meeting length")
+    live.add_argument("--minutes", type=int, nargs="+", default=[10, 30])
+    live.add_argument("--speed", type=float, default=30, help="Replay speed (1 = real time)")
+    live.add_argument("--latency", type=float, default=0.2)
+    live.add_argument("--asr-realtime-factor", type=float, default=0.01, help="Fake ASR seconds per second of audio")
+
+    summary = subparsers.add_parser("summarization", help="Map-reduce summarization of a long transcript")
+    summary.add_argument("--turns", type=int, default=2000, help="Speaker turns in the synthetic transcript")
+    summary.add_argument("--latency", type=float, default=0.5)
+    summary.add_argument("--concurrency", type=int, default=8)
+
+    faults = subparsers.add_parser("faults", help="Retries, wasted tokens and resume against a fault-injecting API")
+    faults.add_argument("--failure-rate", type=float, default=0.3)
+    faults.add_argument("--seed", type=int, default=0)
+    faults.add_argument("--document-type", default="Business Plan")
+
+    limits = subparsers.add_parser("rate-limit", help="Concurrent users against a requests/min limited API")
+    limits.add_argument("--users", type=int, default=8)
+    limits.add_argument("--rpm-limit", type=int, default=120)
+    limits.add_argument("--latency", type=float, default=0.2)
+    limits.add_argument("--document-type", default="Business Plan")
+
+    prompts = subparsers.add_parser("prompts", help="Tokens and estimated cost saved by the prompt builder")
+    prompts.add_argument("--document-length", default="Long", choices=["Short", "Long"])
+
+    store = subparsers.add_parser("document-store", help="Stored size, version save/open and search times of the document store")
+    store.add_argument("--documents", type=int, default=20)
+    store.add_argument("--pages", type=int, default=30)
+    store.add_argument("--edits", type=int, default=25)
+
+    batch = subparsers.add_parser("batch", help="Documents/hour of the headless batch entry point by worker count")
+    batch.add_argument("--documents", type=int, default=16)
+    batch.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    batch.add_argument("--latency", type=float, default=0.2)
+    batch.add_argument("--completion-tokens", type=int, default=200)
+    batch.add_argument("--concurrency", type=int, default=4)
+
+    startup = subparsers.add_parser("startup", help="Import time and first render per page, each in a fresh process")
+    startup.add_argument("--repeat", type=int, default=3)
+
+    suite = subparsers.add_parser("suite", help="Run every benchmark headless and write the results as JSON")
+    suite.add_argument("--output", default="benchmark_results.json")
+    suite.add_argument("--compare", help="A previous results file to compare timings against")
+    suite.add_argument("--latency", type=float, default=0.2, help="Fake API latency per call in seconds")
+    suite.add_argument("--completion-tokens", type=int, default=200, help="Tokens the fake API returns per completion")
+    suite.add_argument("--concurrency", type=int, default=4)
+    suite.add_argument("--pages", type=int, default=120, help="Pages in the large export document")
+    suite.add_argument("--turns", type=int, default=1000, help="Speaker turns in the summarized transcript")
+    suite.add_argument("--minutes", type=int, default=10, help="Minutes of audio to transcribe")
+    suite.add_argument("--rows", type=int, default=200_000, help="Entities in the ratio benchmark")
+    suite.add_argument("--paths", type=int, default=200_000, help="Monte Carlo paths")
+    suite.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.benchmark == "generation":
+        benchmark_generation(args.concurrency, args.latency, args.document_type)
+    elif args.benchmark == "streaming":
+        benchmark_streaming(args.latency, args.token_latency, args.concurrency, args.document_type)
+    elif args.benchmark == "charts":
+        benchmark_charts(args.repeat)
+    elif args.benchmark == "interactive-charts":
+        benchmark_interactive_charts(args.lengths, args.method, args.repeat)
+    elif args.benchmark == "monte-carlo":
+        benchmark_monte_carlo(args.paths, args.periods, args.seed)
+    elif args.benchmark == "transcription":
+        benchmark_transcription(args.minutes, args.concurrency, args.asr_realtime_factor)
+    elif args.benchmark == "preprocess":
+        benchmark_preprocessing(args.minutes, args.asr_realtime_factor, args.seed)
+    elif args.benchmark == "live":
+        benchmark_live(args.minutes, args.speed, args.latency, args.asr_realtime_factor)
+    elif args.benchmark == "summarization":
+        benchmark_summarization(args.turns, args.latency, args.concurrency)
+    elif args.benchmark == "faults":
+        benchmark_faults(args.failure_rate, args.seed, args.document_type)
+    elif args.benchmark == "rate-limit":
+        benchmark_rate_limit(args.users, args.rpm_limit, args.latency, args.document_type)
+    elif args.benchmark == "prompts":
+        benchmark_prompts(args.document_length)
+    elif args.benchmark == "document-store":
+        benchmark_document_store(args.documents, args.pages, args.edits)
+    elif args.benchmark == "batch":
+        benchmark_batch(args.documents, args.workers, args.latency, args.completion_tokens, args.concurrency)
+    elif args.benchmark == "startup":
+        benchmark_startup(args.repeat)
+    elif args.benchmark == "suite":
+        run_suite(args)
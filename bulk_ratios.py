@@ -0,0 +1,203 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from financial_engine import compute_ratios
+
+# Bulk ratio analysis over portfolios of entities read from CSV or Parquet.
+# Input is processed chunk by chunk: each chunk's ratios are appended to the output file and
+# only the current top rows for the table are kept, so memory doesn't grow with the input.
+DEFAULT_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "100000"))
+DEFAULT_TOP_ROWS = 1000
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+INPUT_COLUMNS = ["Revenue", "Expenses", "Assets", "Liabilities", "Equity"]
+RATIO_COLUMNS = [
+    "Current Ratio",
+    "Debt-to-Equity Ratio",
+    "Profit Margin",
+    "Return on Assets (ROA)",
+    "Return on Equity (ROE)",
+    "Gross Profit Margin",
+    "Operating Margin",
+    "Net Profit Margin",
+    "Financial Leverage",
+    "Asset Turnover",
+    "Equity Multiplier",
+]
+NUMERIC_COLUMNS = set(INPUT_COLUMNS + ["Profit"] + RATIO_COLUMNS)
+
+# Directory the page may read portfolio files from on the server; unset, only uploads are accepted
+PORTFOLIO_DATA_DIR = os.getenv("PORTFOLIO_DATA_DIR", "")
+PORTFOLIO_EXTENSIONS = (".csv", ".parquet")
+
+# Results files live in one directory per process, removed at exit; files older than this are removed
+# whenever a new one is made, so sessions that never come back don't fill the disk
+BULK_RESULTS_MAX_AGE_SECONDS = int(os.getenv("BULK_RESULTS_MAX_AGE_SECONDS", "3600"))
+_results_dir = None
+_results_dir_lock = threading.Lock()
+
+
+# Function to read a portfolio file in chunks of DataFrames.
+# source is a path or a binary file-like object (e.g. a Streamlit UploadedFile).
+def read_portfolio_chunks(source, file_name, chunk_size=DEFAULT_CHUNK_ROWS):
+    if file_name.lower().endswith(".parquet"):
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+# Function to list the portfolio files in PORTFOLIO_DATA_DIR (file names only, no subdirectories)
+def list_server_portfolios():
+    if not PORTFOLIO_DATA_DIR or not os.path.isdir(PORTFOLIO_DATA_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(PORTFOLIO_DATA_DIR)
+        if name.lower().endswith(PORTFOLIO_EXTENSIONS) and os.path.isfile(os.path.join(PORTFOLIO_DATA_DIR, name))
+    )
+
+
+# Function to get the path of a portfolio file in PORTFOLIO_DATA_DIR; only names list_server_portfolios()
+# returns are accepted, so nothing outside the directory can be read
+def server_portfolio_path(name):
+    if name not in list_server_portfolios():
+        raise ValueError(f"No portfolio file named {name!r} on the server")
+    return os.path.join(PORTFOLIO_DATA_DIR, name)
+
+
+# Function to get the directory results files are written to, created on first use and removed at exit
+def results_directory():
+    global _results_dir
+    with _results_dir_lock:
+        if _results_dir is None:
+            _results_dir = tempfile.mkdtemp(prefix="portfolio-results-")
+            atexit.register(shutil.rmtree, _results_dir, True)
+        return _results_dir
+
+
+# Function to get the path for a new results file. Stale files are removed, and so is the file the
+# new one replaces (a session's previous results), if given.
+def new_results_path(output_format, replaces=None):
+    directory = results_directory()
+    cutoff = time.time() - BULK_RESULTS_MAX_AGE_SECONDS
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if path == replaces or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # Already removed by another session
+    return os.path.join(directory, f"{uuid.uuid4().hex}.{output_format}")
+
+
+# Match the financial columns case-insensitively and derive Profit when it isn't supplied
+def normalize_columns(chunk):
+    lookup = {str(column).strip().lower(): column for column in chunk.columns}
+    renames = {}
+    for name in INPUT_COLUMNS + ["Profit"]:
+        column = lookup.get(name.lower())
+        if column is not None:
+            renames[column] = name
+    missing = [name for name in INPUT_COLUMNS if name not in renames.values()]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    chunk = chunk.rename(columns=renames)
+    for name in INPUT_COLUMNS:
+        chunk[name] = pd.to_numeric(chunk[name], errors="coerce").fillna(0.0)
+    if "Profit" in chunk.columns:
+        chunk["Profit"] = pd.to_numeric(chunk["Profit"], errors="coerce").fillna(chunk["Revenue"] - chunk["Expenses"])
+    else:
+        chunk["Profit"] = chunk["Revenue"] - chunk["Expenses"]
+    return chunk
+
+
+# Function to add every ratio column to a chunk with one vectorized pass
+def compute_portfolio_ratios(chunk):
+    chunk = normalize_columns(chunk)
+    ratios = compute_ratios({name: chunk[name].to_numpy() for name in INPUT_COLUMNS + ["Profit"]})
+    for name in RATIO_COLUMNS:
+        chunk[name] = ratios[name]
+    return chunk
+
+
+# Streaming writer for the results file; pyarrow's writers are much faster than DataFrame.to_csv.
+# The file's schema is declared up front rather than inferred from the first chunk: the financial and
+# ratio columns are floats and every other column is written as text, so a column that happens to be
+# empty (all NaN) in the first chunk doesn't fix its type for the rest of the file.
+class ResultsWriter:
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self.schema = None
+        self.writer = None
+
+    def write(self, chunk):
+        text_columns = [column for column in chunk.columns if column not in NUMERIC_COLUMNS]
+        chunk = chunk.assign(**{column: chunk[column].map(str, na_action="ignore") for column in text_columns})
+        if self.writer is None:
+            self.schema = pa.schema([
+                pa.field(column, pa.string() if column in text_columns else pa.float64()) for column in chunk.columns
+            ])
+            if self.output_format == "parquet":
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = pa_csv.CSVWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Function to run the bulk analysis.
+# Every processed row that passes the filter is appended to output_path (CSV or Parquet);
+# the returned table holds only the top_n rows by sort_by. on_chunk(rows_processed) reports progress.
+# Returns (top_rows, summary).
+def analyze_portfolio(source, file_name, output_path, output_format="csv", sort_by="Return on Equity (ROE)", ascending=False,
+                      top_n=DEFAULT_TOP_ROWS, filter_column=None, filter_min=None, filter_max=None,
+                      chunk_size=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    top_rows = None
+    rows_processed = 0
+    rows_matched = 0
+
+    with ResultsWriter(output_path, output_format) as writer:
+        for chunk in read_portfolio_chunks(source, file_name, chunk_size):
+            chunk = compute_portfolio_ratios(chunk)
+            rows_processed += len(chunk)
+
+            if filter_column:
+                if filter_min is not None:
+                    chunk = chunk[chunk[filter_column] >= filter_min]
+                if filter_max is not None:
+                    chunk = chunk[chunk[filter_column] <= filter_max]
+            rows_matched += len(chunk)
+            writer.write(chunk)
+
+            candidates = chunk if top_rows is None else pd.concat([top_rows, chunk], ignore_index=True)
+            if ascending:
+                top_rows = candidates.nsmallest(top_n, sort_by)
+            else:
+                top_rows = candidates.nlargest(top_n, sort_by)
+
+            if on_chunk:
+                on_chunk(rows_processed)
+
+    summary = {"rows_processed": rows_processed, "rows_matched": rows_matched}
+    return top_rows if top_rows is not None else pd.DataFrame(), summary
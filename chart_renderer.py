@@ -0,0 +1,291 @@
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from metrics import increment, timed
+
+# Charts are drawn on standalone Agg figures (no pyplot global state), so they are safe
+# to render from any thread, and the PNG bytes are cached process-wide.
+DEFAULT_SIZE = (6.4, 4.8)
+DEFAULT_DPI = 100
+CHART_CACHE_MAX_ENTRIES = int(os.getenv("CHART_CACHE_MAX_ENTRIES", "64"))
+# Cache misses are rendered in parallel in a warm process pool; CHART_POOL_WORKERS<=1 renders in-process
+CHART_POOL_WORKERS = int(os.getenv("CHART_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Data plotted for each chart type
+CHART_DATA = {
+    "Market Share Over Time": {
+        "years": ["Year 1", "Year 2", "Year 3", "Year 4", "Year 5"],
+        "market_share": [10, 20, 30, 45, 60],
+    },
+    "Competitive Analysis": {
+        "categories": ['Product Quality', 'Market Share', 'Innovation', 'Customer Service', 'Price'],
+        "competitors": {
+            "Competitor 1": [8, 7, 9, 6, 5],
+            "Competitor 2": [6, 8, 7, 9, 6],
+            "Competitor 3": [7, 6, 8, 7, 8],
+        },
+    },
+    "Milestone Timeline": {
+        "milestones": ['Setup', 'R&D', 'Launch', 'Market Expansion', 'Consolidation'],
+        "timeline": [2, 6, 12, 24, 36],  # months
+    },
+    "Revenue vs Expenses": {
+        "years": ["Year 1", "Year 2", "Year 3", "Year 4", "Year 5"],
+        "revenue": [200, 400, 600, 800, 1000],
+        "expenses": [150, 300, 500, 700, 850],
+    },
+    "Cash Flow Forecast": {
+        "months": [f'Month {i}' for i in range(1, 13)],
+        "cash_inflow": [1000, 1500, 1800, 2000, 2200, 2500, 2700, 2900, 3000, 3200, 3400, 3500],
+        "cash_outflow": [800, 900, 1000, 1200, 1300, 1400, 1500, 1600, 1700, 1800, 1900, 2000],
+    },
+    "Organizational Structure": {
+        "positions": ["CEO", "CTO", "CFO", "COO", "CMO"],
+        "levels": [1, 2, 2, 3, 3],
+    },
+    "Product Development Roadmap": {
+        "stages": ['Concept', 'Development', 'Testing', 'Launch', 'Post-Launch'],
+        "months_to_complete": [2, 5, 3, 2, 6],
+    },
+}
+
+
+def draw_market_share(fig, data):
+    ax = fig.add_subplot(111)
+    ax.plot(data["years"], data["market_share"], marker='o')
+    ax.set_xlabel('Years')
+    ax.set_ylabel('Market Share (%)')
+
+
+def draw_competitive_analysis(fig, data):
+    categories = data["categories"]
+    N = len(categories)
+    angles = [n / float(N) * 2 * 3.14159 for n in range(N)]
+    angles += angles[:1]
+    ax = fig.add_subplot(111, polar=True)
+    ax.set_xticks(angles[:-1])
+    ax.set_xticklabels(categories)
+    ax.set_rlabel_position(0)
+    ax.set_yticks([2, 4, 6, 8, 10])
+    ax.set_yticklabels(["2", "4", "6", "8", "10"], color="grey", size=7)
+    ax.set_ylim(0, 10)
+    for (label, scores), color in zip(data["competitors"].items(), ['b', 'r', 'g']):
+        ax.plot(angles, scores + scores[:1], linewidth=1, linestyle='solid', label=label)
+        ax.fill(angles, scores + scores[:1], color, alpha=0.1)
+
+
+def draw_milestone_timeline(fig, data):
+    ax = fig.add_subplot(111)
+    ax.barh(data["milestones"], data["timeline"], color='orange')
+    ax.set_xlabel('Months')
+
+
+def draw_revenue_vs_expenses(fig, data):
+    ax = fig.add_subplot(111)
+    ax.plot(data["years"], data["revenue"], label='Revenue', marker='o')
+    ax.plot(data["years"], data["expenses"], label='Expenses', marker='o', linestyle='--')
+    ax.set_xlabel('Years')
+    ax.set_ylabel('Amount (£)')
+    ax.legend()
+
+
+def draw_cash_flow_forecast(fig, data):
+    ax = fig.add_subplot(111)
+    cash_balance = [inflow - outflow for inflow, outflow in zip(data["cash_inflow"], data["cash_outflow"])]
+    ax.plot(data["months"], data["cash_inflow"], label='Cash Inflow', marker='o')
+    ax.plot(data["months"], data["cash_outflow"], label='Cash Outflow', marker='o')
+    ax.plot(data["months"], cash_balance, label='Cash Balance', marker='o', linestyle='--')
+    ax.set_xlabel('Months')
+    ax.set_ylabel('Amount (£)')
+    ax.legend()
+
+
+def draw_organizational_structure(fig, data):
+    ax = fig.add_subplot(111)
+    ax.barh(data["positions"], data["levels"], color='teal')
+    ax.set_xlabel('Management Level')
+
+
+def draw_product_roadmap(fig, data):
+    ax = fig.add_subplot(111)
+    ax.bar(data["stages"], data["months_to_complete"], color='purple')
+    ax.set_xlabel('Development Stages')
+    ax.set_ylabel('Time (Months)')
+
+
+CHART_DRAWERS = {
+    "Market Share Over Time": draw_market_share,
+    "Competitive Analysis": draw_competitive_analysis,
+    "Milestone Timeline": draw_milestone_timeline,
+    "Revenue vs Expenses": draw_revenue_vs_expenses,
+    "Cash Flow Forecast": draw_cash_flow_forecast,
+    "Organizational Structure": draw_organizational_structure,
+    "Product Development Roadmap": draw_product_roadmap,
+}
+
+
+# Function to draw a chart into PNG bytes, bypassing the cache
+@timed("chart_draw")
+def draw_chart_png(chart_type, data, size=DEFAULT_SIZE, dpi=DEFAULT_DPI):
+    fig = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(fig)
+    CHART_DRAWERS[chart_type](fig, data)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+# Key on everything that changes the rendered pixels
+def chart_cache_key(chart_type, data, size, dpi):
+    data_hash = hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+    return (chart_type, data_hash, tuple(size), dpi)
+
+
+_chart_cache = OrderedDict()
+_chart_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _chart_cache_lock:
+        png = _chart_cache.get(key)
+        if png is not None:
+            _chart_cache.move_to_end(key)
+        return png
+
+
+def _cache_put(key, png):
+    with _chart_cache_lock:
+        _chart_cache[key] = png
+        _chart_cache.move_to_end(key)
+        while len(_chart_cache) > CHART_CACHE_MAX_ENTRIES:
+            _chart_cache.popitem(last=False)
+
+
+# Function to get a chart as PNG bytes, rendering it at most once per (chart_type, data, size, dpi)
+def render_chart(chart_type, data=None, size=DEFAULT_SIZE, dpi=DEFAULT_DPI):
+    if data is None:
+        data = CHART_DATA[chart_type]
+    key = chart_cache_key(chart_type, data, size, dpi)
+    png = _cache_get(key)
+    increment("chart_cache", result="miss" if png is None else "hit")
+    if png is None:
+        png = draw_chart_png(chart_type, data, size, dpi)
+        _cache_put(key, png)
+    return png
+
+
+# Runs once in every pool worker so the first chart doesn't pay for importing matplotlib
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401  (pulls in fonts, rcParams and the font cache)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_unavailable = False
+
+
+# Function to get the shared process pool, or None when charts must be rendered in-process
+def get_chart_pool():
+    global _pool, _pool_unavailable
+    with _pool_lock:
+        if _pool is None and not _pool_unavailable and CHART_POOL_WORKERS > 1:
+            try:
+                # forkserver avoids forking the threaded Streamlit process itself
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                _pool = ProcessPoolExecutor(max_workers=CHART_POOL_WORKERS, mp_context=context, initializer=_init_worker)
+            except (OSError, ValueError, NotImplementedError):
+                _pool_unavailable = True
+        return _pool
+
+
+def _discard_pool():
+    global _pool, _pool_unavailable
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_unavailable = True
+
+
+# Function to start every pool worker ahead of the first render
+def warm_up_chart_pool():
+    pool = get_chart_pool()
+    if pool is None:
+        return False
+    try:
+        for future in [pool.submit(_init_worker) for _ in range(CHART_POOL_WORKERS)]:
+            future.result()
+    except (BrokenProcessPool, OSError):
+        _discard_pool()
+        return False
+    return True
+
+
+# Function to render several charts at once, returning PNG bytes in the same order as charts.
+# charts is a list of chart types or (chart_type, title) pairs as in charts_to_generate.
+# Cached charts are reused; the rest render in parallel, or in-process if the pool is unavailable.
+@timed("chart_batch")
+def render_charts(charts, size=DEFAULT_SIZE, dpi=DEFAULT_DPI):
+    chart_types = [chart if isinstance(chart, str) else chart[0] for chart in charts]
+    keys = [chart_cache_key(chart_type, CHART_DATA[chart_type], size, dpi) for chart_type in chart_types]
+    pngs = [_cache_get(key) for key in keys]
+
+    missing = {}
+    for index, (chart_type, key) in enumerate(zip(chart_types, keys)):
+        if pngs[index] is None:
+            missing.setdefault(key, (chart_type, []))[1].append(index)
+    increment("chart_cache", len(charts) - sum(len(indexes) for _, indexes in missing.values()), result="hit")
+    increment("chart_cache", len(missing), result="miss")
+
+    pool = get_chart_pool() if len(missing) > 1 else None
+    rendered = {}
+    if pool is not None:
+        try:
+            futures = {
+                key: pool.submit(draw_chart_png, chart_type, CHART_DATA[chart_type], size, dpi)
+                for key, (chart_type, _) in missing.items()
+            }
+            rendered = {key: future.result() for key, future in futures.items()}
+        except (BrokenProcessPool, OSError):
+            _discard_pool()
+            rendered = {}
+
+    for key, (chart_type, indexes) in missing.items():
+        png = rendered.get(key)
+        if png is None:
+            png = draw_chart_png(chart_type, CHART_DATA[chart_type], size, dpi)
+        _cache_put(key, png)
+        for index in indexes:
+            pngs[index] = png
+    return pngs
+
+
+@atexit.register
+def _shutdown_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to get a chart as a file-like object (for python-docx and st.image)
+def chart_image(chart_type, data=None, size=DEFAULT_SIZE, dpi=DEFAULT_DPI):
+    return BytesIO(render_chart(chart_type, data, size, dpi))
+
+
+def clear_chart_cache():
+    with _chart_cache_lock:
+        _chart_cache.clear()
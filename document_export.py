@@ -0,0 +1,492 @@
+import atexit
+import copy
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+from io import BytesIO, StringIO
+
+import fpdf.fpdf as fpdf_module
+import matplotlib
+
+from docx import Document
+from docx.shared import Inches
+from fpdf import FPDF
+from fpdf.php import UTF8ToUTF16BE
+from fpdf.ttfonts import TTFontFile
+
+from chart_renderer import render_chart
+from document_model import document_hash
+from metrics import increment, timed
+
+# Finished exports are memoized on the document's section hashes, so Streamlit reruns without
+# edits don't rebuild DOCX/PDF files; after an edit only the changed sections are laid out again.
+# The cached files are kept in a temp directory, not in memory.
+EXPORT_CACHE_MAX_ENTRIES = int(os.getenv("EXPORT_CACHE_MAX_ENTRIES", "16"))
+
+# Exports are built block by block (one heading or paragraph at a time), one chart at a time, and
+# written to a spooled temp file that moves to disk past EXPORT_SPOOL_MAX_BYTES. python-docx and fpdf
+# still hold the whole document model until it is saved, so peak memory grows with the document
+# (for a PDF, with its pages); the text isn't copied whole and at most one chart is drawn at a time.
+EXPORT_SPOOL_MAX_BYTES = int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+EXPORT_WRITE_CHUNK = 1024 * 1024
+# Directory with the DejaVu Sans TrueType files; defaults to the copy bundled with matplotlib
+EXPORT_FONT_DIR = os.getenv("EXPORT_FONT_DIR", "")
+UNICODE_FONT_FILES = {"": "DejaVuSans.ttf", "B": "DejaVuSans-Bold.ttf", "I": "DejaVuSans-Oblique.ttf"}
+HEADING_FONT_SIZES = {1: 16, 2: 14, 3: 13}
+HEADING_LINE = re.compile(r"^\s{0,3}(#{1,6})\s+(.+)$")
+
+# Laid-out sections, keyed on (format, section hash)
+EXPORT_FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("EXPORT_FRAGMENT_CACHE_MAX_ENTRIES", "256"))
+# Written in place of the page number in cached PDF pages; it is replaced where the footer drew it,
+# not wherever the text appears, so the same characters in a section are left alone
+PAGE_NUMBER_ALIAS = "{pn}"
+
+# Parsed TrueType metrics are kept in memory, once per process (see CustomPDF.add_unicode_fonts).
+# CustomPDF turns fpdf's own on-disk metrics cache off: batch workers writing it at the same time could
+# read each other's half-written files, and parsing the font (~7 ms) is barely slower than loading the pickle.
+_font_entries = {}
+_font_entries_lock = threading.Lock()
+
+# Embedding a Unicode font means subsetting the TrueType file in pure Python on every export
+# (~50 ms per style). The subset only depends on the characters used, so keep the last few.
+FONT_SUBSET_CACHE_MAX_ENTRIES = 16
+_subset_cache = OrderedDict()
+_subset_cache_lock = threading.Lock()
+
+
+class CachedSubsetTTFontFile(TTFontFile):
+    def makeSubset(self, file, subset):
+        key = (file, tuple(subset))
+        with _subset_cache_lock:
+            cached = _subset_cache.get(key)
+            if cached is not None:
+                _subset_cache.move_to_end(key)
+        if cached is None:
+            stream = super().makeSubset(file, subset)
+            cached = (stream, self.codeToGlyph, self.maxUni)
+            with _subset_cache_lock:
+                _subset_cache[key] = cached
+                while len(_subset_cache) > FONT_SUBSET_CACHE_MAX_ENTRIES:
+                    _subset_cache.popitem(last=False)
+        stream, self.codeToGlyph, self.maxUni = cached
+        return stream
+
+
+# Function to copy one of FPDF's methods with some of fpdf's module globals replaced, so the change
+# applies to the subclass the copy is put on, not to every FPDF in the process
+def with_fpdf_globals(method, **overrides):
+    return types.FunctionType(method.__code__, dict(vars(fpdf_module), **overrides), method.__name__,
+                              method.__defaults__, method.__closure__)
+
+# Parsed chart images for the PDF, keyed on the PNG's hash
+PNG_CACHE_MAX_ENTRIES = 32
+_png_cache = OrderedDict()
+_png_cache_lock = threading.Lock()
+
+
+_fragment_cache = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+
+# Counters per format: builds, cache hits, sections laid out / reused, and time spent in the last / all exports
+export_stats = {
+    export_format: {"builds": 0, "hits": 0, "fragments_built": 0, "fragments_reused": 0, "last_seconds": 0.0, "total_seconds": 0.0}
+    for export_format in ("docx", "pdf")
+}
+
+
+# Function to split a document into ("heading", level, text) and ("paragraph", 0, text) blocks.
+# Lines are read lazily, so only one block of the document is copied at a time.
+def iter_blocks(document):
+    paragraph = []
+    for line in StringIO(document):
+        line = line.rstrip()
+        heading = HEADING_LINE.match(line)
+        if heading or not line:
+            if paragraph:
+                yield "paragraph", 0, "\n".join(paragraph)
+                paragraph = []
+            if heading:
+                yield "heading", len(heading.group(1)), heading.group(2).strip(" *")
+        else:
+            paragraph.append(line)
+    if paragraph:
+        yield "paragraph", 0, "\n".join(paragraph)
+
+
+# Function to open the file an export is written into: kept in memory while small,
+# moved to disk past EXPORT_SPOOL_MAX_BYTES
+def new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+
+
+# Function to fetch a section's cached fragment, or build and cache it. counts, when given, is this
+# export's own tally of sections built and reused.
+def cached_fragment(export_format, section, build, counts=None):
+    key = (export_format, section["hash"])
+    with _fragment_cache_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+    if fragment is not None:
+        export_stats[export_format]["fragments_reused"] += 1
+        if counts is not None:
+            counts["fragments_reused"] += 1
+        increment("export_fragment", format=export_format, result="hit")
+        return fragment
+
+    fragment = build(section)
+    with _fragment_cache_lock:
+        _fragment_cache[key] = fragment
+        while len(_fragment_cache) > EXPORT_FRAGMENT_CACHE_MAX_ENTRIES:
+            _fragment_cache.popitem(last=False)
+    export_stats[export_format]["fragments_built"] += 1
+    if counts is not None:
+        counts["fragments_built"] += 1
+    increment("export_fragment", format=export_format, result="miss")
+    return fragment
+
+
+# Sections are laid out in a scratch document per thread; loading python-docx's template for each
+# section would cost more than laying it out
+_scratch = threading.local()
+
+
+# Function to lay out one section's heading and text as DOCX body elements (charts are added on assembly)
+def build_docx_fragment(section):
+    scratch = getattr(_scratch, "document", None)
+    if scratch is None:
+        scratch = _scratch.document = Document()
+    body = scratch.element.body
+    start = len(body) - 1  # Everything added goes before the final sectPr
+    if section["title"]:
+        scratch.add_heading(section["title"], level=1)
+    for kind, level, text in iter_blocks(section["text"]):
+        if kind == "heading":
+            scratch.add_heading(text, level=min(level + 1, 9))
+        else:
+            scratch.add_paragraph(text)
+    elements = list(body)[start:-1]
+    for element in elements:
+        body.remove(element)
+    return elements
+
+
+# Function to convert a sectioned document to DOCX format. Sections whose content hasn't changed reuse
+# their cached fragment, so an edit re-lays-out only the edited section.
+# Returns a spooled temp file positioned at the start.
+@timed("export", format="docx")
+def convert_to_docx(sections, counts=None):
+    doc = Document()
+    doc.add_heading('Business Document', 0)
+    body = doc.element.body
+
+    for section in sections:
+        for element in cached_fragment("docx", section, build_docx_fragment, counts):
+            body.sectPr.addprevious(copy.deepcopy(element))
+        for chart_type, title in section["charts"]:
+            doc.add_heading(title, level=2)
+            # Charts are fetched (or drawn) one at a time, from the chart cache when they are in it
+            doc.add_picture(BytesIO(render_chart(chart_type)), width=Inches(5))  # Correct usage of Inches
+
+    spool = new_spool()
+    doc.save(spool)
+    spool.seek(0)
+    return spool
+
+
+# Function to find a Unicode TrueType font family: {style: path}, or None to fall back to Arial (Latin-1 only).
+# matplotlib ships DejaVu Sans, so it is always there unless EXPORT_FONT_DIR points elsewhere.
+def find_unicode_fonts():
+    font_dir = EXPORT_FONT_DIR or os.path.join(matplotlib.get_data_path(), "fonts", "ttf")
+    paths = {style: os.path.join(font_dir, name) for style, name in UNICODE_FONT_FILES.items()}
+    return paths if all(os.path.exists(path) for path in paths.values()) else None
+
+
+# Custom PDF class with a Unicode font when one is available
+class CustomPDF(FPDF):
+    # Fonts are added without fpdf's on-disk metrics cache, and embedded through the subset cache
+    add_font = with_fpdf_globals(FPDF.add_font, FPDF_CACHE_MODE=1)
+    _putfonts = with_fpdf_globals(FPDF._putfonts, TTFontFile=CachedSubsetTTFontFile)
+
+    def __init__(self):
+        super().__init__()
+        fonts = find_unicode_fonts()
+        if fonts:
+            self.add_unicode_fonts(fonts)
+            self.body_font = "DejaVu"
+        else:
+            self.body_font = "Arial"
+        # Per page, the (start, end, kind, value) spans of the page content to fill in when the page is
+        # placed: the footer's page number and the image numbers
+        self.placeholders = {}
+        # Set once finished pages have been placed, so closing the document doesn't draw a second footer
+        self.footers_drawn = False
+        # Register the styles in a fixed order so every instance numbers its fonts the same way,
+        # which lets pages laid out by one instance be placed in another
+        for style in ("", "B", "I"):
+            self.set_font(self.body_font, style, 12)
+        self.set_auto_page_break(auto=True, margin=15)
+
+    # Register the DejaVu family from metrics parsed once per process; each PDF gets its own copy
+    # of the entries fpdf changes while writing (font number and character subset)
+    def add_unicode_fonts(self, fonts):
+        with _font_entries_lock:
+            if not _font_entries:
+                scratch = FPDF()
+                for style, path in fonts.items():
+                    CustomPDF.add_font(scratch, "DejaVu", style, path, uni=True)
+                _font_entries.update(fonts=scratch.fonts, font_files=scratch.font_files)
+        for key, font in _font_entries["fonts"].items():
+            self.fonts[key] = dict(font, i=len(self.fonts) + 1, subset=list(font["subset"]))
+        for name, info in _font_entries["font_files"].items():
+            self.font_files[name] = dict(info)
+
+    def header(self):
+        self.set_font(self.body_font, 'B', 12)
+        self.cell(0, 10, 'Business Document', align='C', ln=True)
+
+    def footer(self):
+        if self.footers_drawn:
+            return
+        self.set_y(-15)
+        self.set_font(self.body_font, 'I', 8)
+        self.cell(0, 10, f'Page {PAGE_NUMBER_ALIAS}', align='C')
+        self.mark_placeholder(self.encode_text(PAGE_NUMBER_ALIAS), "page", None)
+
+    # Draw the current page's footer without ending the document; a fragment's pages are only read
+    def finish_page(self):
+        self.in_footer = 1
+        self.footer()
+        self.in_footer = 0
+
+    # Text as it appears in the page content for the body font
+    def encode_text(self, text):
+        if self.body_font == "Arial":
+            return text
+        return UTF8ToUTF16BE(text, False)
+
+    # Record the span of the current page's content that the drawing call just made wrote as text;
+    # it is the last occurrence, as nothing has been drawn after it yet
+    def mark_placeholder(self, text, kind, value):
+        start = self.pages[self.page].rindex(text)
+        self.placeholders.setdefault(self.page, []).append((start, start + len(text), kind, value))
+
+    # The footer's page number is written as an alias and each fragment numbers its images from 1;
+    # fill both in at the recorded spans once the page's place in the document is known
+    def fill_placeholders(self, content, placeholders, image_numbers):
+        parts = []
+        end = 0
+        for start, stop, kind, value in placeholders:
+            parts.append(content[end:start])
+            if kind == "page":
+                parts.append(self.encode_text(str(self.page)))
+            else:
+                parts.append(f"/I{image_numbers[value]} Do")
+            end = stop
+        parts.append(content[end:])
+        return "".join(parts)
+
+    # The core Arial font only covers Latin-1; replace anything else rather than fail
+    def text_for_font(self, text):
+        if self.body_font == "Arial":
+            return text.encode('latin1', 'replace').decode('latin1')
+        return text
+
+    # fpdf appends every character it draws in a Unicode font to the font's subset list, so it grows
+    # with the document; keep each character once (the list's order and first entry are preserved)
+    def compact_font_subsets(self):
+        for font in self.fonts.values():
+            if font.get("subset") is not None and font["type"] == "TTF":
+                font["subset"][:] = dict.fromkeys(font["subset"])
+
+    # fpdf only reads images from a path and parses PNGs in pure Python (hundreds of ms for a chart with
+    # transparency). Charts repeat across exports, so the parsed image is kept, keyed on the PNG's hash,
+    # and the temp file is only needed the first time.
+    def image_png(self, png_bytes, **kwargs):
+        name = hashlib.sha1(png_bytes).hexdigest() + ".png"
+        if name not in self.images:
+            with _png_cache_lock:
+                info = _png_cache.get(name)
+            if info is not None:
+                # fpdf drops an image's data once written, so give it a copy of the info
+                self.images[name] = dict(info, i=len(self.images) + 1)
+        if name in self.images:
+            self.image(name, **kwargs)
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as file:
+                file.write(png_bytes)
+            try:
+                self.image(file.name, **kwargs)
+            finally:
+                os.remove(file.name)
+            # The page refers to the image by number, so it can be filed under its hash instead
+            self.images[name] = self.images.pop(file.name)
+            with _png_cache_lock:
+                _png_cache[name] = dict(self.images[name])
+                while len(_png_cache) > PNG_CACHE_MAX_ENTRIES:
+                    _png_cache.popitem(last=False)
+        number = self.images[name]["i"]
+        self.mark_placeholder(f"/I{number} Do", "image", number)
+
+
+# Function to lay out one section on pages of its own: heading, text, then its charts one per page.
+# The fragment keeps fpdf's raw page contents, the characters drawn per font and the images used, with
+# the page number left as PAGE_NUMBER_ALIAS and the spans of the page number and image references
+# recorded, so the pages can be placed anywhere in a document.
+def build_pdf_fragment(section):
+    pdf = CustomPDF()
+    pdf.add_page()
+    if section["title"]:
+        pdf.set_font(pdf.body_font, 'B', HEADING_FONT_SIZES[1])
+        pdf.multi_cell(0, 8, pdf.text_for_font(section["title"]))
+    for kind, level, text in iter_blocks(section["text"]):
+        if kind == "heading":
+            pdf.set_font(pdf.body_font, 'B', HEADING_FONT_SIZES.get(level + 1, 12))
+            pdf.ln(2)
+            pdf.multi_cell(0, 8, pdf.text_for_font(text))
+        else:
+            pdf.set_font(pdf.body_font, size=11)
+            pdf.multi_cell(0, 6, pdf.text_for_font(text))
+            pdf.ln(3)
+        pdf.compact_font_subsets()
+
+    for chart_type, title in section["charts"]:
+        pdf.add_page()
+        pdf.set_font(pdf.body_font, 'B', 14)
+        pdf.cell(200, 10, txt=pdf.text_for_font(title), ln=True, align='C')
+
+        # Charts are fetched (or drawn) one at a time, from the chart cache when they are in it
+        pdf.image_png(render_chart(chart_type), x=10, w=pdf.w - 20)
+    pdf.finish_page()
+
+    return {
+        "pages": [(pdf.pages[number], pdf.placeholders.get(number, [])) for number in range(1, pdf.page + 1)],
+        "subsets": {key: list(dict.fromkeys(font["subset"])) for key, font in pdf.fonts.items() if font["type"] == "TTF"},
+        "images": sorted(pdf.images.values(), key=lambda info: info["i"]),
+    }
+
+
+# Function to convert a sectioned document to PDF format. Each section starts on a new page, so its
+# laid-out pages are cached and reused until the section changes; assembly only numbers the pages,
+# merges the font subsets and renumbers the images.
+# Returns a spooled temp file positioned at the start.
+@timed("export", format="pdf")
+def convert_to_pdf(sections, counts=None):
+    pdf = CustomPDF()
+    pdf.open()
+    for section in sections:
+        fragment = cached_fragment("pdf", section, build_pdf_fragment, counts)
+        image_numbers = {}
+        for info in fragment["images"]:
+            image_numbers[info["i"]] = len(pdf.images) + 1
+            # fpdf drops an image's data once written, so give it a copy of the info
+            pdf.images[f"{section['hash']}-{info['i']}"] = dict(info, i=image_numbers[info["i"]])
+        for key, subset in fragment["subsets"].items():
+            pdf.fonts[key]["subset"].extend(subset)
+        for content, placeholders in fragment["pages"]:
+            pdf.page += 1
+            pdf.pages[pdf.page] = pdf.fill_placeholders(content, placeholders, image_numbers)
+        pdf.compact_font_subsets()
+
+    # The placed pages already have their footers; an empty document gets a blank page when it is closed
+    pdf.footers_drawn = pdf.page > 0
+    # fpdf keeps the finished file as a latin-1 str; encode it a slice at a time instead of all at once
+    output = pdf.output(dest='S')
+    spool = new_spool()
+    for start in range(0, len(output), EXPORT_WRITE_CHUNK):
+        spool.write(output[start:start + EXPORT_WRITE_CHUNK].encode('latin1'))
+    spool.seek(0)
+    return spool
+
+
+EXPORTERS = {
+    "docx": convert_to_docx,
+    "pdf": convert_to_pdf,
+}
+
+# Cached exports: key -> path of the finished file in this process's export directory
+_export_cache = OrderedDict()
+_export_cache_lock = threading.Lock()
+_export_dir = None
+
+
+# Function to get the directory cached exports are kept in, created on first use and removed at exit
+def export_directory():
+    global _export_dir
+    with _export_cache_lock:
+        if _export_dir is None:
+            _export_dir = tempfile.mkdtemp(prefix="exports-")
+            atexit.register(shutil.rmtree, _export_dir, True)
+        return _export_dir
+
+
+# Function to open a cached export, or None. The file is opened under the lock, so an eviction
+# right after can't remove it from under the caller (an open file outlives its directory entry).
+def _open_cached_export(key):
+    with _export_cache_lock:
+        path = _export_cache.get(key)
+        if path is None:
+            return None
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            del _export_cache[key]
+            return None
+        _export_cache.move_to_end(key)
+        return file
+
+
+# Function to get the exported document as an open binary file (the caller closes it), building it
+# only when the content changed. The key comes from the section hashes, so a rerun without edits never
+# reads the document text. Returns (file, info) where info has this call's own time, whether it came
+# from the cache and how many sections were laid out or reused (export_stats counts every export in
+# the process).
+def export_document(export_format, sections):
+    start = time.perf_counter()
+    key = (export_format, document_hash(sections))
+    stats = export_stats[export_format]
+    info = {"seconds": 0.0, "cached": False, "fragments_built": 0, "fragments_reused": 0}
+
+    file = _open_cached_export(key)
+    if file is None:
+        path = os.path.join(export_directory(), f"{key[1]}.{export_format}")
+        # Written under a temp name and renamed, as two sessions may build the same export at once
+        with EXPORTERS[export_format](sections, info) as spool, \
+                tempfile.NamedTemporaryFile(dir=export_directory(), suffix=".tmp", delete=False) as output:
+            shutil.copyfileobj(spool, output, EXPORT_WRITE_CHUNK)
+        os.replace(output.name, path)
+        file = open(path, "rb")
+        with _export_cache_lock:
+            _export_cache[key] = path
+            _export_cache.move_to_end(key)
+            while len(_export_cache) > EXPORT_CACHE_MAX_ENTRIES:
+                _, evicted = _export_cache.popitem(last=False)
+                if evicted != path:
+                    os.remove(evicted)
+        stats["builds"] += 1
+        increment("export_cache", format=export_format, result="miss")
+    else:
+        info["cached"] = True
+        stats["hits"] += 1
+        increment("export_cache", format=export_format, result="hit")
+
+    elapsed = time.perf_counter() - start
+    stats["last_seconds"] = elapsed
+    stats["total_seconds"] += elapsed
+    info["seconds"] = elapsed
+    return file, info
+
+
+def clear_export_caches():
+    with _export_cache_lock:
+        for path in _export_cache.values():
+            os.remove(path)
+        _export_cache.clear()
+    with _fragment_cache_lock:
+        _fragment_cache.clear()
@@ -0,0 +1,279 @@
+import contextvars
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from llm_cache import get_cache
+from llm_retry import call_with_retry
+from metrics import increment, observe
+from rate_limiter import get_rate_limiter
+from prompt_builder import allocate_max_tokens, build_messages, get_usage_stats
+from token_counting import count_message_tokens
+
+# Number of sections requested from the API at the same time
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("SECTION_MAX_CONCURRENCY", "4"))
+
+# Sections to generate separately based on document type
+DOCUMENT_SECTIONS = {
+    "Business Plan": [
+        "Executive Summary",
+        "Company Description",
+        "Market Analysis",
+        "Strategy and Implementation",
+        "Organization and Management Team",
+        "Financial Plan and Projections",
+        "Request for Funding",
+        "Product and Services Description",
+        "SWOT Analysis",
+        "Customer Analysis",
+        "Competitive Analysis",
+        "Marketing Plan",
+        "Operational Plan",
+        "Risk Management",
+        "Exit Strategy",
+        "Appendix"
+    ],
+    "Feasibility Study": [
+        "Executive Summary",
+        "Project Description",
+        "Market Feasibility",
+        "Technical Feasibility",
+        "Financial Feasibility",
+        "Economic Feasibility",
+        "Risk Assessment",
+        "Conclusion"
+    ],
+    "Application Form": [
+        "Applicant Information",
+        "Business Information",
+        "Funding Request",
+        "Project Details",
+        "Financial Information",
+        "Supporting Documents"
+    ],
+    "Pitch Deck": [
+        "Introduction",
+        "Problem Statement",
+        "Solution Overview",
+        "Market Opportunity",
+        "Business Model",
+        "Traction",
+        "Team",
+        "Financial Projections",
+        "Investment Ask",
+        "Closing"
+    ],
+}
+
+# Charts attached to a section, as (chart_type, title) pairs
+SECTION_CHARTS = {
+    ("Business Plan", "Market Analysis"): [
+        ("Market Share Over Time", "Market Analysis: Market Share Over Time"),
+        ("Competitive Analysis", "Market Analysis: Competitive Analysis"),
+    ],
+    ("Business Plan", "Strategy and Implementation"): [
+        ("Milestone Timeline", "Strategy and Implementation: Milestone Timeline"),
+    ],
+    ("Business Plan", "Financial Plan and Projections"): [
+        ("Revenue vs Expenses", "Financial Plan: Revenue vs Expenses"),
+        ("Cash Flow Forecast", "Financial Plan: Cash Flow Forecast"),
+    ],
+    ("Business Plan", "Organization and Management Team"): [
+        ("Organizational Structure", "Organization: Organizational Structure"),
+    ],
+    ("Business Plan", "Product and Services Description"): [
+        ("Product Development Roadmap", "Product Development: Roadmap"),
+    ],
+}
+
+
+# Function to replace placeholders in text with actual user inputs
+def replace_placeholders(text, context):
+    for key, value in context.items():
+        text = text.replace(f"[{key}]", value)
+    return text
+
+
+# Context for replacing placeholders
+def build_context(inputs):
+    return {
+        "Your Name": inputs["directors"],
+        "Funding Amount": inputs["funding_amount"],
+        "Grant Amount": inputs["grant_amount"],
+        "Finance Term": inputs["finance_term"],
+        "Business Overview": inputs["business_overview"],
+        "Staffing Compliment": inputs["staffing"]
+    }
+
+
+# Function to generate a single section with the chat completion API.
+# Identical requests are served from the response cache unless bypass_cache is set.
+# With stream=True, on_token(delta) is called as tokens arrive.
+# Returns the section text and its timing stats.
+def generate_section(section, inputs, max_tokens_per_section, bypass_cache=False, stream=False, on_token=None):
+    request = dict(
+        model="gpt-4",
+        messages=build_messages(section, inputs),
+        max_tokens=max_tokens_per_section,  # This section's share of the document budget
+        n=1,
+        stop=None,
+        temperature=0.7
+    )
+
+    start = time.perf_counter()
+    stats = {
+        "section": section,
+        "cached": True,
+        "time_to_first_token": 0.0,
+        "elapsed": 0.0,
+        "completion_tokens": 0,
+        "tokens_per_second": 0.0,
+        "retries": 0,
+        "wasted_tokens": 0,
+        "max_tokens": max_tokens_per_section,
+    }
+
+    # Reserve the prompt plus the most the completion can use; the unused part is handed back
+    prompt_tokens = count_message_tokens(request["messages"])
+    estimated_tokens = prompt_tokens + max_tokens_per_section
+    stats["prompt_tokens"] = prompt_tokens
+
+    def attempt():
+        with get_rate_limiter().reserve(estimated_tokens) as reservation:
+            if not stream:
+                response = openai.ChatCompletion.create(**request)
+                stats["time_to_first_token"] = time.perf_counter() - start
+                stats["completion_tokens"] = response.get("usage", {}).get("completion_tokens", 0)
+                reservation["used"] = prompt_tokens + stats["completion_tokens"]
+                return response['choices'][0]['message']['content'], response['choices'][0].get('finish_reason')
+
+            parts = []
+            finish_reason = None
+            for chunk in openai.ChatCompletion.create(stream=True, **request):
+                finish_reason = chunk['choices'][0].get('finish_reason') or finish_reason
+                delta = chunk['choices'][0].get('delta', {}).get('content')
+                if not delta:
+                    continue
+                if not parts:
+                    stats["time_to_first_token"] = time.perf_counter() - start
+                parts.append(delta)
+                stats["completion_tokens"] += 1  # Each streamed chunk carries one token
+                # Counted as it streams, so a stream that breaks keeps what it did use from the budget
+                reservation["used"] = prompt_tokens + stats["completion_tokens"]
+                if on_token:
+                    on_token(delta)
+            reservation["used"] = prompt_tokens + stats["completion_tokens"]
+            return "".join(parts), finish_reason
+
+    # A stream that broke part-way is thrown away and the section is requested again
+    def on_retry(attempt_number, error, delay):
+        stats["retries"] += 1
+        stats["wasted_tokens"] += stats["completion_tokens"]
+        stats["completion_tokens"] = 0
+        if stream and on_token:
+            on_token(None)
+
+    def create():
+        stats["cached"] = False
+        return call_with_retry(attempt, on_retry=on_retry)
+
+    section_text = get_cache().get_or_create(request, create, bypass=bypass_cache)
+    # Replace placeholders with actual user inputs
+    section_text = replace_placeholders(section_text, build_context(inputs))
+    if stats["cached"] and stream and on_token:
+        on_token(section_text)
+    if not stats["cached"]:
+        # Feed the observed length back into the next documents' section budgets
+        get_usage_stats().record(inputs["document_type"], inputs["document_length"], section, prompt_tokens, stats["completion_tokens"])
+
+    stats["elapsed"] = time.perf_counter() - start
+    observe("llm_section", stats["elapsed"], cached=str(stats["cached"]).lower())
+    if not stats["cached"]:
+        observe("llm_first_token", stats["time_to_first_token"])
+        increment("llm_tokens", prompt_tokens, kind="prompt")
+        increment("llm_tokens", stats["completion_tokens"], kind="completion")
+    if stats["retries"]:
+        increment("llm_retries", stats["retries"])
+    generation_time = stats["elapsed"] - stats["time_to_first_token"]
+    if stats["completion_tokens"] and generation_time > 0:
+        stats["tokens_per_second"] = stats["completion_tokens"] / generation_time
+
+    return section_text, stats
+
+
+# Function to collect the charts for a document, in section order
+def collect_charts(document_type, sections):
+    charts_to_generate = []
+    for section in sections:
+        charts_to_generate.extend(SECTION_CHARTS.get((document_type, section), []))
+    return charts_to_generate
+
+
+# Raised when some sections still failed after retries; the others were generated and reported
+class SectionGenerationError(Exception):
+    def __init__(self, failed_sections, first_error):
+        super().__init__(f"{len(failed_sections)} section(s) failed ({', '.join(failed_sections)}): {first_error}")
+        self.failed_sections = failed_sections
+        self.first_error = first_error
+
+
+# Function to generate every section of a document on a bounded thread pool.
+# Sections complete in any order but document_parts is returned in section order.
+# completed_parts maps section index -> (text, stats) for sections that are already done (e.g. when
+# resuming a job); only the missing sections are requested.
+# Callbacks are invoked from the calling thread so it is safe to update Streamlit elements from them:
+#   on_progress(index, section, completed, total, stats, text) when a section finishes
+#   on_token(index, section, delta) for every streamed delta (stream=True only); delta is None
+#   when a section's stream broke and it starts again from scratch
+# A section that fails doesn't stop the others: they finish and are reported, then
+# SectionGenerationError is raised. Returns (document_parts, charts_to_generate, section_stats).
+def generate_document(inputs, max_concurrency=DEFAULT_MAX_CONCURRENCY, on_progress=None, bypass_cache=False, stream=False, on_token=None,
+                      completed_parts=None):
+    document_type = inputs["document_type"]
+    sections = DOCUMENT_SECTIONS[document_type]
+    max_tokens = allocate_max_tokens(sections, inputs["document_length"], get_usage_stats().completion_averages(document_type, inputs["document_length"]))
+
+    document_parts = [None] * len(sections)
+    section_stats = [None] * len(sections)
+    for index, (text, stats) in (completed_parts or {}).items():
+        document_parts[index], section_stats[index] = text, stats
+    missing = [index for index in range(len(sections)) if document_parts[index] is None]
+    events = queue.Queue()
+
+    def run(index, section):
+        try:
+            token_callback = (lambda delta: events.put(("token", index, delta))) if stream else None
+            result = generate_section(section, inputs, max_tokens[section], bypass_cache, stream, token_callback)
+            events.put(("done", index, result))
+        except BaseException as e:
+            events.put(("error", index, e))
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        for index in missing:
+            # Workers inherit the caller's context, e.g. its rate-limit session
+            executor.submit(contextvars.copy_context().run, run, index, sections[index])
+        completed = len(sections) - len(missing)
+        finished = 0
+        while finished < len(missing):
+            kind, index, payload = events.get()
+            if kind == "token":
+                if on_token:
+                    on_token(index, sections[index], payload)
+            elif kind == "done":
+                document_parts[index], section_stats[index] = payload
+                completed += 1
+                finished += 1
+                if on_progress:
+                    on_progress(index, sections[index], completed, len(sections), section_stats[index], document_parts[index])
+            else:
+                errors[index] = payload
+                finished += 1
+
+    if errors:
+        failed = sorted(errors)
+        raise SectionGenerationError([sections[index] for index in failed], errors[failed[0]]) from errors[failed[0]]
+    return document_parts, collect_charts(document_type, sections), section_stats
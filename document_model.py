@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+from document_generator import SECTION_CHARTS
+
+# A generated document is kept as an ordered list of sections instead of one string:
+#     {"title": ..., "text": ..., "charts": [[chart_type, title], ...], "hash": ...}
+# The hash covers the section's title, text and charts and is computed when the section is created or
+# edited, so caches keyed on it (exported DOCX/PDF fragments, whole exports) never rehash the document.
+
+
+# Function to hash a section's content
+def section_hash(title, text, charts):
+    payload = json.dumps([title, text, charts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_section(title, text, charts=()):
+    charts = [list(chart) for chart in charts]
+    return {"title": title, "text": text, "charts": charts, "hash": section_hash(title, text, charts)}
+
+
+# Function to build a document from generated section texts, attaching each section's charts
+def build_document(document_type, titles, texts):
+    return [
+        make_section(title, text, SECTION_CHARTS.get((document_type, title), []))
+        for title, text in zip(titles, texts)
+    ]
+
+
+# Function to replace one section's text; returns the same section when the text didn't change
+def update_section(section, text):
+    if text == section["text"]:
+        return section
+    return make_section(section["title"], text, section["charts"])
+
+
+# Identifies the document's content from its section hashes, without reading the text
+def document_hash(sections):
+    return hashlib.sha256("".join(section["hash"] for section in sections).encode("ascii")).hexdigest()
+
+
+def document_text(sections):
+    return "\n\n".join(f"# {section['title']}\n\n{section['text']}" for section in sections)
+
+
+# Function to split plain text into sections at its top-level "# " headings (text before the first
+# heading becomes an untitled section)
+def document_from_text(text, charts=()):
+    sections = []
+    title, lines = "", []
+    for line in text.splitlines():
+        if line.startswith("# "):
+            if title or any(lines):
+                sections.append(make_section(title, "\n".join(lines).strip()))
+            title, lines = line[2:].strip(), []
+        else:
+            lines.append(line)
+    if title or any(lines):
+        sections.append(make_section(title, "\n".join(lines).strip()))
+    if charts and sections:
+        sections[-1] = make_section(sections[-1]["title"], sections[-1]["text"], charts)
+    return sections
@@ -0,0 +1,469 @@
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from document_model import make_section
+
+# Persistent store for generated documents, so sessions hold only a document ID and documents
+# survive restarts. Every document belongs to an owner: a workspace, identified by the hash of a key its
+# user keeps (see owner_for_key), so a refresh or a server restart doesn't lose it. Listing, search and
+# loading only ever see the caller's own documents. Documents not changed for DOCUMENT_RETENTION_DAYS
+# are deleted, along with the sections no remaining document uses.
+# Sections are stored once each, keyed on their content hash and zlib-compressed; a version is just
+# the list of its section hashes, so an edit stores only the sections it changed. An edited section is
+# stored as a word-level delta against the text it replaced (up to DOCUMENT_DELTA_MAX_CHAIN deltas in a
+# row, then in full again). Versions are listed without their content and loaded only when opened;
+# decoded sections are kept in a process-wide LRU shared by every session. Section text is indexed for
+# full-text search (SQLite FTS5; titles only if this SQLite lacks it).
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", os.path.join(".cache", "documents.sqlite3"))
+DOCUMENT_CACHE_MAX_SECTIONS = int(os.getenv("DOCUMENT_CACHE_MAX_SECTIONS", "512"))
+DOCUMENT_DELTA_MAX_CHAIN = 20
+DOCUMENT_COMPRESSION_LEVEL = 6
+# Largest changed region (base words x new words) diffed word by word
+DELTA_MAX_DIFF_CELLS = 100_000_000
+# 0 keeps documents forever; otherwise expired documents are removed at most once per DOCUMENT_PRUNE_INTERVAL
+DOCUMENT_RETENTION_DAYS = float(os.getenv("DOCUMENT_RETENTION_DAYS", "180"))
+DOCUMENT_PRUNE_INTERVAL = 3600
+
+# Words with their trailing whitespace (and any leading whitespace on its own)
+WORD = re.compile(r"\S+\s*|\s+")
+
+
+# Function to turn a workspace key into the owner stored with its documents. Only the hash is stored,
+# so the database alone doesn't give anyone the keys.
+def owner_for_key(workspace_key):
+    return hashlib.sha256(workspace_key.encode("utf-8")).hexdigest()
+
+
+# Function to identify the form inputs a document was generated from
+def inputs_key(inputs):
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), DOCUMENT_COMPRESSION_LEVEL)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+# Function to describe new_text as edits to base_text: a list of [start, end] runs of base words to
+# copy and strings to insert. Edits are usually in one place, so the unchanged start and end are
+# matched directly and only the middle is diffed.
+def text_delta(base_text, new_text):
+    base_words = WORD.findall(base_text)
+    new_words = WORD.findall(new_text)
+    prefix = len(os.path.commonprefix([base_words, new_words]))
+    limit = min(len(base_words), len(new_words)) - prefix
+    suffix = len(os.path.commonprefix([base_words[::-1][:limit], new_words[::-1][:limit]]))
+    base_end, new_end = len(base_words) - suffix, len(new_words) - suffix
+
+    ops = [[0, prefix]] if prefix else []
+    if (base_end - prefix) * (new_end - prefix) > DELTA_MAX_DIFF_CELLS:
+        # Too much changed to be worth diffing; the delta will lose to storing the section in full
+        ops.append("".join(new_words[prefix:new_end]))
+    else:
+        matcher = difflib.SequenceMatcher(None, base_words[prefix:base_end], new_words[prefix:new_end])
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([prefix + i1, prefix + i2])
+            elif j2 > j1:
+                ops.append("".join(new_words[prefix + j1:prefix + j2]))
+    if suffix:
+        ops.append([base_end, len(base_words)])
+    return ops
+
+
+def apply_delta(base_text, ops):
+    base_words = WORD.findall(base_text)
+    return "".join(op if isinstance(op, str) else "".join(base_words[op[0]:op[1]]) for op in ops)
+
+
+# Function to turn a search box entry into an FTS5 query: every word must match, as a prefix
+def fts_query(query):
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in query.split())
+
+
+class DocumentStore:
+    def __init__(self, path=DOCUMENT_STORE_PATH, cache_max_sections=DOCUMENT_CACHE_MAX_SECTIONS):
+        self.path = path
+        self.cache_max_sections = cache_max_sections
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pruned_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL DEFAULT '',
+                    title TEXT NOT NULL,
+                    document_type TEXT NOT NULL,
+                    inputs TEXT NOT NULL,
+                    inputs_key TEXT NOT NULL,
+                    job_id TEXT,
+                    head_version INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Stores created before documents had owners: their documents are left without one until
+            # someone claims them (see claim)
+            if "owner" not in [row[1] for row in conn.execute("PRAGMA table_info(documents)")]:
+                conn.execute("ALTER TABLE documents ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            conn.execute("DROP INDEX IF EXISTS documents_updated_at")
+            conn.execute("DROP INDEX IF EXISTS documents_inputs_key")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_owner_updated_at ON documents (owner, updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_owner_inputs_key ON documents (owner, inputs_key, updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_job_id ON documents (job_id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS versions (
+                    document_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    parent INTEGER,
+                    note TEXT NOT NULL,
+                    changed INTEGER NOT NULL,
+                    manifest BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (document_id, version)
+                )
+            """)
+            # kind is "full" or "delta" (data holds edits to the base section's text)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sections (
+                    hash TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    base TEXT,
+                    depth INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    raw_size INTEGER NOT NULL
+                )
+            """)
+            # Every section each document has ever had, for search across its history
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS document_sections (
+                    document_id TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (document_id, hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS document_sections_hash ON document_sections (hash)")
+            try:
+                # Contentless: the index holds only tokens, the text itself stays compressed in sections
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS section_search USING fts5(title, body, content='')")
+                self.full_text_search = True
+            except sqlite3.OperationalError:
+                self.full_text_search = False
+
+    # sqlite3 connections can't be shared between threads, so keep one per thread
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cache_get(self, section_hash):
+        with self._cache_lock:
+            section = self._cache.get(section_hash)
+            if section is not None:
+                self._cache.move_to_end(section_hash)
+            return section
+
+    def _cache_put(self, section):
+        with self._cache_lock:
+            self._cache[section["hash"]] = section
+            self._cache.move_to_end(section["hash"])
+            while len(self._cache) > self.cache_max_sections:
+                self._cache.popitem(last=False)
+
+    # Function to load one section by hash, following its delta chain
+    def _section(self, conn, section_hash):
+        section = self._cache_get(section_hash)
+        if section is not None:
+            return section
+        row = conn.execute("SELECT kind, base, data FROM sections WHERE hash = ?", (section_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f"Missing section {section_hash}")
+        kind, base, data = row
+        value = _unpack(data)
+        if kind == "delta":
+            value["text"] = apply_delta(self._section(conn, base)["text"], value.pop("ops"))
+        section = make_section(value["title"], value["text"], value["charts"])
+        self._cache_put(section)
+        return section
+
+    # Function to store a section unless it already is; base is the section it replaces, if any
+    def _store_section(self, conn, section, base=None):
+        if conn.execute("SELECT 1 FROM sections WHERE hash = ?", (section["hash"],)).fetchone():
+            return
+        value = {"title": section["title"], "text": section["text"], "charts": section["charts"]}
+        kind, base_hash, depth, data = "full", None, 0, _pack(value)
+        if base is not None:
+            base_depth = conn.execute("SELECT depth FROM sections WHERE hash = ?", (base["hash"],)).fetchone()[0]
+            if base_depth < DOCUMENT_DELTA_MAX_CHAIN:
+                delta = _pack({"title": section["title"], "charts": section["charts"], "ops": text_delta(base["text"], section["text"])})
+                if len(delta) < len(data):
+                    kind, base_hash, depth, data = "delta", base["hash"], base_depth + 1, delta
+        cursor = conn.execute(
+            "INSERT INTO sections (hash, kind, base, depth, data, raw_size) VALUES (?, ?, ?, ?, ?, ?)",
+            (section["hash"], kind, base_hash, depth, data, len(section["text"].encode("utf-8")))
+        )
+        if self.full_text_search:
+            conn.execute("INSERT INTO section_search (rowid, title, body) VALUES (?, ?, ?)", (cursor.lastrowid, section["title"], section["text"]))
+        self._cache_put(section)
+
+    # Function to get the latest version of one of owner's documents; None if there is no such document
+    def _head(self, conn, owner, document_id):
+        row = conn.execute("SELECT head_version FROM documents WHERE id = ? AND owner = ?", (document_id, owner)).fetchone()
+        return None if row is None else row[0]
+
+    def _manifest(self, conn, document_id, version):
+        row = conn.execute("SELECT manifest FROM versions WHERE document_id = ? AND version = ?", (document_id, version)).fetchone()
+        return None if row is None else _unpack(row[0])
+
+    # Function to save a newly generated document as version 1 of owner's; returns its ID
+    def create(self, owner, sections, document_type, inputs, title, job_id=None):
+        document_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        if DOCUMENT_RETENTION_DAYS and now - self._pruned_at > DOCUMENT_PRUNE_INTERVAL:
+            self._pruned_at = now
+            self.prune(now)
+        with self._connect() as conn:
+            # Writes take the database's write lock up front: sections are checked before they are
+            # inserted and versions are numbered from the head, which another writer could change
+            conn.execute("BEGIN IMMEDIATE")
+            for section in sections:
+                self._store_section(conn, section)
+            conn.execute(
+                "INSERT INTO documents (id, owner, title, document_type, inputs, inputs_key, job_id, head_version, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+                (document_id, owner, title, document_type, json.dumps(inputs), inputs_key(inputs), job_id, now, now)
+            )
+            self._insert_version(conn, document_id, 1, None, "generated", len(sections), sections, now)
+        return document_id
+
+    # Function to save sections as a new version following parent (default: the latest version).
+    # Only changed sections are stored. Returns the new version number, or parent when nothing changed.
+    # Raises KeyError unless the document is one of owner's.
+    def save_version(self, owner, document_id, sections, parent=None, note="edited"):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            head = self._head(conn, owner, document_id)
+            if head is None:
+                raise KeyError(f"No document {document_id}")
+            parent = parent or head
+            parent_hashes = self._manifest(conn, document_id, parent)
+            if parent_hashes is None:
+                raise KeyError(f"No version {parent} of document {document_id}")
+            if [section["hash"] for section in sections] == parent_hashes:
+                return parent
+            changed = 0
+            for index, section in enumerate(sections):
+                if index < len(parent_hashes) and section["hash"] == parent_hashes[index]:
+                    continue
+                changed += 1
+                base = self._section(conn, parent_hashes[index]) if index < len(parent_hashes) else None
+                self._store_section(conn, section, base)
+            version = head + 1
+            self._insert_version(conn, document_id, version, parent, note, changed, sections, now)
+            conn.execute("UPDATE documents SET head_version = ?, updated_at = ? WHERE id = ?", (version, now, document_id))
+        return version
+
+    def _insert_version(self, conn, document_id, version, parent, note, changed, sections, now):
+        hashes = [section["hash"] for section in sections]
+        conn.execute(
+            "INSERT INTO versions (document_id, version, parent, note, changed, manifest, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (document_id, version, parent, note, changed, _pack(hashes), now)
+        )
+        conn.executemany("INSERT OR IGNORE INTO document_sections (document_id, hash) VALUES (?, ?)", [(document_id, h) for h in hashes])
+
+    # Function to load a version's sections (default: the latest); returns None for an unknown document or
+    # version, or a document that isn't owner's
+    def load(self, owner, document_id, version=None):
+        with self._connect() as conn:
+            head = self._head(conn, owner, document_id)
+            if head is None:
+                return None
+            hashes = self._manifest(conn, document_id, version or head)
+            if hashes is None:
+                return None
+            return [self._section(conn, section_hash) for section_hash in hashes]
+
+    def get(self, owner, document_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, title, document_type, inputs, job_id, head_version, created_at, updated_at FROM documents "
+                "WHERE id = ? AND owner = ?", (document_id, owner)
+            ).fetchone()
+        return None if row is None else self._document(row)
+
+    # Function to list a document's versions, newest first, without loading their content
+    def versions(self, owner, document_id):
+        with self._connect() as conn:
+            if self._head(conn, owner, document_id) is None:
+                return []
+            rows = conn.execute(
+                "SELECT version, parent, note, changed, created_at FROM versions WHERE document_id = ? ORDER BY version DESC", (document_id,)
+            ).fetchall()
+        return [dict(zip(["version", "parent", "note", "changed", "created_at"], row)) for row in rows]
+
+    def list_recent(self, owner, limit=20):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, title, document_type, inputs, job_id, head_version, created_at, updated_at "
+                "FROM documents WHERE owner = ? ORDER BY updated_at DESC LIMIT ?", (owner, limit)
+            ).fetchall()
+        return [self._document(row) for row in rows]
+
+    # Function to find owner's documents whose title, type or text (in any version) matches every word of query
+    def search(self, owner, query, limit=20):
+        if not query.strip():
+            return self.list_recent(owner, limit)
+        like = f"%{query.strip()}%"
+        sql = (
+            "SELECT id, title, document_type, inputs, job_id, head_version, created_at, updated_at FROM documents "
+            "WHERE owner = ? AND (title LIKE ? OR document_type LIKE ?"
+        )
+        params = [owner, like, like]
+        if self.full_text_search:
+            sql += (
+                " OR id IN (SELECT document_sections.document_id FROM section_search "
+                "JOIN sections ON sections.rowid = section_search.rowid "
+                "JOIN document_sections ON document_sections.hash = sections.hash "
+                "WHERE section_search MATCH ?)"
+            )
+            params.append(fts_query(query))
+        with self._connect() as conn:
+            rows = conn.execute(sql + ") ORDER BY updated_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [self._document(row) for row in rows]
+
+    # Function to find owner's latest document generated from exactly these form inputs
+    def find_by_inputs(self, owner, inputs):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id FROM documents WHERE owner = ? AND inputs_key = ? ORDER BY updated_at DESC LIMIT 1", (owner, inputs_key(inputs))
+            ).fetchone()
+        return row[0] if row else None
+
+    def find_by_job(self, owner, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id FROM documents WHERE job_id = ? AND owner = ?", (job_id, owner)).fetchone()
+        return row[0] if row else None
+
+    # Function to hand a document from before documents had owners to owner. Anyone who has its ID can
+    # claim it once (before owners, every session could see every document); document_id=None claims them
+    # all. Returns the number of documents claimed.
+    def claim(self, owner, document_id=None):
+        with self._connect() as conn:
+            if document_id is None:
+                cursor = conn.execute("UPDATE documents SET owner = ? WHERE owner = ''", (owner,))
+            else:
+                cursor = conn.execute("UPDATE documents SET owner = ? WHERE id = ? AND owner = ''", (owner, document_id))
+        return cursor.rowcount
+
+    # Function to delete documents not changed for DOCUMENT_RETENTION_DAYS (claimed or not), then the
+    # sections no remaining document uses. Returns the number of documents deleted.
+    def prune(self, now=None, retention_days=None):
+        retention_days = DOCUMENT_RETENTION_DAYS if retention_days is None else retention_days
+        if not retention_days:
+            return 0
+        cutoff = (now or time.time()) - retention_days * 86400
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = [row[0] for row in conn.execute("SELECT id FROM documents WHERE updated_at < ?", (cutoff,))]
+            for table, column in (("document_sections", "document_id"), ("versions", "document_id"), ("documents", "id")):
+                conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(document_id,) for document_id in expired])
+            # A section may still be the base of another's delta; those go once nothing is built on them
+            while True:
+                unused = conn.execute(
+                    "SELECT rowid, hash FROM sections WHERE hash NOT IN (SELECT hash FROM document_sections) "
+                    "AND hash NOT IN (SELECT base FROM sections WHERE base IS NOT NULL)"
+                ).fetchall()
+                if not unused:
+                    break
+                for rowid, section_hash in unused:
+                    if self.full_text_search:
+                        # A contentless index can only forget a row given the text it indexed
+                        section = self._section(conn, section_hash)
+                        conn.execute(
+                            "INSERT INTO section_search (section_search, rowid, title, body) VALUES ('delete', ?, ?, ?)",
+                            (rowid, section["title"], section["text"])
+                        )
+                    conn.execute("DELETE FROM sections WHERE rowid = ?", (rowid,))
+        return len(expired)
+
+    def _document(self, row):
+        keys = ["id", "title", "document_type", "inputs", "job_id", "head_version", "created_at", "updated_at"]
+        document = dict(zip(keys, row))
+        document["inputs"] = json.loads(document["inputs"])
+        return document
+
+    # Function to report how much space the sections take: raw text bytes vs stored bytes.
+    # This reads every stored section, so call it on request rather than on every page render.
+    def stats(self):
+        with self._connect() as conn:
+            documents, versions = conn.execute("SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM versions)").fetchone()
+            sections, deltas, raw, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(kind = 'delta'), 0), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM sections"
+            ).fetchone()
+        with self._cache_lock:
+            cached = len(self._cache)
+        return {
+            "documents": documents,
+            "versions": versions,
+            "sections": sections,
+            "delta_sections": deltas,
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "cached_sections": cached,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+        return _store
+
+
+def set_document_store(store):
+    global _store
+    with _store_lock:
+        _store = store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the document store.")
+    parser.add_argument("--claim-legacy", metavar="WORKSPACE_KEY", help="Give every document from before workspaces to this workspace")
+    parser.add_argument("--prune", action="store_true", help="Delete the documents past DOCUMENT_RETENTION_DAYS now")
+    args = parser.parse_args()
+
+    store = DocumentStore()
+    if args.claim_legacy:
+        print(f"{store.claim(owner_for_key(args.claim_legacy))} documents moved to the workspace")
+    if args.prune:
+        print(f"{store.prune()} documents deleted")
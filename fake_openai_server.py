@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import wave
+from email.parser import BytesParser
+from email.policy import HTTP
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI API, used to benchmark the app without real calls.
+# Point the client at it with: openai.api_base = "http://127.0.0.1:<port>/v1"
+
+FILLER_WORDS = ["revenue", "growth", "market", "strategy", "customers", "funding", "operations", "team"]
+
+
+# Function to build filler text of roughly the requested number of tokens
+def filler_text(tokens):
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(tokens))
+
+
+# Fake speech recognition for WAV uploads: one word per second of audio, derived from the
+# samples themselves, so overlapping segments of the same recording "hear" the same words.
+# Returns (text, audio_seconds).
+def fake_transcribe(audio_bytes, words_per_second=1):
+    try:
+        with wave.open(BytesIO(audio_bytes), "rb") as wav:
+            frame_size = wav.getnchannels() * wav.getsampwidth()
+            block = max(1, wav.getframerate() // words_per_second)
+            frames = wav.readframes(wav.getnframes())
+            rate = wav.getframerate()
+    except (wave.Error, EOFError):
+        return filler_text(50), 0.0
+    words = []
+    for start in range(0, len(frames) // frame_size - block + 1, block):
+        digest = hashlib.md5(frames[start * frame_size:(start + block) * frame_size]).hexdigest()
+        words.append(f"{FILLER_WORDS[int(digest[:4], 16) % len(FILLER_WORDS)]}{int(digest[4:8], 16) % 1000}")
+    return " ".join(words), len(frames) / frame_size / rate
+
+
+# Function to pull the uploaded file out of a multipart/form-data body
+def multipart_file(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin1") + b"\r\n\r\n" + body)
+    for part in message.iter_parts():
+        if part.get_filename():
+            return part.get_payload(decode=True)
+    return b""
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Server-sent events in chunked transfer encoding, as the real API streams.
+    # With drop_after set, the connection is cut after that many events, as a failed stream would be.
+    def send_event_stream(self, events, drop_after=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, event in enumerate(events):
+            if index == drop_after:
+                self.close_connection = True
+                return
+            data = f"data: {event}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    # Count what the server has handed out, so benchmarks can measure tokens wasted by failures
+    def count(self, name, amount=1):
+        with self.server.lock:
+            self.server.counters[name] += amount
+
+    # Fault injection: decide whether this request fails, and how.
+    # Returns None (succeed), "rate_limit", "unavailable" or, for streams, "drop".
+    # Requests beyond rpm_limit are always rate limited, as the real API does.
+    def pick_fault(self, stream):
+        config = self.server.config
+        with self.server.lock:
+            if config["rpm_limit"]:
+                # Limits replenish continuously, as a bucket of rpm_limit requests refilled over a minute
+                now = time.monotonic()
+                allowance = min(config["rpm_limit"], self.server.allowance + (now - self.server.allowance_updated) * config["rpm_limit"] / 60)
+                self.server.allowance_updated = now
+                if allowance < 1:
+                    self.server.allowance = allowance
+                    self.server.counters["rate_limited"] += 1
+                    return "rate_limit"
+                self.server.allowance = allowance - 1
+            if self.server.random.random() >= config["failure_rate"]:
+                return None
+            return self.server.random.choice(["rate_limit", "unavailable", "drop"] if stream else ["rate_limit", "unavailable"])
+
+    def send_fault(self, fault):
+        self.count("failures")
+        if fault == "rate_limit":
+            body = json.dumps({"error": {"message": "Rate limit reached (injected)", "type": "requests"}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Retry-After", str(self.server.config["retry_after"]))
+        else:
+            body = json.dumps({"error": {"message": "The server is overloaded (injected)", "type": "server_error"}}).encode("utf-8")
+            self.send_response(503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # A reply cut short by the request's max_tokens stops on "length", as the real API reports it
+    def finish_reason(self, tokens):
+        return "length" if tokens < self.server.config["completion_tokens"] else "stop"
+
+    def stream_chat_completion(self, request, tokens):
+        config = self.server.config
+        words = filler_text(tokens).split(" ")
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(config["token_latency"])
+            yield json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [{"index": 0, "delta": {"content": word if index == 0 else " " + word}, "finish_reason": None}]
+            })
+            # Counted once the event has been sent, i.e. when the next one is asked for
+            self.count("served_tokens")
+        yield json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": self.finish_reason(tokens)}]
+        })
+        yield "[DONE]"
+
+    def do_POST(self):
+        config = self.server.config
+        if self.path.endswith("/chat/completions"):
+            request = self.read_json()
+            self.count("requests")
+            time.sleep(config["latency"])
+            tokens = min(config["completion_tokens"], request.get("max_tokens") or config["completion_tokens"])
+            fault = self.pick_fault(request.get("stream"))
+            if fault == "drop":
+                self.count("failures")
+                with self.server.lock:
+                    drop_after = self.server.random.randrange(1, tokens + 1)
+                self.send_event_stream(self.stream_chat_completion(request, tokens), drop_after=drop_after)
+                return
+            if fault:
+                self.send_fault(fault)
+                return
+            if request.get("stream"):
+                self.send_event_stream(self.stream_chat_completion(request, tokens))
+                return
+            self.count("served_tokens", tokens)
+            self.send_json({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": filler_text(tokens)},
+                    "finish_reason": self.finish_reason(tokens)
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens}
+            })
+        elif self.path.endswith("/completions"):
+            request = self.read_json()
+            self.count("requests")
+            time.sleep(config["latency"])
+            fault = self.pick_fault(False)
+            if fault:
+                self.send_fault(fault)
+                return
+            tokens = min(config["completion_tokens"], request.get("max_tokens") or config["completion_tokens"])
+            self.count("served_tokens", tokens)
+            prompt_tokens = len(str(request.get("prompt", "")).split())
+            self.send_json({
+                "id": "cmpl-fake",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [{"index": 0, "text": filler_text(tokens), "finish_reason": self.finish_reason(tokens)}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens}
+            })
+        elif self.path.endswith("/audio/transcriptions"):
+            length = int(self.headers.get("Content-Length", 0))
+            audio_bytes = multipart_file(self.headers.get("Content-Type", ""), self.rfile.read(length))
+            self.count("requests")
+            fault = self.pick_fault(False)
+            if fault:
+                self.send_fault(fault)
+                return
+            text, audio_seconds = fake_transcribe(audio_bytes)
+            # ASR time grows with the length of the uploaded audio
+            time.sleep(config["latency"] + audio_seconds * config["asr_realtime_factor"])
+            self.send_json({"text": text})
+        else:
+            self.send_json({"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}, status=404)
+
+
+# Function to start the fake server on a background thread; returns (server, api_base)
+# latency is the delay before the first token; token_latency is the delay between streamed tokens;
+# transcriptions take latency + asr_realtime_factor * audio seconds.
+# failure_rate is the fraction of requests that fail: 429 with a Retry-After of retry_after seconds,
+# 503, or (for streams) a connection dropped part-way; seed makes the faults reproducible.
+# rpm_limit rejects requests beyond that many per minute with a 429.
+# server.counters tracks requests, failures, rate_limited and served_tokens (completion tokens actually sent).
+def start_fake_server(latency=0.5, completion_tokens=200, token_latency=0.0, asr_realtime_factor=0.0, host="127.0.0.1", port=0,
+                      failure_rate=0.0, retry_after=1, seed=0, rpm_limit=0):
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency,
+        "completion_tokens": completion_tokens,
+        "token_latency": token_latency,
+        "asr_realtime_factor": asr_realtime_factor,
+        "failure_rate": failure_rate,
+        "retry_after": retry_after,
+        "rpm_limit": rpm_limit,
+    }
+    server.allowance = float(rpm_limit)
+    server.allowance_updated = time.monotonic()
+    server.lock = threading.Lock()
+    server.random = random.Random(seed)
+    server.counters = {"requests": 0, "failures": 0, "rate_limited": 0, "served_tokens": 0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before each response")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens returned per completion")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--asr-realtime-factor", type=float, default=0.0, help="Transcription seconds per second of audio")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail (429, 503 or a dropped stream)")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the injected faults")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Requests per minute before answering 429 (0 = no limit)")
+    args = parser.parse_args()
+
+    server, api_base = start_fake_server(args.latency, args.completion_tokens, args.token_latency, args.asr_realtime_factor, args.host, args.port,
+                                         args.failure_rate, args.retry_after, args.seed, args.rpm_limit)
+    print(f"Fake OpenAI server listening on {api_base}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
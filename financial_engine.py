@@ -0,0 +1,100 @@
+import numpy as np
+
+# Vectorized projection engine for the financial modeling page.
+# Every series is an array shaped (scenarios, periods), so a 10-year monthly model
+# with hundreds of scenarios is a handful of whole-array operations.
+
+FINANCIAL_ITEMS = ["Revenue", "Expenses", "Assets", "Liabilities", "Equity", "Profit", "Net Assets"]
+
+
+# Divide where the denominator is positive, else use fallback (same semantics as calculate_ratios)
+def safe_divide(numerator, denominator, fallback):
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float))
+    out = np.full(numerator.shape, fallback, dtype=float)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+# Function to compute every ratio from calculate_ratios and advanced_metrics_analysis at once.
+# Accepts scalars or arrays of any (broadcastable) shape for each financial item.
+def compute_ratios(financial_data):
+    revenue = np.asarray(financial_data["Revenue"], dtype=float)
+    expenses = np.asarray(financial_data["Expenses"], dtype=float)
+    assets = np.asarray(financial_data["Assets"], dtype=float)
+    liabilities = np.asarray(financial_data["Liabilities"], dtype=float)
+    equity = np.asarray(financial_data["Equity"], dtype=float)
+    profit = np.asarray(financial_data["Profit"], dtype=float)
+
+    profit_margin = safe_divide(profit, revenue, 0.0)
+    equity_multiplier = safe_divide(assets, equity, np.inf)
+    return {
+        "Current Ratio": safe_divide(assets, liabilities, np.inf),
+        "Debt-to-Equity Ratio": safe_divide(liabilities, equity, np.inf),
+        "Profit Margin": profit_margin,
+        "Return on Assets (ROA)": safe_divide(profit, assets, 0.0),
+        "Return on Equity (ROE)": safe_divide(profit, equity, 0.0),
+        "Gross Profit Margin": safe_divide(revenue - expenses, revenue, 0.0),
+        "Operating Margin": profit_margin,
+        "Net Profit Margin": profit_margin,
+        "Financial Leverage": equity_multiplier,
+        "Asset Turnover": safe_divide(revenue, assets, 0.0),
+        "Equity Multiplier": equity_multiplier,
+    }
+
+
+# Broadcast a per-period rate given as a scalar, a (scenarios,) or a (scenarios, periods) array
+def rate_matrix(rate, scenarios, periods):
+    rate = np.asarray(rate, dtype=float)
+    if rate.ndim == 1:
+        rate = rate[:, None]
+    return np.broadcast_to(rate, (scenarios, periods))
+
+
+# Function to convert an annual growth rate to the equivalent rate per period
+def per_period_rate(annual_rate, periods_per_year):
+    return np.power(1.0 + np.asarray(annual_rate, dtype=float), 1.0 / periods_per_year) - 1.0
+
+
+# Function to spread a driver evenly across scenarios, from the worst to the best case
+def scenario_range(low, high, scenarios):
+    return np.linspace(low, high, scenarios) if scenarios > 1 else np.array([(low + high) / 2.0])
+
+
+# Function to project the base financial data forward.
+# Growth drivers are per-period rates (see rate_matrix for accepted shapes).
+# Expenses are a fixed part growing at expense_growth plus variable_cost_ratio * revenue,
+# calibrated so the base period matches base["Expenses"]. margin_shock adds a fraction of revenue
+# to profit (e.g. a Monte Carlo draw). Equity accumulates retained profit.
+# Returns a dict of (scenarios, periods) arrays keyed like financial_data.
+def project_financials(base, periods, scenarios=1, revenue_growth=0.0, expense_growth=0.0,
+                       variable_cost_ratio=0.0, asset_growth=0.0, liability_growth=0.0, retention_ratio=1.0,
+                       margin_shock=0.0):
+    revenue_factor = np.cumprod(1.0 + rate_matrix(revenue_growth, scenarios, periods), axis=1)
+    expense_factor = np.cumprod(1.0 + rate_matrix(expense_growth, scenarios, periods), axis=1)
+    asset_factor = np.cumprod(1.0 + rate_matrix(asset_growth, scenarios, periods), axis=1)
+    liability_factor = np.cumprod(1.0 + rate_matrix(liability_growth, scenarios, periods), axis=1)
+    variable_cost_ratio = rate_matrix(variable_cost_ratio, scenarios, periods)
+
+    revenue = base["Revenue"] * revenue_factor
+    fixed_expenses = np.maximum(base["Expenses"] - variable_cost_ratio[:, :1] * base["Revenue"], 0.0)
+    expenses = fixed_expenses * expense_factor + (variable_cost_ratio - rate_matrix(margin_shock, scenarios, periods)) * revenue
+    profit = revenue - expenses
+
+    assets = base["Assets"] * asset_factor
+    liabilities = base["Liabilities"] * liability_factor
+    equity = base["Equity"] + np.cumsum(profit * rate_matrix(retention_ratio, scenarios, periods), axis=1)
+
+    return {
+        "Revenue": revenue,
+        "Expenses": expenses,
+        "Assets": assets,
+        "Liabilities": liabilities,
+        "Equity": equity,
+        "Profit": profit,
+        "Net Assets": assets - liabilities,
+    }
+
+
+# Function to summarize a (scenarios, periods) series per period across scenarios
+def scenario_percentiles(series, percentiles=(5, 50, 95)):
+    return {p: np.percentile(series, p, axis=0) for p in percentiles}
@@ -1,7 +1,27 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import os
+import time
+from bulk_ratios import (DEFAULT_TOP_ROWS, OUTPUT_FORMATS, RATIO_COLUMNS, analyze_portfolio, list_server_portfolios, new_results_path,
+                         server_portfolio_path)
+from interactive_charts import cached_figure, line_trace, paths_trace
+from financial_engine import compute_ratios, per_period_rate, project_financials, scenario_percentiles, scenario_range
+from monte_carlo import DEFAULT_DRIVERS, DISTRIBUTIONS, simulate
+
+# Ratios shown by ratio_analysis, in display order
+RATIO_NAMES = [
+    "Current Ratio",
+    "Debt-to-Equity Ratio",
+    "Profit Margin",
+    "Return on Assets (ROA)",
+    "Return on Equity (ROE)",
+    "Gross Profit Margin",
+    "Operating Margin",
+    "Net Profit Margin",
+]
 
 # Function to gather and process financial data
 def financial_modeling():
@@ -45,21 +65,9 @@ def financial_modeling():
 
 # Function to calculate and analyze financial ratios with more advanced metrics
 def calculate_ratios(financial_data):
-    ratios = {}
-
-    # Calculate common financial ratios with conditional formatting and validation
-    ratios["Current Ratio"] = financial_data["Assets"] / financial_data["Liabilities"] if financial_data["Liabilities"] > 0 else float('inf')
-    ratios["Debt-to-Equity Ratio"] = financial_data["Liabilities"] / financial_data["Equity"] if financial_data["Equity"] > 0 else float('inf')
-    ratios["Profit Margin"] = financial_data["Profit"] / financial_data["Revenue"] if financial_data["Revenue"] > 0 else 0.0
-    ratios["Return on Assets (ROA)"] = financial_data["Profit"] / financial_data["Assets"] if financial_data["Assets"] > 0 else 0.0
-    ratios["Return on Equity (ROE)"] = financial_data["Profit"] / financial_data["Equity"] if financial_data["Equity"] > 0 else 0.0
-
-    # Add more advanced financial metrics
-    ratios["Gross Profit Margin"] = (financial_data["Revenue"] - financial_data["Expenses"]) / financial_data["Revenue"] if financial_data["Revenue"] > 0 else 0.0
-    ratios["Operating Margin"] = (financial_data["Profit"]) / financial_data["Revenue"] if financial_data["Revenue"] > 0 else 0.0
-    ratios["Net Profit Margin"] = (financial_data["Profit"]) / financial_data["Revenue"] if financial_data["Revenue"] > 0 else 0.0
-
-    return ratios
+    # Ratios are computed as whole-array operations in financial_engine; this is the single-company view
+    ratios = compute_ratios(financial_data)
+    return {name: float(ratios[name]) for name in RATIO_NAMES}
 
 # Function to display and interpret financial ratios
 def ratio_analysis(financial_data):
@@ -112,82 +120,175 @@ def financial_charts(financial_data):
     st.markdown("### Financial Charts")
 
     # Revenue vs Expenses Bar Chart
-    df = pd.DataFrame({
-        "Category": ["Revenue", "Expenses"],
-        "Amount": [financial_data["Revenue"], financial_data["Expenses"]]
-    })
-
-    fig = px.bar(df, x="Category", y="Amount", title="Revenue vs Expenses", text_auto=True)
-    fig.update_traces(texttemplate='$%{text:.2s}', textposition='outside')
-    fig.update_layout(
-        title="Revenue vs Expenses",
-        xaxis_title="Category",
-        yaxis_title="Amount ($)",
-        font=dict(
-            family="Courier New, monospace",
-            size=18,
-            color="RebeccaPurple"
+    def revenue_vs_expenses_figure():
+        df = pd.DataFrame({
+            "Category": ["Revenue", "Expenses"],
+            "Amount": [financial_data["Revenue"], financial_data["Expenses"]]
+        })
+
+        fig = px.bar(df, x="Category", y="Amount", title="Revenue vs Expenses", text_auto=True)
+        fig.update_traces(texttemplate='$%{text:.2s}', textposition='outside')
+        fig.update_layout(
+            title="Revenue vs Expenses",
+            xaxis_title="Category",
+            yaxis_title="Amount ($)",
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="RebeccaPurple"
+            )
         )
-    )
+        return fig
+
+    # Figures are rebuilt only when the numbers they show change
+    fig = cached_figure("revenue_vs_expenses", (financial_data["Revenue"], financial_data["Expenses"]), revenue_vs_expenses_figure)
     st.plotly_chart(fig, use_container_width=True)
 
+    # Scenario analysis: either the fixed Best/Worst multipliers or a Monte Carlo simulation
+    scenario_mode = st.radio("Scenario Mode", ["Fixed Multipliers", "Monte Carlo"], horizontal=True)
+    if scenario_mode == "Monte Carlo":
+        monte_carlo_analysis(financial_data)
+        return
+
     # Profit and Equity Over Time (Scenario Analysis) Line Chart
-    scenario_data = {
-        "Scenario": ["Base Case", "Best Case", "Worst Case"],
-        "Profit": [financial_data["Profit"] * 1, financial_data["Profit"] * 1.2, financial_data["Profit"] * 0.8],
-        "Equity": [financial_data["Equity"] * 1, financial_data["Equity"] * 1.2, financial_data["Equity"] * 0.8]
-    }
-    df_scenario = pd.DataFrame(scenario_data)
+    def scenario_figure():
+        scenario_data = {
+            "Scenario": ["Base Case", "Best Case", "Worst Case"],
+            "Profit": [financial_data["Profit"] * 1, financial_data["Profit"] * 1.2, financial_data["Profit"] * 0.8],
+            "Equity": [financial_data["Equity"] * 1, financial_data["Equity"] * 1.2, financial_data["Equity"] * 0.8]
+        }
+        df_scenario = pd.DataFrame(scenario_data)
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Scatter(x=df_scenario["Scenario"], y=df_scenario["Profit"],
+                                 mode='lines+markers', name='Profit',
+                                 line=dict(color='firebrick', width=4)))
+
+        fig.add_trace(go.Scatter(x=df_scenario["Scenario"], y=df_scenario["Equity"],
+                                 mode='lines+markers', name='Equity',
+                                 line=dict(color='royalblue', width=4)))
+
+        fig.update_layout(
+            title='Scenario Analysis: Profit and Equity',
+            xaxis_title='Scenario',
+            yaxis_title='Amount ($)',
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="RebeccaPurple"
+            ),
+            hovermode="x unified"
+        )
+        return fig
 
-    fig = go.Figure()
+    fig = cached_figure("scenario_analysis", (financial_data["Profit"], financial_data["Equity"]), scenario_figure)
+    st.plotly_chart(fig, use_container_width=True)
 
-    fig.add_trace(go.Scatter(x=df_scenario["Scenario"], y=df_scenario["Profit"],
-                             mode='lines+markers', name='Profit',
-                             line=dict(color='firebrick', width=4)))
-    
-    fig.add_trace(go.Scatter(x=df_scenario["Scenario"], y=df_scenario["Equity"],
-                             mode='lines+markers', name='Equity',
-                             line=dict(color='royalblue', width=4)))
-
-    fig.update_layout(
-        title='Scenario Analysis: Profit and Equity',
-        xaxis_title='Scenario',
-        yaxis_title='Amount ($)',
-        font=dict(
-            family="Courier New, monospace",
-            size=18,
-            color="RebeccaPurple"
-        ),
-        hovermode="x unified"
-    )
-    
+# Input widgets for one Monte Carlo driver distribution
+def distribution_input(label, key, default):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        distribution = st.selectbox(f"{label} Distribution", DISTRIBUTIONS, key=f"{key}_distribution")
+    if distribution in ("normal", "lognormal"):
+        with col2:
+            mean = st.number_input(f"{label} Mean (%)", value=default["mean"] * 100, step=0.5, key=f"{key}_mean")
+        with col3:
+            std = st.number_input(f"{label} Std Dev (%)", min_value=0.0, value=default["std"] * 100, step=0.5, key=f"{key}_std")
+        return {"distribution": distribution, "mean": mean / 100, "std": std / 100}
+
+    with col2:
+        low = st.number_input(f"{label} Low (%)", value=(default["mean"] - 2 * default["std"]) * 100, step=0.5, key=f"{key}_low")
+    with col3:
+        high = st.number_input(f"{label} High (%)", value=(default["mean"] + 2 * default["std"]) * 100, step=0.5, key=f"{key}_high")
+    spec = {"distribution": distribution, "low": low / 100, "high": max(high, low) / 100}
+    if distribution == "triangular":
+        spec["mode"] = (spec["low"] + spec["high"]) / 2
+    return spec
+
+
+# Monte Carlo scenario analysis with P5/P50/P95 bands
+def monte_carlo_analysis(financial_data):
+    st.markdown("#### Monte Carlo Simulation")
+    drivers = {
+        "revenue_growth": distribution_input("Revenue Growth", "mc_revenue_growth", DEFAULT_DRIVERS["revenue_growth"]),
+        "expense_growth": distribution_input("Expense Growth", "mc_expense_growth", DEFAULT_DRIVERS["expense_growth"]),
+        "margin_shock": distribution_input("Margin Shock", "mc_margin_shock", DEFAULT_DRIVERS["margin_shock"]),
+    }
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        paths = st.number_input("Paths", min_value=1000, max_value=5_000_000, value=1_000_000, step=100_000)
+    with col2:
+        periods = st.number_input("Years", min_value=1, max_value=30, value=5, step=1)
+    with col3:
+        seed = st.number_input("Random Seed", min_value=0, value=42, step=1)
+
+    # Simulations only rerun on request, not on every widget change
+    if st.button("Run Simulation"):
+        start = time.perf_counter()
+        with st.spinner("Simulating paths..."):
+            st.session_state["monte_carlo_result"] = simulate(financial_data, int(paths), periods=int(periods), drivers=drivers, seed=int(seed))
+        st.session_state["monte_carlo_seconds"] = time.perf_counter() - start
+
+    result = st.session_state.get("monte_carlo_result")
+    if not result:
+        return
+
+    seconds = st.session_state["monte_carlo_seconds"]
+    st.caption(f"{result['paths']:,} paths in {seconds:.2f}s ({result['paths'] / seconds:,.0f} paths/sec)")
+
+    def bands_figure():
+        fig = go.Figure()
+        for name, color in (("Profit", "firebrick"), ("Equity", "royalblue")):
+            bands = result["bands"][name]
+            x = np.arange(1, len(bands[50]) + 1)
+            fig.add_trace(line_trace(x, bands[95], mode='lines', line=dict(width=0), showlegend=False, name=f'{name} P95'))
+            fig.add_trace(line_trace(x, bands[5], mode='lines', line=dict(width=0), fill='tonexty', name=f'{name} P5-P95', opacity=0.3))
+            fig.add_trace(line_trace(x, bands[50], mode='lines+markers' if len(x) <= 60 else 'lines', name=f'{name} P50',
+                                     line=dict(color=color, width=4)))
+        fig.update_layout(
+            title='Monte Carlo: Profit and Equity Bands',
+            xaxis_title='Year',
+            yaxis_title='Amount ($)',
+            hovermode="x unified"
+        )
+        return fig
+
+    fig = cached_figure("monte_carlo_bands", result["bands"], bands_figure)
     st.plotly_chart(fig, use_container_width=True)
 
+    st.markdown("##### Final-Year Percentiles")
+    st.dataframe(pd.DataFrame([
+        {"Metric": name, "P5": values[5], "P50": values[50], "P95": values[95]}
+        for name, values in result["final"].items()
+    ]), use_container_width=True)
+
 # Additional in-depth financial metrics analysis
 def advanced_metrics_analysis(financial_data):
     st.markdown("### Advanced Metrics Analysis")
+    metrics = compute_ratios(financial_data)
     
     # More detailed financial analysis
     col1, col2 = st.columns(2)
     
     with col1:
         st.write("#### Financial Leverage")
-        financial_leverage = financial_data["Assets"] / financial_data["Equity"] if financial_data["Equity"] > 0 else float('inf')
+        financial_leverage = float(metrics["Financial Leverage"])
         st.write(f"Financial Leverage: {financial_leverage:.2f}")
 
         st.write("#### Efficiency Ratios")
-        asset_turnover = financial_data["Revenue"] / financial_data["Assets"] if financial_data["Assets"] > 0 else 0.0
+        asset_turnover = float(metrics["Asset Turnover"])
         st.write(f"Asset Turnover: {asset_turnover:.2f}")
         
-        equity_multiplier = financial_data["Assets"] / financial_data["Equity"] if financial_data["Equity"] > 0 else float('inf')
+        equity_multiplier = float(metrics["Equity Multiplier"])
         st.write(f"Equity Multiplier: {equity_multiplier:.2f}")
 
     with col2:
         st.write("#### Dupont Analysis")
-        roe_dupont = financial_data["Profit"] / financial_data["Equity"] if financial_data["Equity"] > 0 else 0.0
+        roe_dupont = float(metrics["Return on Equity (ROE)"])
         st.write(f"ROE (Dupont Analysis): {roe_dupont:.2%}")
         
-        roa_dupont = financial_data["Profit"] / financial_data["Assets"] if financial_data["Assets"] > 0 else 0.0
+        roa_dupont = float(metrics["Return on Assets (ROA)"])
         st.write(f"ROA (Dupont Analysis): {roa_dupont:.2%}")
 
     # Interpretations of advanced metrics
@@ -207,6 +308,144 @@ def advanced_metrics_analysis(financial_data):
     else:
         st.write("Equity Multiplier is within a safe range.")
 
+# Multi-period, multi-scenario projection driven by growth and cost assumptions
+def projection_analysis(financial_data):
+    st.markdown("### Multi-Period Projection")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        years = st.number_input("Projection Years", min_value=1, max_value=30, value=10, step=1)
+        frequency = st.selectbox("Period", ["Monthly", "Annual"])
+        scenarios = st.number_input("Scenarios", min_value=1, max_value=1000, value=200, step=50, help="Scenarios are spread evenly between the low and high growth assumptions.")
+    with col2:
+        revenue_growth_low = st.number_input("Revenue Growth Low (%/yr)", value=0.0, step=1.0)
+        revenue_growth_high = st.number_input("Revenue Growth High (%/yr)", value=20.0, step=1.0)
+        expense_growth = st.number_input("Fixed Cost Growth (%/yr)", value=5.0, step=1.0)
+    with col3:
+        variable_cost_ratio = st.number_input("Variable Cost Ratio (% of revenue)", min_value=0.0, max_value=100.0, value=0.0, step=1.0)
+        asset_growth = st.number_input("Asset Growth (%/yr)", value=3.0, step=1.0)
+        liability_growth = st.number_input("Liability Growth (%/yr)", value=0.0, step=1.0)
+
+    periods_per_year = 12 if frequency == "Monthly" else 1
+    periods = int(years) * periods_per_year
+
+    start = time.perf_counter()
+    revenue_growth = scenario_range(revenue_growth_low / 100, revenue_growth_high / 100, int(scenarios))
+    projection = project_financials(
+        financial_data,
+        periods,
+        scenarios=int(scenarios),
+        revenue_growth=per_period_rate(revenue_growth, periods_per_year),
+        expense_growth=per_period_rate(expense_growth / 100, periods_per_year),
+        variable_cost_ratio=variable_cost_ratio / 100,
+        asset_growth=per_period_rate(asset_growth / 100, periods_per_year),
+        liability_growth=per_period_rate(liability_growth / 100, periods_per_year),
+    )
+    ratios = compute_ratios(projection)
+    profit_bands = scenario_percentiles(projection["Profit"])
+    elapsed = time.perf_counter() - start
+
+    st.caption(f"Projected {int(scenarios)} scenarios x {periods} periods in {elapsed * 1000:.1f} ms")
+
+    show_paths = st.checkbox("Show individual scenarios", value=False)
+
+    # Lines are downsampled to the chart width, so the figure stays the same size however many periods there are
+    def projection_figure():
+        fig = go.Figure()
+        x = np.arange(1, periods + 1)
+        if show_paths:
+            fig.add_trace(paths_trace(x, projection["Profit"], mode='lines', name='Scenarios', opacity=0.25,
+                                      line=dict(color='slategray', width=1), hoverinfo='skip'))
+        fig.add_trace(line_trace(x, profit_bands[95], mode='lines', name='Profit P95', line=dict(color='seagreen')))
+        fig.add_trace(line_trace(x, profit_bands[50], mode='lines', name='Profit P50', line=dict(color='firebrick', width=3)))
+        fig.add_trace(line_trace(x, profit_bands[5], mode='lines', name='Profit P5', line=dict(color='darkorange')))
+        fig.update_layout(
+            title='Projected Profit Across Scenarios',
+            xaxis_title=f'Period ({frequency.lower()})',
+            yaxis_title='Amount ($)',
+            hovermode="x unified"
+        )
+        return fig
+
+    figure_inputs = (frequency, show_paths, profit_bands, projection["Profit"] if show_paths else None)
+    fig = cached_figure("projection", figure_inputs, projection_figure)
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Ratios for the median scenario in the final period
+    median_scenario = int(scenarios) // 2
+    st.markdown("#### Final-Period Ratios (Median Scenario)")
+    st.dataframe(pd.DataFrame({
+        "Ratio": list(ratios),
+        "Value": [float(values[median_scenario, -1]) for values in ratios.values()]
+    }), use_container_width=True)
+
+# Bulk ratio analysis over an uploaded portfolio of entities
+def bulk_ratio_analysis():
+    st.markdown("### Portfolio Ratio Analysis")
+    st.markdown("Upload a CSV or Parquet file with Revenue, Expenses, Assets, Liabilities and Equity columns (Profit is optional).")
+
+    portfolio_file = st.file_uploader("Portfolio File", type=["csv", "parquet"])
+    # Server-side files can only be picked from PORTFOLIO_DATA_DIR, by name
+    server_files = list_server_portfolios()
+    portfolio_name = st.selectbox("...or a file on the server", ["(none)"] + server_files) if server_files else "(none)"
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_by = st.selectbox("Sort By", RATIO_COLUMNS, index=RATIO_COLUMNS.index("Return on Equity (ROE)"))
+        ascending = st.checkbox("Ascending", value=False)
+    with col2:
+        filter_column = st.selectbox("Filter On", ["(none)"] + RATIO_COLUMNS)
+        top_n = st.number_input("Rows to Display", min_value=10, max_value=10000, value=DEFAULT_TOP_ROWS, step=100)
+    with col3:
+        filter_min = st.number_input("Minimum Value", value=0.0, disabled=filter_column == "(none)")
+        filter_max = st.number_input("Maximum Value", value=1000.0, disabled=filter_column == "(none)")
+    output_format = st.radio("Results File Format", OUTPUT_FORMATS, format_func=str.upper, horizontal=True)
+
+    if st.button("Analyze Portfolio") and (portfolio_file or portfolio_name != "(none)"):
+        progress_text = st.empty()
+
+        # Results stream into a temp file on disk, replacing this session's previous one; only the displayed
+        # rows stay in memory. Files left by sessions that have gone are removed after a while.
+        previous = st.session_state.get("portfolio_result")
+        output_path = new_results_path(output_format, replaces=previous[2] if previous else None)
+        start = time.perf_counter()
+        try:
+            source = portfolio_file if portfolio_file else server_portfolio_path(portfolio_name)
+            file_name = portfolio_file.name if portfolio_file else portfolio_name
+            top_rows, summary = analyze_portfolio(
+                source,
+                file_name,
+                output_path,
+                output_format=output_format,
+                sort_by=sort_by,
+                ascending=ascending,
+                top_n=int(top_n),
+                filter_column=None if filter_column == "(none)" else filter_column,
+                filter_min=filter_min,
+                filter_max=filter_max,
+                on_chunk=lambda rows: progress_text.text(f"Processed {rows:,} rows..."),
+            )
+        except ValueError as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            st.session_state.pop("portfolio_result", None)
+            st.error(f"Could not analyze the portfolio: {str(e)}")
+            return
+        summary["seconds"] = time.perf_counter() - start
+        st.session_state["portfolio_result"] = (top_rows, summary, output_path)
+        progress_text.empty()
+
+    if "portfolio_result" in st.session_state:
+        top_rows, summary, output_path = st.session_state["portfolio_result"]
+        st.caption(f"{summary['rows_processed']:,} rows analyzed, {summary['rows_matched']:,} matched the filter, in {summary['seconds']:.2f}s")
+        st.dataframe(top_rows, use_container_width=True)
+        if os.path.exists(output_path):
+            with open(output_path, "rb") as results_file:
+                st.download_button(label="Download All Results", data=results_file,
+                                   file_name=f"portfolio_ratios{os.path.splitext(output_path)[1]}")
+        else:
+            st.caption("The full results file has expired; analyze the portfolio again to download it.")
+
 # Main Financial Modeling Page with enhanced UI and functionality
 def financial_modeling_page():
     st.markdown("""
@@ -228,4 +467,10 @@ def financial_modeling_page():
     # Display graphical representations with scenario analysis
     financial_charts(financial_data)
 
+    # Project the figures forward across growth scenarios
+    projection_analysis(financial_data)
+
+    # Analyze a whole portfolio of entities at once
+    bulk_ratio_analysis()
+
 
@@ -0,0 +1,358 @@
+import secrets
+import time
+import uuid
+
+import streamlit as st
+
+from document_generator import DOCUMENT_SECTIONS
+from job_runner import ACTIVE_STATUSES, get_job_runner, job_result
+from document_model import update_section
+from document_store import get_document_store, owner_for_key
+from llm_cache import get_cache
+from prompt_builder import get_usage_stats, savings_report
+from rate_limiter import get_rate_limiter
+
+# Seconds between progress checks while a generation job is running
+JOB_POLL_SECONDS = 0.5
+
+
+# Function to get this browser session's key: its API calls queue under it
+def session_key():
+    return st.session_state.setdefault("rate_limit_session", uuid.uuid4().hex)
+
+
+# Function to get the key of the workspace this session's documents are saved in. It is kept in the page's
+# address, so a refresh or a server restart comes back to the same documents, and the address (or the key
+# entered on another browser) opens them anywhere.
+def workspace_key():
+    key = st.session_state.get("workspace_key") or st.query_params.get("workspace") or secrets.token_urlsafe(16)
+    st.session_state["workspace_key"] = key
+    if st.query_params.get("workspace") != key:
+        st.query_params["workspace"] = key
+    return key
+
+
+# Function to get the owner this session's documents are stored under
+def document_owner():
+    return owner_for_key(workspace_key())
+
+
+# Function to open a stored document in the editor (default: its latest version)
+def open_document(document_id, version=None):
+    st.session_state["document_id"] = document_id
+    st.session_state["document_version"] = version or get_document_store().get(document_owner(), document_id)["head_version"]
+    # Editor widgets are keyed on what was opened, so another document or version doesn't inherit the last one's edits
+    st.session_state["document_key"] = uuid.uuid4().hex[:8]
+
+
+# Function to describe one export call for the export caption
+def describe_export(info):
+    if info["cached"]:
+        return "cached"
+    return f"built, {info['fragments_built']} sections laid out, {info['fragments_reused']} reused"
+
+
+# Home page: the business document generator
+def home_page():
+    st.title("Welcome to the Business Tool")
+    
+    # Main content
+    st.title("Use **ME** to create your **Business Documents**")
+    st.markdown("### Enter Business Information")
+
+    # Document type selection
+    document_type = st.selectbox(
+        "Select Document Type",
+        ["Business Plan", "Feasibility Study", "Application Form", "Pitch Deck"]
+    )
+
+    # Create a 2-column layout for the input fields
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        language = st.selectbox("Language", ["UK English", "US English"])
+        writing_person = st.selectbox("Writing Person", ["1st Person", "3rd Person"])
+        writing_style = st.selectbox("Writing Style", ["Formal", "Informal"])
+
+    with col2:
+        document_length = st.selectbox("Length of Document", ["Short", "Long"])
+        template = st.selectbox("Template", ["Standard", "IDC", "NEF", "Custom"])
+        business_type = st.selectbox("Business Type", ["Start-up", "Expansion", "Acquisition"])
+
+    with col3:
+        bee_level = st.selectbox("BEE Level", ["Level 1", "Level 2", "Level 3", "Level 4"])
+        directors = st.text_input("Directors/Shareholders", placeholder="Enter names")
+        staffing = st.text_input("Staffing Compliment", placeholder="Enter staffing details")
+
+    col4, col5, col6 = st.columns(3)
+
+    with col4:
+        funding_amount = st.text_input("Funding Amount", placeholder="Enter amount")
+
+    with col5:
+        grant_amount = st.text_input("Grant Amount", placeholder="Enter amount")
+
+    with col6:
+        finance_term = st.text_input("Finance Term", placeholder="Enter term")
+
+    # Single column for the business overview and generate button
+    business_overview = st.text_area("Your Business Overview...", placeholder="Enter a brief overview of your business")
+    st.markdown("<br>", unsafe_allow_html=True)  # Add some space
+
+    # Generated documents live in the document store (see document_store); the session only keeps
+    # which document and version it has open, and the editor works on one section at a time.
+    # The store only shows a workspace its own documents; another workspace can get a copy by opening the job.
+    store = get_document_store()
+    owner = document_owner()
+
+    generate_button = st.button(f"Generate {document_type}")
+    regenerate = st.checkbox("Regenerate anyway (ignore cached sections)", value=False)
+    stream_sections = st.checkbox("Show sections as they are written", value=True)
+
+    # Generation runs as a background job; the page only polls it, so a rerun or a dropped
+    # connection doesn't lose the work and the job can be reopened by ID
+    runner = get_job_runner()
+
+    # Only this session's own jobs are listed; another session's job can be opened by its ID
+    with st.expander("Open a previous generation job"):
+        recent_jobs = [job for job in map(runner.get, reversed(st.session_state.get("job_ids", []))) if job]
+        if recent_jobs:
+            job_labels = {
+                job["id"]: f"{job['id']} - {job['document_type']} - {job['status']} ({job['completed']}/{job['total']} sections) - "
+                           f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at']))}"
+                for job in recent_jobs
+            }
+            selected_job = st.selectbox("Recent jobs", list(job_labels), format_func=job_labels.get)
+        else:
+            selected_job = None
+        typed_job = st.text_input("Or enter a job ID")
+        if st.button("Open job"):
+            st.session_state["job_id"] = typed_job.strip() or selected_job
+            st.session_state["job_loaded"] = False
+
+    with st.expander("Your documents"):
+        query = st.text_input("Search documents", placeholder="Words from the title or text")
+        found = store.search(owner, query)
+        if found:
+            document_labels = {
+                document["id"]: f"{document['title']} - version {document['head_version']} - "
+                                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(document['updated_at']))}"
+                for document in found
+            }
+            selected_document = st.selectbox("Documents", list(document_labels), format_func=document_labels.get)
+            # Only the version list is read here; a version's sections are loaded when it is opened
+            version_labels = {
+                version["version"]: f"Version {version['version']} ({version['note']}, {version['changed']} sections changed) - "
+                                    f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(version['created_at']))}"
+                for version in store.versions(owner, selected_document)
+            }
+            selected_version = st.selectbox("Version", list(version_labels), format_func=version_labels.get)
+            if st.button("Open document"):
+                open_document(selected_document, selected_version)
+        else:
+            st.write("No documents found.")
+
+        typed_document = st.text_input("Or enter a document ID").strip()
+        # Documents saved before workspaces belong to no one until they are opened by ID
+        if st.button("Open document by ID") and typed_document:
+            if store.get(owner, typed_document) or store.claim(owner, typed_document):
+                open_document(typed_document)
+            else:
+                st.error(f"No document {typed_document} in this workspace")
+
+        st.caption(
+            f"Workspace key: {workspace_key()}. Your documents are kept for this workspace; bookmark this page, "
+            "or enter the key on another browser, to get back to them."
+        )
+        typed_workspace = st.text_input("Switch to workspace", placeholder="Workspace key").strip()
+        if st.button("Switch workspace") and typed_workspace:
+            st.session_state["workspace_key"] = typed_workspace
+            st.query_params["workspace"] = typed_workspace
+            st.session_state["document_id"] = None
+            st.rerun()
+
+    inputs = {
+        "document_type": document_type,
+        "language": language,
+        "writing_person": writing_person,
+        "writing_style": writing_style,
+        "document_length": document_length,
+        "template": template,
+        "business_type": business_type,
+        "bee_level": bee_level,
+        "directors": directors,
+        "staffing": staffing,
+        "funding_amount": funding_amount,
+        "grant_amount": grant_amount,
+        "finance_term": finance_term,
+        "business_overview": business_overview
+    }
+
+    # Handle generation and editing
+    if generate_button and business_overview:
+        # A document already generated from the same inputs is read back instead of generated again
+        previous_document = None if regenerate else store.find_by_inputs(owner, inputs)
+        if previous_document:
+            open_document(previous_document)
+            st.info("Opened the document generated earlier from these inputs; tick \"Regenerate anyway\" for a new one.")
+        else:
+            st.session_state["job_id"] = runner.submit(inputs, bypass_cache=regenerate, stream=stream_sections, session_key=session_key())
+            st.session_state.setdefault("job_ids", []).append(st.session_state["job_id"])
+            st.session_state["job_loaded"] = False
+
+    job_id = st.session_state.get("job_id")
+    if job_id and not st.session_state.get("job_loaded"):
+        job = runner.get(job_id)
+        if job is None:
+            st.error(f"No generation job with ID {job_id}")
+            st.session_state["job_id"] = None
+        else:
+            st.info(f"Generation job ID: {job_id} (use it to reopen this document if you lose the page)")
+            job_sections = DOCUMENT_SECTIONS[job["document_type"]]
+
+            # Show per-section progress while the job's sections are generated concurrently
+            progress_bar = st.progress(0)
+            progress_text = st.empty()
+            # Finished and streamed sections are written into one placeholder per section, in section order
+            section_placeholders = [st.empty() for _ in job_sections]
+            shown_text = [None] * len(job_sections)
+
+            def show_job(job):
+                progress_bar.progress(job["completed"] / job["total"])
+                queued_calls = get_rate_limiter().stats()["queue_depth"]
+                progress_text.text(
+                    f"{job['document_type']}: {job['completed']}/{job['total']} sections ({job['status']}, "
+                    f"{queued_calls} API calls queued on this server)"
+                )
+                streamed = runner.streamed_text(job["id"])
+                for index, section in enumerate(job_sections):
+                    if index in job["sections"]:
+                        text = job["sections"][index]["text"]
+                    else:
+                        text = streamed.get(index)
+                    if text and text != shown_text[index]:
+                        shown_text[index] = text
+                        section_placeholders[index].markdown(f"#### {section}\n\n{text}")
+
+            if job["status"] in ("failed", "interrupted"):
+                st.error(f"An error occurred: {job['error']}")
+                if st.button("Resume job"):
+                    runner.resume(job_id, session_key())
+                    job = runner.get(job_id)
+
+            was_running = job["status"] in ACTIVE_STATUSES
+            with st.spinner(f"Generating your {job['document_type']}..."):
+                while job["status"] in ACTIVE_STATUSES:
+                    show_job(job)
+                    time.sleep(JOB_POLL_SECONDS)
+                    job = runner.get(job_id)
+            show_job(job)
+
+            if job["status"] == "done":
+                document, section_stats = job_result(job)
+                st.session_state["section_stats"] = section_stats
+
+                # The editor below takes over from the preview
+                progress_bar.empty()
+                progress_text.empty()
+                for placeholder in section_placeholders:
+                    placeholder.empty()
+
+                # Reopening a job doesn't store its document twice
+                document_id = store.find_by_job(owner, job_id)
+                if document_id is None:
+                    overview = " ".join(job["inputs"]["business_overview"].split())[:60]
+                    document_id = store.create(owner, document, job["document_type"], job["inputs"], f"{job['document_type']}: {overview}", job_id)
+                open_document(document_id)
+                st.session_state["job_loaded"] = True
+
+                cache_stats = get_cache().stats()
+                st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+            elif was_running:
+                st.error(f"An error occurred: {job['error']}")
+
+    # Only display editing and downloading options if a document is open
+    document_id = st.session_state.get("document_id")
+    document_info = store.get(owner, document_id) if document_id else None
+    if document_info:
+        # Charts and exports need matplotlib, python-docx and fpdf; import them only once there is a document
+        from chart_renderer import render_charts
+        from document_export import export_document
+
+        # Each section has its own editor; an edit rehashes only that section, and its charts come
+        # from the chart cache
+        document_type = document_info["document_type"]
+        st.markdown(f"### Edit Your {document_type}")
+        version = st.session_state["document_version"]
+        document = store.load(owner, document_id, version)
+        opened_hashes = [section["hash"] for section in document]
+        for index, section in enumerate(document):
+            with st.expander(section["title"] or "Untitled section", expanded=index == 0):
+                edited_text = st.text_area(
+                    section["title"] or "Untitled section",
+                    value=section["text"],
+                    height=300,
+                    key=f"section-{st.session_state.get('document_key')}-{index}",
+                    label_visibility="collapsed",
+                )
+                document[index] = update_section(section, edited_text)
+                for png in render_charts(section["charts"]):
+                    st.image(png)
+
+        # Edits are saved as a new version holding only the changed sections
+        if [section["hash"] for section in document] != opened_hashes:
+            version = st.session_state["document_version"] = store.save_version(owner, document_id, document, parent=version)
+        st.caption(f"{document_info['title']} - document {document_id}, version {version}")
+        # Measuring the store reads every stored section, so it is only done when asked for
+        if st.button("Show document store size"):
+            store_stats = store.stats()
+            st.caption(
+                f"Document store: {store_stats['documents']} documents, {store_stats['versions']} versions, "
+                f"{store_stats['raw_bytes'] / 1024:,.0f} KiB of text in {store_stats['stored_bytes'] / 1024:,.0f} KiB"
+            )
+
+        # Per-section generation timings from the last run
+        if st.session_state.get("section_stats"):
+            with st.expander("Section generation timings"):
+                st.table([
+                    {
+                        "Section": stats["section"],
+                        "Cached": stats["cached"],
+                        "Time to first token (s)": round(stats["time_to_first_token"], 2),
+                        "Total (s)": round(stats["elapsed"], 2),
+                        "Tokens/sec": round(stats["tokens_per_second"], 1),
+                        "Prompt tokens": stats.get("prompt_tokens", 0),
+                        "Completion tokens": stats["completion_tokens"],
+                        "Max tokens": stats.get("max_tokens", 0),
+                    }
+                    for stats in st.session_state["section_stats"]
+                ])
+
+            # Legacy prompts and fixed limits vs the prompt builder, for the inputs currently on the form
+            with st.expander("Token budget and estimated savings"):
+                st.table([
+                    {
+                        "Document type": row["document_type"],
+                        "Prompt tokens (before)": row["legacy_prompt_tokens"],
+                        "Prompt tokens": row["prompt_tokens"],
+                        "Max completion tokens (before)": row["legacy_max_completion_tokens"],
+                        "Max completion tokens": row["max_completion_tokens"],
+                        "Worst-case cost saved ($)": round(row["cost_saved"], 2),
+                    }
+                    for row in savings_report(inputs, DOCUMENT_SECTIONS, get_usage_stats())
+                ])
+
+        # Options to download the document in various formats
+        # Exports are memoized on the section hashes, and after an edit only the edited section is laid out again
+        # The exports are cached as files on disk, but st.download_button reads the file it is given into memory,
+        # where Streamlit keeps it for the session until the next rerun
+        docx_file, docx_info = export_document("docx", document)
+        with docx_file:
+            docx_download = st.download_button(label="Download DOCX", data=docx_file, file_name=f"{document_type.replace(' ', '_')}.docx")
+        pdf_file, pdf_info = export_document("pdf", document)
+        with pdf_file:
+            pdf_download = st.download_button(label="Download PDF", data=pdf_file, file_name=f"{document_type.replace(' ', '_')}.pdf")
+        st.caption(
+            f"Export time this rerun: {(docx_info['seconds'] + pdf_info['seconds']) * 1000:.1f} ms "
+            f"(DOCX {describe_export(docx_info)}; PDF {describe_export(pdf_info)})"
+        )
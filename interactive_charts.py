@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+from metrics import increment
+
+# Plotly figures whose size doesn't grow with the data behind them.
+# A line never needs more points than the chart has pixel columns, so long series are downsampled to
+# CHART_PIXEL_WIDTH before they go into the figure: min/max per column by default (every peak and dip
+# survives), or LTTB (largest triangle three buckets) for smoother lines. Long series are drawn with
+# WebGL (Scattergl) rather than SVG. Built figures are cached on a hash of their input
+# data, so a rerun with unchanged inputs doesn't rebuild or re-validate them.
+CHART_PIXEL_WIDTH = int(os.getenv("CHART_PIXEL_WIDTH", "1200"))
+CHART_DOWNSAMPLE_METHOD = os.getenv("CHART_DOWNSAMPLE_METHOD", "minmax")
+# Traces with more points than this are drawn with WebGL; small ones stay SVG
+CHART_WEBGL_MIN_POINTS = int(os.getenv("CHART_WEBGL_MIN_POINTS", "1000"))
+# Most scenario paths drawn in one chart; more are thinned evenly
+CHART_MAX_PATHS = int(os.getenv("CHART_MAX_PATHS", "100"))
+FIGURE_CACHE_MAX_ENTRIES = int(os.getenv("FIGURE_CACHE_MAX_ENTRIES", "32"))
+
+DOWNSAMPLE_METHODS = ("minmax", "lttb")
+
+
+# Function to pick the lowest and highest point in each of `buckets` equal slices of y (plus the
+# first and last point); returns sorted indexes
+def minmax_indices(y, buckets):
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    count = -(-n // size)
+    # Pad the last slice with its last value so the slices can be one 2-D array
+    padded = np.concatenate([y, np.repeat(y[-1:], count * size - n)]).reshape(count, size)
+    offsets = np.arange(count) * size
+    indices = np.concatenate([[0, n - 1], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+# Function to pick `threshold` points with the largest-triangle-three-buckets algorithm; returns indexes
+def lttb_indices(x, y, threshold):
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # The point making the largest triangle with the previous pick and the next bucket's average
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[selected] - next_x) * (y[start:end] - y[selected]) - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(np.argmax(area))
+        indices[bucket + 1] = selected
+    return indices
+
+
+# Function to choose which points of a series to draw at `width` pixels
+def downsample_indices(x, y, width=CHART_PIXEL_WIDTH, method=CHART_DOWNSAMPLE_METHOD):
+    if method == "lttb":
+        if np.issubdtype(x.dtype, np.datetime64):
+            x = x.astype("datetime64[ns]").astype(np.int64)
+        return lttb_indices(x.astype(float), y, 2 * width)
+    if method == "minmax":
+        return minmax_indices(y, width)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+# Function to build a line trace of (x, y) downsampled to the chart width; keyword arguments go to the trace
+def line_trace(x, y, width=CHART_PIXEL_WIDTH, method=CHART_DOWNSAMPLE_METHOD, **trace):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    indices = downsample_indices(x, y, width, method)
+    trace_class = go.Scattergl if len(y) > CHART_WEBGL_MIN_POINTS else go.Scatter
+    return trace_class(x=x[indices], y=y[indices], **trace)
+
+
+# Function to draw many series sharing one x axis (e.g. every scenario of a projection) as a single
+# trace, with gaps between them. paths is a (paths, points) array; at most max_paths are drawn,
+# spread evenly over the rows, and each is downsampled.
+def paths_trace(x, paths, width=CHART_PIXEL_WIDTH, method=CHART_DOWNSAMPLE_METHOD, max_paths=CHART_MAX_PATHS, **trace):
+    x = np.asarray(x)
+    paths = np.asarray(paths, dtype=float)
+    if len(paths) > max_paths:
+        paths = paths[np.linspace(0, len(paths) - 1, max_paths).round().astype(np.int64)]
+    xs, ys = [], []
+    for path in paths:
+        indices = downsample_indices(x, path, width, method)
+        xs += [x[indices], x[indices[-1:]]]
+        ys += [path[indices], [np.nan]]
+    x_all, y_all = np.concatenate(xs), np.concatenate(ys)
+    trace_class = go.Scattergl if len(y_all) > CHART_WEBGL_MIN_POINTS else go.Scatter
+    return trace_class(x=x_all, y=y_all, connectgaps=False, **trace)
+
+
+# Function to hash a figure's inputs: arrays by their bytes, anything else by repr
+def data_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype}{part.shape}".encode("ascii"))
+            digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, dict):
+            digest.update(data_hash(*(value for item in sorted(part.items(), key=repr) for value in item)).encode("ascii"))
+        elif isinstance(part, (list, tuple)):
+            digest.update(data_hash(*part).encode("ascii"))
+        else:
+            digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
+
+# Function to get a figure built by build() from the cache, keyed on a name plus everything it's built
+# from. The figure may be shared between sessions, so callers must not modify it.
+def cached_figure(name, inputs, build):
+    key = (name, data_hash(inputs))
+    with _figure_cache_lock:
+        figure = _figure_cache.get(key)
+        if figure is not None:
+            _figure_cache.move_to_end(key)
+    increment("figure_cache", result="miss" if figure is None else "hit")
+    if figure is None:
+        figure = build()
+        with _figure_cache_lock:
+            _figure_cache[key] = figure
+            _figure_cache.move_to_end(key)
+            while len(_figure_cache) > FIGURE_CACHE_MAX_ENTRIES:
+                _figure_cache.popitem(last=False)
+    return figure
+
+
+def clear_figure_cache():
+    with _figure_cache_lock:
+        _figure_cache.clear()
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from document_generator import DOCUMENT_SECTIONS, generate_document
+from document_model import build_document
+from rate_limiter import rate_limit_session
+
+# Background jobs for document generation.
+# Jobs run on a process-wide thread pool instead of the Streamlit script thread, and every finished
+# section is written to SQLite as it completes, so a browser that disconnects or reruns can poll the
+# job by ID and pick up its sections later. Jobs left running by a process that has since exited are
+# marked "interrupted" and can be resumed.
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite3"))
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+# Function to check whether the process that owns a job is still alive
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    def __init__(self, path=JOB_STORE_PATH, retention=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    document_type TEXT NOT NULL,
+                    inputs TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    owner_pid INTEGER,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_sections (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    section TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    stats TEXT NOT NULL,
+                    PRIMARY KEY (job_id, position)
+                )
+            """)
+            conn.execute("DELETE FROM job_sections WHERE job_id IN (SELECT id FROM jobs WHERE created_at < ?)", (time.time() - self.retention,))
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - self.retention,))
+
+    # sqlite3 connections can't be shared between threads, so keep one per thread
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, inputs, options):
+        # Anyone holding the ID can open the job, so it must not be guessable
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, document_type, inputs, options, status, total, owner_pid, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, inputs["document_type"], json.dumps(inputs), json.dumps(options),
+                 len(DOCUMENT_SECTIONS[inputs["document_type"]]), os.getpid(), now, now)
+            )
+        return job_id
+
+    def set_status(self, job_id, status, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner_pid = ?, updated_at = ? WHERE id = ?",
+                (status, error, os.getpid(), time.time(), job_id)
+            )
+
+    def save_section(self, job_id, index, section, text, stats):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_sections (job_id, position, section, text, stats) VALUES (?, ?, ?, ?, ?)",
+                (job_id, index, section, text, json.dumps(stats))
+            )
+            conn.execute(
+                "UPDATE jobs SET completed = (SELECT COUNT(*) FROM job_sections WHERE job_id = ?), updated_at = ? WHERE id = ?",
+                (job_id, time.time(), job_id)
+            )
+
+    # Function to load a job with its finished sections; returns None for an unknown ID
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, document_type, inputs, options, status, total, completed, error, owner_pid, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            sections = conn.execute(
+                "SELECT position, section, text, stats FROM job_sections WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+
+        job = self._job(row)
+        if job["status"] in ACTIVE_STATUSES and not process_alive(job["owner_pid"]):
+            self.set_status(job_id, "interrupted", "The process running this job exited before it finished")
+            job["status"] = "interrupted"
+        job["sections"] = {
+            position: {"section": section, "text": text, "stats": json.loads(stats)}
+            for position, section, text, stats in sections
+        }
+        return job
+
+    def _job(self, row):
+        keys = ["id", "document_type", "inputs", "options", "status", "total", "completed", "error", "owner_pid", "created_at", "updated_at"]
+        job = dict(zip(keys, row))
+        job["inputs"] = json.loads(job["inputs"])
+        job["options"] = json.loads(job["options"])
+        return job
+
+
+class JobRunner:
+    def __init__(self, store=None, max_workers=JOB_MAX_WORKERS):
+        self.store = store or JobStore()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="document-job")
+        # Text streamed so far for sections still being written, per job (this process only)
+        self.live_text = {}
+        self._lock = threading.Lock()
+
+    # Function to queue a document for generation; returns the job ID.
+    # API calls are scheduled under session_key (the job ID if not given) so users share the rate limit fairly.
+    def submit(self, inputs, bypass_cache=False, stream=False, session_key=None):
+        job_id = self.store.create(inputs, {"bypass_cache": bypass_cache, "stream": stream})
+        self.executor.submit(self._run, job_id, inputs, bypass_cache, stream, session_key=session_key)
+        return job_id
+
+    # Function to restart an interrupted or failed job; only the sections it hasn't saved are requested
+    def resume(self, job_id, session_key=None):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in ACTIVE_STATUSES or job["status"] == "done":
+            return False
+        self.store.set_status(job_id, "queued")
+        completed_parts = {position: (saved["text"], saved["stats"]) for position, saved in job["sections"].items()}
+        self.executor.submit(self._run, job_id, job["inputs"], job["options"]["bypass_cache"], job["options"]["stream"],
+                             completed_parts, session_key)
+        return True
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def streamed_text(self, job_id):
+        with self._lock:
+            return dict(self.live_text.get(job_id, {}))
+
+    def _run(self, job_id, inputs, bypass_cache, stream, completed_parts=None, session_key=None):
+        self.store.set_status(job_id, "running")
+        live = {}
+        with self._lock:
+            self.live_text[job_id] = live
+
+        def on_token(index, section, delta):
+            with self._lock:
+                live[index] = "" if delta is None else live.get(index, "") + delta
+
+        def on_progress(index, section, completed, total, stats, text):
+            self.store.save_section(job_id, index, section, text, stats)
+            with self._lock:
+                live.pop(index, None)
+
+        try:
+            with rate_limit_session(session_key or job_id):
+                generate_document(inputs, on_progress=on_progress, bypass_cache=bypass_cache, stream=stream, on_token=on_token,
+                                  completed_parts=completed_parts)
+            self.store.set_status(job_id, "done")
+        except Exception as e:
+            self.store.set_status(job_id, "failed", str(e))
+        finally:
+            with self._lock:
+                self.live_text.pop(job_id, None)
+
+
+# Function to assemble a finished job into (document, section_stats); see document_model for the document
+def job_result(job):
+    positions = sorted(job["sections"])
+    return (
+        build_document(
+            job["document_type"],
+            [job["sections"][position]["section"] for position in positions],
+            [job["sections"][position]["text"] for position in positions],
+        ),
+        [job["sections"][position]["stats"] for position in positions],
+    )
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+# One runner per process so every Streamlit session shares the same worker threads
+def get_job_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
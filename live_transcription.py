@@ -0,0 +1,441 @@
+import argparse
+import os
+import re
+import struct
+import threading
+import time
+import wave
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+
+from audio_preprocessing import PREPROCESS_SAMPLE_RATE, resample, to_mono, to_pcm16, VAD_FLOOR_DB, VAD_FRAME_MS
+from rate_limiter import current_session, rate_limit_session
+from summarizer import update_summary
+from transcription import encode_wav, MAX_OVERLAP_WORDS, merge_overlap, transcribe_segment
+
+# Live transcription of a meeting that is still going.
+# Audio is fed in small blocks into a buffer holding one chunk; every full chunk is sent to the ASR
+# (keeping its last LIVE_OVERLAP_SECONDS as the start of the next chunk, so words cut at the boundary
+# are heard whole and the repeat is merged away) and the buffer is reused. Every LIVE_SUMMARY_SECONDS
+# of transcribed audio the new text is folded into a running summary. When the meeting ends only the
+# last partial chunk and one summary update are left, so the notes are ready within seconds.
+# The audio held never exceeds one chunk plus the chunks waiting for the ASR, however long the meeting
+# runs; only the transcript text grows.
+LIVE_CHUNK_SECONDS = int(os.getenv("LIVE_CHUNK_SECONDS", "20"))
+LIVE_OVERLAP_SECONDS = int(os.getenv("LIVE_OVERLAP_SECONDS", "2"))
+LIVE_SUMMARY_SECONDS = int(os.getenv("LIVE_SUMMARY_SECONDS", "120"))
+LIVE_MAX_CONCURRENCY = int(os.getenv("LIVE_MAX_CONCURRENCY", "2"))
+# Chunks waiting for the ASR before feed() blocks, so a slow ASR can't make the backlog grow without bound
+LIVE_MAX_PENDING_CHUNKS = int(os.getenv("LIVE_MAX_PENDING_CHUNKS", "4"))
+# Block size when replaying or following a recording
+LIVE_BLOCK_MS = 100
+# Directory the page may follow recordings in on the server; unset, only uploaded recordings can be replayed
+LIVE_RECORDINGS_DIR = os.getenv("LIVE_RECORDINGS_DIR", "")
+RECORDING_NAME = re.compile(r"^\w[\w .-]*\.wav$", re.IGNORECASE)
+# How long to wait for a followed recording to appear before giving up
+LIVE_FOLLOW_WAIT_SECONDS = int(os.getenv("LIVE_FOLLOW_WAIT_SECONDS", "60"))
+# A meeting nobody has checked on for this long is taken to be abandoned (its browser session has gone)
+# and is closed, so its threads don't run on for the life of the server
+LIVE_ABANDON_SECONDS = int(os.getenv("LIVE_ABANDON_SECONDS", "600"))
+
+
+class LiveTranscriber:
+    def __init__(self, sample_rate=PREPROCESS_SAMPLE_RATE, chunk_seconds=LIVE_CHUNK_SECONDS, overlap_seconds=LIVE_OVERLAP_SECONDS,
+                 summary_seconds=LIVE_SUMMARY_SECONDS, max_concurrency=LIVE_MAX_CONCURRENCY, max_pending=LIVE_MAX_PENDING_CHUNKS,
+                 bypass_cache=False):
+        self.sample_rate = sample_rate
+        self.chunk_samples = chunk_seconds * sample_rate
+        self.overlap_samples = min(overlap_seconds * sample_rate, self.chunk_samples // 2)
+        self.summary_seconds = summary_seconds
+        self.bypass_cache = bypass_cache
+        # Calls made from worker threads are queued under the session that started the meeting
+        self.session = current_session.get()
+
+        # The chunk being filled; it starts with the end of the previous chunk
+        self._buffer = np.zeros(self.chunk_samples, dtype=np.float32)
+        self._filled = 0
+        self._buffer_start = 0  # Position of _buffer[0] in the meeting, in samples
+        self._chunks_sent = 0
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="live-transcribe")
+        self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-summary")
+
+        self._lock = threading.Lock()
+        # Chunks finished ahead of an earlier one, until they can be merged in order
+        self._finished = {}
+        self._next_chunk = 0
+        self._transcript_parts = []
+        self._tail = deque(maxlen=MAX_OVERLAP_WORDS)
+        self._unsummarized = []
+        self._summary_future = None
+        self.summary = ""
+        self.transcribed_seconds = 0.0
+        self.summarized_seconds = 0.0
+        self.stats = {"chunks": 0, "silent_chunks": 0, "failed_chunks": 0, "asr_seconds": 0.0, "summary_updates": 0, "final_seconds": None}
+        self.stopped = False
+        self._closed = False
+
+    # Function to add recorded audio: interleaved PCM frames at frame_rate (default: the transcriber's rate).
+    # Each block is resampled on its own, so feed blocks of at least ~100 ms.
+    def feed(self, frames, channels=1, sample_width=2, frame_rate=None):
+        samples = to_mono(frames, channels, sample_width)
+        if frame_rate and frame_rate != self.sample_rate:
+            samples = resample(samples, frame_rate, self.sample_rate)
+        while len(samples):
+            take = min(len(samples), self.chunk_samples - self._filled)
+            self._buffer[self._filled:self._filled + take] = samples[:take]
+            self._filled += take
+            samples = samples[take:]
+            if self._filled == self.chunk_samples:
+                self._send_chunk()
+
+    # Function to send the buffered chunk to the ASR and keep its overlap for the next one
+    def _send_chunk(self):
+        index = self._chunks_sent
+        self._chunks_sent += 1
+        end = (self._buffer_start + self._filled) / self.sample_rate
+        audio = self._buffer[:self._filled]
+        if has_speech(audio, self.sample_rate):
+            segment = {
+                "index": index,
+                "start": self._buffer_start / self.sample_rate,
+                "end": end,
+                "file": encode_wav(1, 2, self.sample_rate, to_pcm16(audio), f"live_{index}.wav"),
+            }
+            self._slots.acquire()
+            future = self._executor.submit(self._transcribe, segment)
+            future.add_done_callback(lambda future, index=index, end=end: self._chunk_done(index, end, future))
+        else:
+            # Nothing but room noise: skip the API call
+            self._chunk_done(index, end, None)
+
+        keep = min(self.overlap_samples, self._filled)
+        self._buffer[:keep] = self._buffer[self._filled - keep:self._filled]
+        self._buffer_start += self._filled - keep
+        self._filled = keep
+
+    def _transcribe(self, segment):
+        with rate_limit_session(self.session):
+            return transcribe_segment(segment)
+
+    def _chunk_done(self, index, end, future):
+        text, seconds, failed = "", 0.0, False
+        if future is not None:
+            self._slots.release()
+            if future.cancelled():
+                failed = True  # Dropped by close() before it was sent
+            else:
+                try:
+                    text, segment_stats = future.result()
+                    seconds = segment_stats["seconds"]
+                except Exception:
+                    failed = True  # call_with_retry already retried; the meeting goes on without this chunk
+
+        with self._lock:
+            self._finished[index] = (text, end)
+            self.stats["chunks"] += 1
+            self.stats["silent_chunks"] += future is None
+            self.stats["failed_chunks"] += failed
+            self.stats["asr_seconds"] += seconds
+            while self._next_chunk in self._finished:
+                text, end = self._finished.pop(self._next_chunk)
+                self._next_chunk += 1
+                self._append(text)
+                self.transcribed_seconds = end
+            if self.transcribed_seconds - self.summarized_seconds >= self.summary_seconds:
+                self._start_summary_update()
+
+    # Function to append a chunk's text, dropping the words it repeats from the previous chunk's overlap
+    def _append(self, text):
+        if not text:
+            return
+        merged = merge_overlap(" ".join(self._tail), text)
+        new_words = merged.split()[len(self._tail):]
+        if new_words:
+            new_text = " ".join(new_words)
+            self._transcript_parts.append(new_text)
+            self._unsummarized.append(new_text)
+            self._tail.extend(new_words)
+
+    # Called with the lock held; one update runs at a time and the next one picks up what arrived meanwhile
+    def _start_summary_update(self):
+        if self._closed or not self._unsummarized or (self._summary_future is not None and not self._summary_future.done()):
+            return
+        new_text = " ".join(self._unsummarized)
+        self._unsummarized = []
+        self._summary_future = self._summary_executor.submit(self._update_summary, new_text, self.transcribed_seconds)
+
+    def _update_summary(self, new_text, until):
+        with rate_limit_session(self.session):
+            summary, _ = update_summary(self.summary, new_text, bypass_cache=self.bypass_cache)
+        with self._lock:
+            self.summary = summary
+            self.summarized_seconds = until
+            self.stats["summary_updates"] += 1
+
+    def transcript(self):
+        with self._lock:
+            return " ".join(self._transcript_parts)
+
+    # Function to report progress for display while the meeting is running
+    def snapshot(self):
+        with self._lock:
+            return {
+                "transcript": " ".join(self._transcript_parts),
+                "summary": self.summary,
+                "recorded_seconds": (self._buffer_start + self._filled) / self.sample_rate,
+                "transcribed_seconds": self.transcribed_seconds,
+                "summarized_seconds": self.summarized_seconds,
+                "pending_chunks": self._chunks_sent - self._next_chunk,
+                **self.stats,
+            }
+
+    # Function to end the meeting: transcribe what's left, then turn the running summary into the final
+    # notes. Returns (transcript, summary).
+    def stop(self):
+        if self.stopped:
+            return self.transcript(), self.summary
+        self.stopped = True
+        start = time.perf_counter()
+        if self._filled > self.overlap_samples or (self._chunks_sent == 0 and self._filled):
+            self._send_chunk()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            pending = self._summary_future
+        if pending is not None:
+            pending.result()
+
+        with self._lock:
+            new_text = " ".join(self._unsummarized)
+            self._unsummarized = []
+            summary = self.summary
+        if new_text or summary:
+            with rate_limit_session(self.session):
+                summary, _ = update_summary(summary, new_text, final=True, bypass_cache=self.bypass_cache)
+        self._summary_executor.shutdown(wait=True)
+        with self._lock:
+            self.summary = summary
+            self.summarized_seconds = self.transcribed_seconds
+            self.stats["final_seconds"] = time.perf_counter() - start
+        return self.transcript(), summary
+
+    # Function to drop the meeting without final notes: chunks still waiting for the ASR are cancelled and
+    # the worker threads exit. Stop feeding audio first.
+    def close(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        # Chunks still finishing after this don't start summary updates on the closed executor
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._summary_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to tell whether any frame of the audio is louder than room noise (VAD_FLOOR_DB)
+def has_speech(samples, frame_rate, floor_db=VAD_FLOOR_DB):
+    frame_length = max(1, frame_rate * VAD_FRAME_MS // 1000)
+    count = len(samples) // frame_length
+    if count == 0:
+        return bool(len(samples))
+    energy = np.mean(np.square(samples[:count * frame_length].reshape(count, frame_length), dtype=np.float64), axis=1)
+    return bool(10 * np.log10(energy.max() + 1e-10) > floor_db)
+
+
+# Function to feed a WAV recording to a transcriber at the pace it was recorded (speed > 1 plays it
+# faster), as a live recorder would; for replaying meetings and for testing
+def replay_wav(wav_bytes, transcriber, speed=1.0, block_ms=LIVE_BLOCK_MS, stop_event=None):
+    with wave.open(BytesIO(wav_bytes), "rb") as wav:
+        channels, sample_width, frame_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        block = max(1, frame_rate * block_ms // 1000)
+        start = time.monotonic()
+        fed = 0
+        while not (stop_event and stop_event.is_set()):
+            frames = wav.readframes(block)
+            if not frames:
+                break
+            fed += len(frames) // (channels * sample_width)
+            # A block can only be fed once it has been "recorded"
+            delay = start + fed / frame_rate / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            transcriber.feed(frames, channels, sample_width, frame_rate)
+
+
+# Function to read a WAV header, tolerating the unfinished sizes a recorder writes while it is still
+# recording; returns (channels, sample_width, frame_rate, data_offset) or None if it isn't complete yet
+def read_wav_header(file):
+    file.seek(0)
+    header = file.read(12)
+    if len(header) < 12:
+        return None
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    channels = sample_width = frame_rate = None
+    while True:
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"fmt ":
+            fmt = file.read(size + size % 2)
+            if len(fmt) < 16:
+                return None
+            audio_format, channels, frame_rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError("Only PCM WAV recordings can be followed")
+            sample_width = bits // 8
+        elif chunk_id == b"data":
+            if channels is None:
+                raise ValueError("WAV data before its format")
+            return channels, sample_width, frame_rate, file.tell()
+        else:
+            file.seek(size + size % 2, 1)
+
+
+# Function to get the path of a recording in LIVE_RECORDINGS_DIR. The recorder may not have created it
+# yet, so the name is checked rather than looked up: a plain WAV file name, nothing outside the directory.
+def recording_path(name):
+    if not LIVE_RECORDINGS_DIR:
+        raise ValueError("Following recordings on the server is not enabled (set LIVE_RECORDINGS_DIR)")
+    if not RECORDING_NAME.match(name):
+        raise ValueError(f"{name!r} is not a WAV file name (letters, digits, spaces, '.', '-' and '_', ending in .wav)")
+    return os.path.join(LIVE_RECORDINGS_DIR, name)
+
+
+# Function to follow a WAV file that a recorder is still writing, feeding new audio as it appears,
+# until stop_event is set (what was written by then is still fed). Gives up if no recording has
+# appeared after wait_seconds.
+def follow_wav(path, transcriber, stop_event, poll_seconds=LIVE_BLOCK_MS / 1000, wait_seconds=LIVE_FOLLOW_WAIT_SECONDS):
+    header = None
+    deadline = time.monotonic() + wait_seconds
+    while header is None:
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                header = read_wav_header(file)
+        if header is None:
+            if stop_event.is_set():
+                return
+            if time.monotonic() > deadline:
+                raise FileNotFoundError(f"No WAV recording at {os.path.basename(path)} after {wait_seconds}s")
+            time.sleep(poll_seconds)
+    channels, sample_width, frame_rate, offset = header
+    frame_size = channels * sample_width
+    with open(path, "rb") as file:
+        file.seek(offset)
+        leftover = b""
+        while True:
+            stopping = stop_event.is_set()
+            data = leftover + file.read()
+            whole = len(data) // frame_size * frame_size
+            if whole:
+                transcriber.feed(data[:whole], channels, sample_width, frame_rate)
+            leftover = data[whole:]
+            if stopping:
+                return
+            time.sleep(poll_seconds)
+
+
+# Meetings that haven't ended, for the reaper; a meeting whose session has gone is only kept alive by its
+# own thread, which the reaper stops
+_meetings = weakref.WeakSet()
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _reap_abandoned_meetings():
+    while True:
+        time.sleep(max(1, min(60, LIVE_ABANDON_SECONDS // 4)))
+        for meeting in list(_meetings):
+            if meeting.abandoned():
+                meeting.close(f"Closed after {LIVE_ABANDON_SECONDS // 60} minutes without being checked on")
+
+
+# Function to start the reaper thread once per process
+def watch_meeting(meeting):
+    global _reaper
+    with _reaper_lock:
+        _meetings.add(meeting)
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_abandoned_meetings, daemon=True, name="live-meeting-reaper")
+            _reaper.start()
+
+
+class LiveMeeting:
+    # A live transcriber fed from a recording in the background: follow a file a recorder is writing,
+    # or replay a finished recording in real time
+    def __init__(self, transcriber, path=None, wav_bytes=None, speed=1.0):
+        self.transcriber = transcriber
+        self.started_at = time.time()
+        self.last_checked = time.monotonic()
+        self._stop_event = threading.Event()
+        if path is not None:
+            target, args = follow_wav, (path, transcriber, self._stop_event)
+        else:
+            target, args = replay_wav, (wav_bytes, transcriber, speed, LIVE_BLOCK_MS, self._stop_event)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, args=(target, args), daemon=True, name="live-meeting")
+        self._thread.start()
+        watch_meeting(self)
+
+    def _run(self, target, args):
+        try:
+            target(*args)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    # True while audio is still arriving (a replay ends on its own at the end of the file).
+    # Whoever shows the meeting calls this as it polls, which keeps the meeting from being reaped.
+    def running(self):
+        self.last_checked = time.monotonic()
+        return self._thread.is_alive()
+
+    def abandoned(self):
+        return time.monotonic() - self.last_checked > LIVE_ABANDON_SECONDS
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        _meetings.discard(self)
+        return self.transcriber.stop()
+
+    # Function to end the meeting without final notes (stop() then returns what was transcribed so far)
+    def close(self, reason=None):
+        self._stop_event.set()
+        self._thread.join()
+        _meetings.discard(self)
+        self.transcriber.close()
+        if reason and self.error is None:
+            self.error = reason
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe and summarize a meeting while it is being recorded.")
+    parser.add_argument("wav", help="WAV recording to replay, or (with --follow) a WAV file a recorder is writing")
+    parser.add_argument("--follow", action="store_true", help="Follow the file as it grows until interrupted")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed (1 = real time)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    transcriber = LiveTranscriber()
+    if args.follow:
+        meeting = LiveMeeting(transcriber, path=args.wav)
+    else:
+        with open(args.wav, "rb") as file:
+            meeting = LiveMeeting(transcriber, wav_bytes=file.read(), speed=args.speed)
+    try:
+        while meeting.running():
+            time.sleep(args.interval)
+            snapshot = transcriber.snapshot()
+            print(f"[{snapshot['recorded_seconds']:.0f}s recorded, {snapshot['transcribed_seconds']:.0f}s transcribed, "
+                  f"{snapshot['summarized_seconds']:.0f}s summarized] ...{snapshot['transcript'][-120:]}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    transcript, summary = meeting.stop()
+    if meeting.error:
+        print(f"Recording stopped early: {meeting.error}")
+    print(f"\nNotes ready {transcriber.stats['final_seconds']:.1f}s after the meeting ended\n\nTranscript:\n{transcript}\n\nSummary:\n{summary}")
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Disk-backed cache for LLM responses, shared by every Streamlit worker on the host.
+# SQLite in WAL mode gives us cross-process locking without running a separate service.
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+# Request fields left out of the cache key. max_tokens is only a limit: section budgets move a little
+# after every generation (see prompt_builder.allocate_max_tokens), and keying on them would make the
+# same inputs miss the cache every time. Instead each entry records the max_tokens it was made with and
+# whether the reply was cut off there (finish_reason "length"); a cut-off reply is only served to
+# requests with no larger budget, so a bigger budget gets a full reply.
+CACHE_KEY_IGNORED_FIELDS = ("max_tokens",)
+
+
+# Function to hash the request (model, messages/prompt, temperature, ...), without the ignored fields
+def make_cache_key(request):
+    request = {name: value for name, value in request.items() if name not in CACHE_KEY_IGNORED_FIELDS}
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Counters for this process; totals across processes are kept in the stats table
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    max_tokens INTEGER,
+                    truncated INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Caches made before entries recorded their budget: none of their entries are marked as cut off
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(responses)")]
+            if "truncated" not in columns:
+                conn.execute("ALTER TABLE responses ADD COLUMN max_tokens INTEGER")
+                conn.execute("ALTER TABLE responses ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    # sqlite3 connections can't be shared between threads, so keep one per thread
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, name):
+        with self._lock:
+            if name == "hits":
+                self.hits += 1
+            else:
+                self.misses += 1
+        conn.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+
+    # Function to look up a cached reply; one that was cut off at its max_tokens is a miss for a
+    # request allowed more tokens (max_tokens None means no limit)
+    def get(self, key, max_tokens=None):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at, max_tokens, truncated FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                return None
+            if row[3] and (max_tokens is None or row[2] is None or max_tokens > row[2]):
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            return row[0]
+
+    def set(self, key, value, max_tokens=None, finish_reason=None):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access, max_tokens, truncated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value, size, now, now, max_tokens, finish_reason == "length")
+            )
+            self._evict(conn, now)
+
+    # Drop expired entries, then least recently used ones until we are within bounds
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total_bytes -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    # Return the cached text for request, or call create() and store its result.
+    # create() returns (text, finish_reason).
+    # bypass=True skips the lookup ("regenerate anyway") but still refreshes the entry.
+    def get_or_create(self, request, create, bypass=False):
+        key = make_cache_key(request)
+        if not bypass:
+            value = self.get(key, request.get("max_tokens"))
+            if value is not None:
+                return value
+        value, finish_reason = create()
+        self.set(key, value, request.get("max_tokens"), finish_reason)
+        return value
+
+    def stats(self):
+        with self._connect() as conn:
+            totals = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide cache instance
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+# Function to replace the process-wide cache (e.g. a throwaway cache for benchmarks)
+def set_cache(cache):
+    global _cache
+    with _cache_lock:
+        _cache = cache
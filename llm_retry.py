@@ -0,0 +1,85 @@
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+import requests
+
+# Retries for transient API failures (rate limits, 5xx, dropped connections) with jittered
+# exponential backoff. A Retry-After hint from the server is honoured when it asks for longer.
+RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30.0"))
+
+TRANSIENT_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+# Function to decide whether an error is worth retrying
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # Generic API errors are retried when the server failed (5xx), or the stream broke without a status
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+# Function to read a Retry-After hint from an error's response headers, in seconds (or None)
+def retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    lowered = {str(name).lower(): value for name, value in headers.items()}
+    if "retry-after-ms" in lowered:
+        try:
+            return float(lowered["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = lowered.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Full-jitter exponential backoff, raised to the server's hint when there is one
+def retry_delay(error, attempt, base_delay=None, max_delay=None):
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    hint = retry_after(error)
+    if hint is not None:
+        delay = max(delay, min(hint, max_delay))
+    return delay
+
+
+# Function to call fn() until it succeeds, retrying transient errors.
+# on_retry(attempt, error, delay) is called before each wait, e.g. to discard a partial stream.
+def call_with_retry(fn, max_attempts=None, on_retry=None):
+    max_attempts = RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_attempts or not is_transient(e):
+                raise
+            delay = retry_delay(e, attempt)
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+            attempt += 1
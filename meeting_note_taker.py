@@ -1,55 +1,151 @@
 import streamlit as st
-import openai
-import os
+import hashlib
+import time
+import uuid
 from io import BytesIO
+from summarizer import summarize_transcript
+from transcription import transcribe_audio
+from audio_preprocessing import describe_savings, preprocess_audio, to_original_time
+from rate_limiter import rate_limit_session
+from live_transcription import LIVE_RECORDINGS_DIR, LiveMeeting, LiveTranscriber, recording_path
 
-# Set your OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Seconds between updates of the live transcript while a meeting is being recorded
+LIVE_POLL_SECONDS = 1.0
 
 def meeting_note_taker():
     st.title("Meeting Note Taker")
     st.markdown("### Record your meeting and automatically generate notes")
 
-    # Function to handle audio recording and transcription (simplified for this example)
-    def transcribe_audio(audio_file):
-        # Example using OpenAI's Whisper or any other ASR service
-        with open(audio_file, 'rb') as file:
-            transcript = openai.Audio.transcribe("whisper-1", file)  # Simplified example
-        return transcript
-
-    # Function to summarize notes using GPT-4
-    def summarize_notes(transcript_text):
-        prompt = f"""
-        Summarize the following meeting transcript into key points, action items, and decisions:
-        {transcript_text}
-        """
-        response = openai.Completion.create(
-            model="gpt-4",
-            prompt=prompt,
-            max_tokens=500,
-            n=1,
-            stop=None,
-            temperature=0.7
-        )
-        summary = response.choices[0].text.strip()
-        return summary
-
     # Upload or record an audio file
     audio_file = st.file_uploader("Upload your meeting audio file", type=["mp3", "wav", "m4a"])
 
+    # API calls from this page queue under the user's session, so users share the rate limit fairly
+    session_key = st.session_state.setdefault("rate_limit_session", uuid.uuid4().hex)
+
     if audio_file:
         st.audio(audio_file)
-        with st.spinner("Transcribing audio..."):
-            transcript = transcribe_audio(audio_file)
-            st.text_area("Transcript", value=transcript, height=300)
+        # Transcribe once per upload; reruns (e.g. toggling the checkbox below) reuse the result
+        audio_bytes = audio_file.getvalue()
+        audio_key = hashlib.sha1(audio_bytes).hexdigest()
+        if st.session_state.get("transcript_key") != audio_key:
+            # Upload 16 kHz mono with long silences cut instead of the original file; segment times are
+            # mapped back to the original recording. Formats that can't be decoded are sent as they are.
+            with st.spinner("Preparing audio..."):
+                prepared = preprocess_audio(audio_bytes, audio_file.name)
+            with st.spinner("Transcribing audio..."), rate_limit_session(session_key):
+                if prepared:
+                    transcript, segment_stats = transcribe_audio(prepared["audio"], prepared["file_name"])
+                    for stats in segment_stats:
+                        stats["start"] = to_original_time(prepared["timestamp_map"], stats["start"])
+                        if stats["end"] is not None:
+                            stats["end"] = to_original_time(prepared["timestamp_map"], stats["end"])
+                else:
+                    try:
+                        transcript, segment_stats = transcribe_audio(audio_bytes, audio_file.name)
+                    except ValueError as e:
+                        st.error(f"Could not transcribe the recording: {str(e)}")
+                        return
+            st.session_state["transcript_key"] = audio_key
+            st.session_state["transcript"] = (transcript, segment_stats, prepared["stats"] if prepared else None)
+        transcript, segment_stats, preprocess_stats = st.session_state["transcript"]
+        if preprocess_stats:
+            st.caption(describe_savings(preprocess_stats))
+        st.text_area("Transcript", value=transcript, height=300)
 
-        with st.spinner("Summarizing notes..."):
-            summary = summarize_notes(transcript)
+        with st.expander("Transcription timings"):
+            st.table([
+                {
+                    "Segment": stats["segment"] + 1,
+                    "Audio (s)": f"{stats['start']:.0f}-{stats['end']:.0f}" if stats["end"] is not None else "whole file",
+                    "Transcription (s)": round(stats["seconds"], 2),
+                }
+                for stats in segment_stats
+            ])
+
+        regenerate_summary = st.checkbox("Regenerate summary anyway (ignore cached summary)", value=False)
+        with st.spinner("Summarizing notes..."), rate_limit_session(session_key):
+            # Long transcripts are summarized in parallel chunks and merged (map-reduce)
+            summary, stage_stats = summarize_transcript(transcript, bypass_cache=regenerate_summary)
             st.text_area("Summary", value=summary, height=200)
 
+        with st.expander("Summarization stages"):
+            st.table([
+                {
+                    "Stage": stats["stage"],
+                    "Calls": stats["calls"],
+                    "Latency (s)": round(stats["seconds"], 2),
+                    "Prompt tokens": stats["prompt_tokens"],
+                    "Completion tokens": stats["completion_tokens"],
+                }
+                for stats in stage_stats
+            ])
+
         # Option to download summary
         st.download_button(label="Download Summary", data=summary, file_name="meeting_summary.txt")
 
-    # Provide option to record live audio (Note: This requires additional setup for real-time recording)
+    # Live notes: transcribe and summarize while the meeting is still being recorded
     st.markdown("---")
-    st.markdown("### Record Live Meeting (Coming Soon)")
+    st.markdown("### Record Live Meeting")
+    st.caption(
+        "The transcript and a running summary update as the meeting goes on, so the notes are ready seconds "
+        "after it ends. Replay a WAV recording, or name the WAV file your recorder is writing in the server's "
+        "recordings folder, e.g. `arecord -f S16_LE -r 16000 -c 1 meeting.wav`."
+    )
+    meeting = st.session_state.get("live_meeting")
+    if meeting is None:
+        # Recordings on the server can only be followed inside LIVE_RECORDINGS_DIR, by file name
+        recording_name = st.text_input("Recording file (in the recordings folder)") if LIVE_RECORDINGS_DIR else ""
+        replay_file = st.file_uploader("Or replay a WAV recording in real time", type=["wav"])
+        if st.button("Start live notes") and (recording_name.strip() or replay_file):
+            try:
+                path = recording_path(recording_name.strip()) if recording_name.strip() else None
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                with rate_limit_session(session_key):
+                    transcriber = LiveTranscriber()
+                if path:
+                    meeting = LiveMeeting(transcriber, path=path)
+                else:
+                    meeting = LiveMeeting(transcriber, wav_bytes=replay_file.getvalue())
+                st.session_state["live_meeting"] = meeting
+                st.session_state["live_notes"] = None
+
+    if meeting is not None:
+        if st.button("End meeting"):
+            with st.spinner("Finishing notes..."):
+                transcript, summary = meeting.stop()
+            st.session_state["live_meeting"] = None
+            st.session_state["live_notes"] = (transcript, summary, meeting.transcriber.stats["final_seconds"], meeting.error)
+        else:
+            live_status = st.empty()
+            live_summary = st.empty()
+            live_transcript = st.empty()
+
+            def show_live(snapshot):
+                live_status.text(
+                    f"{snapshot['recorded_seconds']:.0f}s recorded, {snapshot['transcribed_seconds']:.0f}s transcribed, "
+                    f"summary up to {snapshot['summarized_seconds']:.0f}s ({snapshot['pending_chunks']} chunks waiting, "
+                    f"{snapshot['silent_chunks']} silent chunks skipped)"
+                )
+                live_summary.markdown(f"**Running summary**\n\n{snapshot['summary'] or '(after the first few minutes)'}")
+                live_transcript.markdown(f"**Latest transcript**\n\n...{snapshot['transcript'][-1500:]}")
+
+            while meeting.running():
+                show_live(meeting.transcriber.snapshot())
+                time.sleep(LIVE_POLL_SECONDS)
+            show_live(meeting.transcriber.snapshot())
+            if meeting.error:
+                st.error(f"Recording stopped: {meeting.error}")
+            else:
+                st.info("The recording has ended; press End meeting for the final notes.")
+
+    live_notes = st.session_state.get("live_notes")
+    if live_notes:
+        live_transcript_text, live_summary_text, final_seconds, error = live_notes
+        if error:
+            st.error(f"Recording stopped early: {error}")
+        st.caption(f"Notes ready {final_seconds:.1f}s after the meeting ended")
+        st.text_area("Live transcript", value=live_transcript_text, height=300)
+        st.text_area("Meeting notes", value=live_summary_text, height=200)
+        st.download_button(label="Download Meeting Notes", data=live_summary_text, file_name="meeting_notes.txt")
@@ -0,0 +1,220 @@
+import atexit
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight timers and counters for the hot paths (LLM calls, chart rendering, exports,
+# transcription, Streamlit reruns). Off unless METRICS_ENABLED=1: then timer() hands back a shared
+# no-op context manager and @timed leaves functions untouched, so instrumented code pays nothing.
+# When enabled, metrics are served in Prometheus text format on METRICS_PORT and/or written to
+# METRICS_FILE every METRICS_FILE_INTERVAL seconds.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+# Recent samples kept per stage for the p50/p95 shown in the debug panel
+METRICS_RECENT_SAMPLES = 1000
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+        self.recent = deque(maxlen=METRICS_RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        index = bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.recent.append(seconds)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+# Function to record a duration measured elsewhere (e.g. a time-to-first-token already in section stats)
+def observe(stage, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    _observe(stage, seconds, labels)
+
+
+def _observe(stage, seconds, labels):
+    key = _key(stage, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("stage", "labels", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _observe(self.stage, time.perf_counter() - self.start, self.labels)
+
+
+# Function to time a block:  with timer("export", format="pdf"): ...
+def timer(stage, **labels):
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(stage, labels)
+
+
+# Decorator version of timer() for whole functions
+def timed(stage, **labels):
+    def decorate(function):
+        if not METRICS_ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage, labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def increment(event, amount=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(event, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Function to summarize every stage for the debug panel: count, total, mean, p50 and p95 (recent samples)
+def stage_summary():
+    with _lock:
+        snapshot = [(key, histogram.count, histogram.total, sorted(histogram.recent)) for key, histogram in _histograms.items()]
+    rows = []
+    for (stage, labels), count, total, recent in sorted(snapshot):
+        rows.append({
+            "stage": stage + "".join(f" {name}={value}" for name, value in labels),
+            "count": count,
+            "total_seconds": total,
+            "mean_seconds": total / count if count else 0.0,
+            "p50_seconds": _percentile(recent, 0.5),
+            "p95_seconds": _percentile(recent, 0.95),
+        })
+    return rows
+
+
+def counter_summary():
+    with _lock:
+        return {event + "".join(f" {name}={value}" for name, value in labels): value for (event, labels), value in sorted(_counters.items())}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+# Function to render all metrics in the Prometheus text exposition format
+def render_prometheus():
+    lines = [
+        "# HELP app_stage_seconds Time spent in instrumented stages.",
+        "# TYPE app_stage_seconds histogram",
+    ]
+    with _lock:
+        histograms = sorted((key, histogram.count, histogram.total, list(histogram.buckets)) for key, histogram in _histograms.items())
+        counters = sorted(_counters.items())
+    for (stage, labels), count, total, buckets in histograms:
+        labels = (("stage", stage),) + labels
+        cumulative = 0
+        for bound, bucket_count in zip(HISTOGRAM_BUCKETS, buckets):
+            cumulative += bucket_count
+            lines.append(f"app_stage_seconds_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"app_stage_seconds_bucket{_label_text(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"app_stage_seconds_sum{_label_text(labels)} {total}")
+        lines.append(f"app_stage_seconds_count{_label_text(labels)} {count}")
+    lines += ["# HELP app_events_total Counted events.", "# TYPE app_events_total counter"]
+    for (event, labels), value in counters:
+        lines.append(f"app_events_total{_label_text((('event', event),) + labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path=METRICS_FILE):
+    # Write then rename so a scraper never reads a half-written file
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        file.write(render_prometheus())
+    os.replace(temporary, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_exporters_started = False
+
+
+# Function to start the configured exporters once per process (the app calls this on every rerun)
+def start_exporters():
+    global _exporters_started
+    with _lock:
+        if _exporters_started or not METRICS_ENABLED:
+            return
+        _exporters_started = True
+
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), MetricsHandler)
+        except OSError:
+            server = None  # Another worker process on this host already serves the port
+        if server is not None:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    if METRICS_FILE:
+        def write_periodically():
+            while True:
+                time.sleep(METRICS_FILE_INTERVAL)
+                write_prometheus_file()
+        threading.Thread(target=write_periodically, daemon=True).start()
+        atexit.register(write_prometheus_file)
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+from financial_engine import compute_ratios, project_financials
+
+# Monte Carlo scenario simulator built on the vectorized projection engine.
+# Paths are simulated in fixed-size chunks so the working set stays bounded however many
+# paths are requested; final-period values go into a fixed-size histogram per metric rather than
+# being kept per path, so memory doesn't grow with the number of paths either.
+MONTE_CARLO_CHUNK_BYTES = int(os.getenv("MONTE_CARLO_CHUNK_BYTES", str(64 * 1024 * 1024)))
+PERCENTILES = (5, 50, 95)
+# Histogram bins per metric, spaced evenly in asinh(value / scale): fine near zero, and a constant
+# relative width (about 0.1%) for large values. Percentiles are interpolated within a bin.
+HISTOGRAM_BINS = int(os.getenv("MONTE_CARLO_HISTOGRAM_BINS", str(2 ** 16)))
+HISTOGRAM_LIMIT = 32.0
+# Per-period bands for the chart are taken from the first paths (paths are i.i.d.)
+BAND_SAMPLE_PATHS = 10000
+
+# Default driver distributions, as per-period rates
+DEFAULT_DRIVERS = {
+    "revenue_growth": {"distribution": "normal", "mean": 0.08, "std": 0.10},
+    "expense_growth": {"distribution": "normal", "mean": 0.05, "std": 0.04},
+    "margin_shock": {"distribution": "normal", "mean": 0.0, "std": 0.03},
+}
+
+DISTRIBUTIONS = ["normal", "uniform", "triangular", "lognormal"]
+
+
+# Function to draw samples for one driver from its distribution spec
+def draw(rng, spec, shape):
+    distribution = spec["distribution"]
+    if distribution == "normal":
+        return rng.normal(spec["mean"], spec["std"], shape)
+    if distribution == "uniform":
+        return rng.uniform(spec["low"], spec["high"], shape)
+    if distribution == "triangular":
+        return rng.triangular(spec["low"], spec["mode"], spec["high"], shape)
+    if distribution == "lognormal":
+        # Growth of exp(N(mean, std)) - 1, so the rate can't fall below -100%
+        return np.expm1(rng.normal(spec["mean"], spec["std"], shape))
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+
+# Streaming percentiles of one metric over all paths, in HISTOGRAM_BINS counters. The scale is set
+# from the first values added, so typical values land in the finely spaced middle of the histogram;
+# infinities (e.g. a ratio over zero equity) are counted apart, and results stay within the exact
+# smallest and largest finite values seen.
+class PercentileHistogram:
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.scale = None
+        self.below = 0
+        self.above = 0
+        self.low = np.inf
+        self.high = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        self.below += int(np.count_nonzero(values == -np.inf))
+        self.above += int(np.count_nonzero(values == np.inf))
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        if self.scale is None:
+            self.scale = float(np.median(np.abs(values))) or 1.0
+        self.low = min(self.low, float(values.min()))
+        self.high = max(self.high, float(values.max()))
+        bins = len(self.counts)
+        positions = (np.arcsinh(values / self.scale) + HISTOGRAM_LIMIT) * (bins / (2 * HISTOGRAM_LIMIT))
+        self.counts += np.bincount(np.clip(positions, 0, bins - 1).astype(np.int64), minlength=bins)
+
+    # Percentiles as np.percentile's default (linear) method would give them, to within a bin
+    def percentiles(self, percentiles):
+        total = self.below + int(self.counts.sum()) + self.above
+        if total == 0:
+            return [np.nan] * len(percentiles)
+        cumulative = np.cumsum(self.counts)
+        width = 2 * HISTOGRAM_LIMIT / len(self.counts)
+        results = []
+        for percentile in percentiles:
+            rank = percentile / 100 * (total - 1) - self.below
+            if rank < 0:
+                results.append(-np.inf)
+            elif rank >= cumulative[-1]:
+                results.append(np.inf)
+            else:
+                index = int(np.searchsorted(cumulative, rank, side="right"))
+                before = cumulative[index - 1] if index else 0
+                # Spread the bin's values evenly across it
+                position = -HISTOGRAM_LIMIT + (index + (rank - before + 0.5) / self.counts[index]) * width
+                results.append(float(np.clip(np.sinh(position) * self.scale, self.low, self.high)))
+        return results
+
+
+# Pick a chunk size so that one chunk's projection arrays fit in the memory budget
+def auto_chunk_size(periods, chunk_bytes=MONTE_CARLO_CHUNK_BYTES):
+    # About 24 float64 (chunk, periods) arrays are alive at once during a projection
+    return max(1, chunk_bytes // (periods * 8 * 24))
+
+
+# Function to run the simulation. Results are reproducible for a given
+# (seed, paths, periods, chunk_size): each chunk gets its own child seed.
+# Returns {"final": {metric: {percentile: value}}, "bands": {metric: {percentile: array}}, "paths": n}
+def simulate(base, paths, periods=5, drivers=None, seed=0, chunk_size=None,
+             variable_cost_ratio=0.0, asset_growth=0.0, liability_growth=0.0):
+    drivers = dict(DEFAULT_DRIVERS, **(drivers or {}))
+    chunk_size = chunk_size or auto_chunk_size(periods)
+    chunk_seeds = np.random.SeedSequence(seed).spawn((paths + chunk_size - 1) // chunk_size)
+
+    histograms = {}
+    band_series = {"Profit": [], "Equity": []}
+    band_paths = 0
+
+    for chunk_index, chunk_seed in enumerate(chunk_seeds):
+        start = chunk_index * chunk_size
+        n = min(chunk_size, paths - start)
+        rng = np.random.default_rng(chunk_seed)
+        shape = (n, periods)
+
+        projection = project_financials(
+            base,
+            periods,
+            scenarios=n,
+            revenue_growth=draw(rng, drivers["revenue_growth"], shape),
+            expense_growth=draw(rng, drivers["expense_growth"], shape),
+            margin_shock=draw(rng, drivers["margin_shock"], shape),
+            variable_cost_ratio=variable_cost_ratio,
+            asset_growth=asset_growth,
+            liability_growth=liability_growth,
+        )
+        final = {name: projection[name][:, -1] for name in ("Revenue", "Expenses", "Assets", "Liabilities", "Equity", "Profit")}
+        metrics = {"Profit": final["Profit"], "Equity": final["Equity"]}
+        metrics.update(compute_ratios(final))
+
+        for name, values in metrics.items():
+            histograms.setdefault(name, PercentileHistogram()).add(values)
+
+        if band_paths < BAND_SAMPLE_PATHS:
+            take = min(n, BAND_SAMPLE_PATHS - band_paths)
+            # Copies, so the slices don't keep the whole chunk's projection alive
+            band_series["Profit"].append(projection["Profit"][:take].copy())
+            band_series["Equity"].append(projection["Equity"][:take].copy())
+            band_paths += take
+        del projection, final, metrics
+
+    return {
+        "paths": paths,
+        "final": {
+            name: dict(zip(PERCENTILES, histogram.percentiles(PERCENTILES)))
+            for name, histogram in histograms.items()
+        },
+        "bands": {
+            name: dict(zip(PERCENTILES, np.percentile(np.concatenate(series), PERCENTILES, axis=0)))
+            for name, series in band_series.items()
+        },
+    }
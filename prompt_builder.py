@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import threading
+import time
+
+from token_counting import count_message_tokens
+
+# Prompt assembly and token budgeting for document sections.
+# The business details are the same for every section of a document, so they go first, in the
+# system message, and only fields the user filled in are included; the section request and the
+# financial-table instructions (only for sections that need them) follow. max_tokens per section is
+# a share of a total document budget, weighted by how long each section's completions usually are.
+
+# Total completion tokens to aim for per document, by selected length. Documents with many sections get
+# less per section than the old fixed limits: a Long Business Plan (16 sections) averages about 937
+# tokens per section instead of 2300, a Long Pitch Deck (10) 1500.
+DOCUMENT_TOKEN_BUDGETS = {"Short": 6000, "Long": 15000}
+# The fixed per-section limits used before budgets were adaptive; also the upper bound per section
+LEGACY_MAX_TOKENS = {"Short": 900, "Long": 2300}
+MIN_SECTION_TOKENS = 200
+# Weight given to the newest observation in a section's running average completion length
+USAGE_SMOOTHING = 0.3
+USAGE_STATS_PATH = os.getenv("PROMPT_USAGE_STATS_PATH", os.path.join(".cache", "section_usage.sqlite3"))
+
+# USD per 1K tokens (prompt, completion), for cost estimates
+MODEL_PRICES = {"gpt-4": (0.03, 0.06)}
+
+CONTEXT_FIELDS = [
+    ("Language", "language"),
+    ("Writing Person", "writing_person"),
+    ("Writing Style", "writing_style"),
+    ("Document Length", "document_length"),
+    ("Template", "template"),
+    ("Business Type", "business_type"),
+    ("BEE Level", "bee_level"),
+    ("Directors/Shareholders", "directors"),
+    ("Staffing Compliment", "staffing"),
+    ("Funding Amount", "funding_amount"),
+    ("Grant Amount", "grant_amount"),
+    ("Finance Term", "finance_term"),
+    ("Business Overview", "business_overview"),
+]
+
+# Sections whose titles contain one of these get the financial-table instructions
+FINANCIAL_KEYWORDS = ["financial", "funding", "budget", "cost", "economic", "revenue", "exit", "projection"]
+
+FINANCIAL_INSTRUCTIONS = (
+    "Ensure that all financial tables, including revenue projections, operating expenses, net profit, and cash flow "
+    "(if applicable), are calculated accurately based on industry standards, market conditions, and the provided "
+    "business context. Include all relevant calculations and ensure that all numbers in tables and projections are "
+    "precise and consistent with the overall document."
+)
+
+
+def needs_financial_instructions(section):
+    return any(keyword in section.lower() for keyword in FINANCIAL_KEYWORDS)
+
+
+# Function to build the shared business-details block, skipping fields left empty
+def build_context_block(inputs):
+    return "\n".join(f"{label}: {inputs[key]}" for label, key in CONTEXT_FIELDS if str(inputs.get(key) or "").strip())
+
+
+# Function to build the chat messages for one section
+def build_messages(section, inputs):
+    document_type = inputs["document_type"].lower()
+    system = (
+        f"You are a helpful assistant with deep knowledge in {document_type} creation and financial forecasting.\n\n"
+        f"Business details:\n{build_context_block(inputs)}"
+    )
+    user = f"Generate the {section} of the {document_type}."
+    if needs_financial_instructions(section):
+        user += f" {FINANCIAL_INSTRUCTIONS}"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+# The previous prompt, which repeated every field and instruction in each section's request.
+# Kept as the baseline for savings_report().
+def legacy_messages(section, inputs):
+    prompt = f"""
+    Generate the {section} of a {inputs["document_type"].lower()} based on the following inputs:
+    Language: {inputs["language"]}
+    Writing Person: {inputs["writing_person"]}
+    Writing Style: {inputs["writing_style"]}
+    Document Length: {inputs["document_length"]}
+    Template: {inputs["template"]}
+    Business Type: {inputs["business_type"]}
+    BEE Level: {inputs["bee_level"]}
+    Directors/Shareholders: {inputs["directors"]}
+    Staffing Compliment: {inputs["staffing"]}
+    Funding Amount: {inputs["funding_amount"]}
+    Grant Amount: {inputs["grant_amount"]}
+    Finance Term: {inputs["finance_term"]}
+    Business Overview: {inputs["business_overview"]}
+
+    Ensure that all financial tables, including revenue projections, operating expenses, net profit, and cash flow (if applicable), are calculated accurately based on industry standards, market conditions, and the provided business context. Include all relevant calculations and ensure that all numbers in tables and projections are precise and consistent with the overall document.
+    """
+    return [
+        {"role": "system", "content": f"You are a helpful assistant with deep knowledge in {inputs['document_type'].lower()} creation and financial forecasting."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# Running averages of prompt and completion tokens per section, shared across processes
+class UsageStats:
+    def __init__(self, path=USAGE_STATS_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS section_usage (
+                    document_type TEXT NOT NULL,
+                    document_length TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    samples INTEGER NOT NULL,
+                    prompt_tokens REAL NOT NULL,
+                    completion_tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (document_type, document_length, section)
+                )
+            """)
+
+    # sqlite3 connections can't be shared between threads, so keep one per thread
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, document_type, document_length, section, prompt_tokens, completion_tokens):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT samples, prompt_tokens, completion_tokens FROM section_usage WHERE document_type = ? AND document_length = ? AND section = ?",
+                (document_type, document_length, section)
+            ).fetchone()
+            if row is None:
+                samples, prompt_average, completion_average = 1, prompt_tokens, completion_tokens
+            else:
+                samples = row[0] + 1
+                weight = max(USAGE_SMOOTHING, 1 / samples)
+                prompt_average = row[1] + weight * (prompt_tokens - row[1])
+                completion_average = row[2] + weight * (completion_tokens - row[2])
+            conn.execute(
+                "INSERT OR REPLACE INTO section_usage VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (document_type, document_length, section, samples, prompt_average, completion_average, time.time())
+            )
+
+    # Function to get {section: average completion tokens} for one document type and length
+    def completion_averages(self, document_type, document_length):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT section, completion_tokens FROM section_usage WHERE document_type = ? AND document_length = ?",
+                (document_type, document_length)
+            ).fetchall()
+        return dict(rows)
+
+
+# Function to split the document budget into max_tokens per section.
+# Sections with a history get a share in proportion to their usual completion length; sections
+# without one are weighted like an average section.
+def allocate_max_tokens(sections, document_length, averages=None):
+    budget = DOCUMENT_TOKEN_BUDGETS.get(document_length, DOCUMENT_TOKEN_BUDGETS["Long"])
+    cap = LEGACY_MAX_TOKENS.get(document_length, LEGACY_MAX_TOKENS["Long"])
+    averages = averages or {}
+    known = [averages[section] for section in sections if averages.get(section)]
+    default_weight = sum(known) / len(known) if known else 1.0
+    weights = {section: averages.get(section) or default_weight for section in sections}
+    total = sum(weights.values())
+    return {
+        section: int(min(cap, max(MIN_SECTION_TOKENS, budget * weights[section] / total)))
+        for section in sections
+    }
+
+
+def estimate_cost(prompt_tokens, completion_tokens, model="gpt-4"):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+# Function to compare the legacy prompts and fixed limits with the current ones for every document type.
+# Completion figures are the max_tokens limits, i.e. the most a document can be billed for.
+def savings_report(inputs, document_sections, usage=None):
+    rows = []
+    for document_type, sections in document_sections.items():
+        document_inputs = dict(inputs, document_type=document_type)
+        document_length = document_inputs["document_length"]
+        averages = usage.completion_averages(document_type, document_length) if usage else None
+
+        legacy_prompt = sum(count_message_tokens(legacy_messages(section, document_inputs)) for section in sections)
+        prompt = sum(count_message_tokens(build_messages(section, document_inputs)) for section in sections)
+        legacy_completion = LEGACY_MAX_TOKENS.get(document_length, LEGACY_MAX_TOKENS["Long"]) * len(sections)
+        completion = sum(allocate_max_tokens(sections, document_length, averages).values())
+        legacy_cost = estimate_cost(legacy_prompt, legacy_completion)
+        cost = estimate_cost(prompt, completion)
+        rows.append({
+            "document_type": document_type,
+            "sections": len(sections),
+            "legacy_prompt_tokens": legacy_prompt,
+            "prompt_tokens": prompt,
+            "legacy_max_completion_tokens": legacy_completion,
+            "max_completion_tokens": completion,
+            "tokens_saved": legacy_prompt + legacy_completion - prompt - completion,
+            "legacy_cost": legacy_cost,
+            "cost": cost,
+            "cost_saved": legacy_cost - cost,
+        })
+    return rows
+
+
+_usage = None
+_usage_lock = threading.Lock()
+
+
+def get_usage_stats():
+    global _usage
+    with _usage_lock:
+        if _usage is None:
+            _usage = UsageStats()
+        return _usage
+
+
+def set_usage_stats(usage):
+    global _usage
+    with _usage_lock:
+        _usage = usage
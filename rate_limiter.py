@@ -0,0 +1,188 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import increment, observe
+
+# Process-wide scheduler in front of every OpenAI call.
+# Requests/min and tokens/min are token buckets; a call waits until both have room for it.
+# Waiting calls are served round-robin across sessions (FIFO within a session), so one user's
+# 16-section Long document can't starve everyone else's calls. Limits of 0 disable a bucket.
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "150000"))
+
+# The session that calls made from this context are queued under; see rate_limit_session()
+current_session = contextvars.ContextVar("rate_limit_session", default="default")
+
+
+# Function to tag every API call made inside the block (and in threads started with a copy of
+# the context) as belonging to one session
+@contextmanager
+def rate_limit_session(session_key):
+    token = current_session.set(session_key)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until amount is available (0 if it is now)
+    def wait_time(self, amount, now):
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def give(self, amount):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=OPENAI_RPM_LIMIT, tokens_per_minute=OPENAI_TPM_LIMIT):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        # Waiting tickets per session, and the order in which sessions take turns
+        self._queues = {}
+        self._turns = deque()
+        # Metrics
+        self.granted = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    # Function to wait for this call's turn and capacity; returns the tokens reserved
+    def acquire(self, tokens, session=None):
+        session = session or current_session.get()
+        # A call bigger than the whole bucket would never fit; let it through when the bucket is full
+        tokens = min(tokens, self.tokens.capacity) if self.tokens.capacity else tokens
+        ticket = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            queue = self._queues.get(session)
+            if queue is None:
+                queue = self._queues[session] = deque()
+                self._turns.append(session)
+            queue.append(ticket)
+            self.max_queue_depth = max(self.max_queue_depth, self._depth())
+
+            while True:
+                if self._queues[self._turns[0]][0] is not ticket:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                queue.popleft()
+                self._turns.popleft()
+                if queue:
+                    self._turns.append(session)
+                else:
+                    del self._queues[session]
+
+                waited = now - enqueued
+                self.granted += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                observe("rate_limit_wait", waited)
+                self._cond.notify_all()
+                return tokens
+
+    # Function to hand back the part of a reservation the call didn't use
+    def release(self, reserved, used):
+        if used < reserved:
+            with self._cond:
+                self.tokens.give(reserved - used)
+                self._cond.notify_all()
+
+    # Hold every queued call after the API says we're over the limit
+    def pause(self, seconds):
+        increment("rate_limited")
+        with self._cond:
+            self.rate_limited += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Function to reserve capacity around one API call:
+    #     with limiter.reserve(estimated_tokens) as reservation:
+    #         response = openai.ChatCompletion.create(...)
+    #         reservation["used"] = response["usage"]["total_tokens"]
+    # Whatever isn't marked used is given back, including the whole reservation of a call that failed
+    # before reporting any use (a timeout, a 5xx, a rejected request), so failures don't drain the budget.
+    @contextmanager
+    def reserve(self, tokens, session=None):
+        # Imported here so pages that only show scheduler stats don't load the openai package
+        import openai
+        from llm_retry import retry_after
+
+        reservation = {"reserved": self.acquire(tokens, session), "used": None}
+        try:
+            yield reservation
+        except openai.error.RateLimitError as e:
+            self.pause(retry_after(e) or 1.0)
+            raise
+        finally:
+            self.release(reservation["reserved"], reservation["used"] or 0)
+
+    def _depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self.requests.wait_time(0, now)
+            self.tokens.wait_time(0, now)
+            return {
+                "queue_depth": self._depth(),
+                "waiting_sessions": len(self._queues),
+                "max_queue_depth": self.max_queue_depth,
+                "granted": self.granted,
+                "rate_limited": self.rate_limited,
+                "average_wait": self.total_wait / self.granted if self.granted else 0.0,
+                "max_wait": self.max_wait,
+                "requests_available": self.requests.level if self.requests.capacity else None,
+                "tokens_available": self.tokens.level if self.tokens.capacity else None,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def set_rate_limiter(limiter):
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
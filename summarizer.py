@@ -0,0 +1,210 @@
+import contextvars
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from llm_cache import get_cache
+from llm_retry import call_with_retry
+from metrics import observe, timed
+from rate_limiter import get_rate_limiter
+from token_counting import count_tokens
+
+# Map-reduce summarization for transcripts that don't fit in one prompt.
+# The transcript is split on speaker turns or sentences into chunks of at most CHUNK_TOKENS,
+# chunks are summarized in parallel (map), and the partial summaries are merged (reduce),
+# in several rounds when they are still too long to merge at once.
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+REDUCE_INPUT_TOKENS = int(os.getenv("SUMMARY_REDUCE_INPUT_TOKENS", "5000"))
+SUMMARY_MAX_TOKENS = 500
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+
+SPEAKER_TURN = re.compile(r"^\s*[A-Z][\w .'-]{0,40}:\s", re.MULTILINE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def single_prompt(transcript_text):
+    return f"""
+        Summarize the following meeting transcript into key points, action items, and decisions:
+        {transcript_text}
+        """
+
+
+def map_prompt(chunk, index, total):
+    return f"""
+        Summarize part {index} of {total} of a meeting transcript into key points, action items, and decisions:
+        {chunk}
+        """
+
+
+def reduce_prompt(summaries, final):
+    joined = "\n\n".join(summaries)
+    if final:
+        return f"""
+        Combine these partial summaries of one meeting into a single summary with sections for key points, action items, and decisions. Remove duplicates:
+        {joined}
+        """
+    return f"""
+        Combine these partial summaries of one meeting into one shorter summary of its key points, action items, and decisions:
+        {joined}
+        """
+
+
+def rolling_prompt(summary, new_text, final):
+    if final:
+        return f"""
+        Here are a running summary of a meeting and the last part of its transcript. Write the final meeting notes with sections for key points, action items, and decisions. Remove duplicates:
+        Summary so far:
+        {summary}
+
+        Last part of the transcript:
+        {new_text}
+        """
+    return f"""
+        Here are a running summary of a meeting in progress and the next part of its transcript. Update the summary of the key points, action items, and decisions so far, keeping it short:
+        Summary so far:
+        {summary or "(nothing yet)"}
+
+        Next part of the transcript:
+        {new_text}
+        """
+
+
+# Function to split text into speaker turns if it has them, else into sentences
+def split_units(text):
+    starts = [match.start() for match in SPEAKER_TURN.finditer(text)]
+    if len(starts) > 1:
+        starts = [0] + [start for start in starts if start > 0]
+        return [text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+    return [unit for unit in SENTENCE_END.split(text) if unit.strip()]
+
+
+# Function to pack units greedily into chunks of at most max_tokens; oversized units are split on words
+def chunk_transcript(text, max_tokens=CHUNK_TOKENS):
+    chunks, current, current_tokens = [], [], 0
+    for unit in split_units(text):
+        unit_tokens = count_tokens(unit)
+        if unit_tokens > max_tokens:
+            words = unit.split()
+            step = max(1, len(words) * max_tokens // unit_tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [unit]
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# Function to run one completion through the shared response cache; returns (text, prompt_tokens, completion_tokens)
+def complete(prompt, bypass_cache=False, max_tokens=SUMMARY_MAX_TOKENS):
+    request = dict(
+        model="gpt-4",
+        prompt=prompt,
+        max_tokens=max_tokens,
+        n=1,
+        stop=None,
+        temperature=0.7
+    )
+
+    prompt_tokens = count_tokens(prompt)
+
+    def attempt():
+        with get_rate_limiter().reserve(prompt_tokens + max_tokens) as reservation:
+            response = openai.Completion.create(**request)
+            reservation["used"] = prompt_tokens + response.get("usage", {}).get("completion_tokens", max_tokens)
+            return response
+
+    def create():
+        response = call_with_retry(attempt)
+        return response.choices[0].text.strip(), response.choices[0].get("finish_reason")
+
+    text = get_cache().get_or_create(request, create, bypass=bypass_cache)
+    return text, prompt_tokens, count_tokens(text)
+
+
+# Run a batch of prompts concurrently and record the stage's latency and token usage
+def run_stage(name, prompts, stage_stats, bypass_cache, max_concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts)))) as executor:
+        # Workers inherit the caller's context, e.g. its rate-limit session
+        contexts = [contextvars.copy_context() for _ in prompts]
+        results = list(executor.map(lambda context, prompt: context.run(complete, prompt, bypass_cache), contexts, prompts))
+    seconds = time.perf_counter() - start
+    observe("summarize_stage", seconds, step=name.split(" ")[0])
+    stage_stats.append({
+        "stage": name,
+        "calls": len(prompts),
+        "seconds": seconds,
+        "prompt_tokens": sum(result[1] for result in results),
+        "completion_tokens": sum(result[2] for result in results),
+    })
+    return [result[0] for result in results]
+
+
+# Function to group summaries so each group's combined size fits in one reduce prompt
+def group_summaries(summaries, max_tokens=REDUCE_INPUT_TOKENS):
+    groups, current, current_tokens = [], [], 0
+    for summary in summaries:
+        tokens = count_tokens(summary)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+# Function to summarize a transcript into key points, action items and decisions.
+# Returns (summary, stage_stats) where stage_stats lists latency and token usage per stage.
+@timed("summarization")
+def summarize_transcript(transcript_text, bypass_cache=False, chunk_tokens=CHUNK_TOKENS, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    stage_stats = []
+    chunks = chunk_transcript(transcript_text, chunk_tokens)
+    if len(chunks) <= 1:
+        summary = run_stage("summarize", [single_prompt(transcript_text)], stage_stats, bypass_cache, max_concurrency)[0]
+        return summary, stage_stats
+
+    summaries = run_stage(
+        "map", [map_prompt(chunk, i + 1, len(chunks)) for i, chunk in enumerate(chunks)],
+        stage_stats, bypass_cache, max_concurrency
+    )
+
+    # Hierarchical reduce: merge groups of summaries until one final merge fits in a prompt
+    level = 1
+    groups = group_summaries(summaries)
+    while len(groups) > 1:
+        summaries = run_stage(
+            f"reduce (level {level})", [reduce_prompt(group, final=False) for group in groups],
+            stage_stats, bypass_cache, max_concurrency
+        )
+        merged = group_summaries(summaries)
+        # Guard against summaries that stop shrinking: merge whatever is left in one go
+        groups = merged if len(merged) < len(groups) else [summaries]
+        level += 1
+
+    summary = run_stage("reduce (final)", [reduce_prompt(groups[0], final=True)], stage_stats, bypass_cache, max_concurrency)[0]
+    return summary, stage_stats
+
+
+# Function to fold new transcript text into a running summary, for meetings still in progress; with
+# final=True the result is the finished notes. Each call sends only the summary and the new text, so
+# its cost doesn't grow with the length of the meeting. Returns (summary, stage_stats).
+@timed("summary_update")
+def update_summary(summary, new_text, final=False, bypass_cache=False, chunk_tokens=CHUNK_TOKENS):
+    stage_stats = []
+    chunks = chunk_transcript(new_text, chunk_tokens) or [""]
+    for index, chunk in enumerate(chunks):
+        last = final and index == len(chunks) - 1
+        summary = run_stage("final notes" if last else "update", [rolling_prompt(summary, chunk, last)], stage_stats, bypass_cache, 1)[0]
+    return summary, stage_stats
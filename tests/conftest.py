@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of flat modules in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai  # noqa: E402
+
+import llm_cache  # noqa: E402
+import prompt_builder  # noqa: E402
+import rate_limiter  # noqa: E402
+from fake_openai_server import start_fake_server  # noqa: E402
+
+
+# Fixture to start fake OpenAI servers: fake_api(**options) takes start_fake_server's options and returns
+# the server, with the openai client pointed at it. The response cache, usage statistics and rate
+# limiter are throwaway ones for the test; everything is restored afterwards.
+@pytest.fixture
+def fake_api(tmp_path, monkeypatch):
+    servers = []
+    monkeypatch.setattr(openai, "api_key", "fake-key")
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.LLMCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(prompt_builder, "_usage", prompt_builder.UsageStats(path=str(tmp_path / "usage.sqlite3")))
+    monkeypatch.setattr(rate_limiter, "_limiter", rate_limiter.RateLimiter(requests_per_minute=0, tokens_per_minute=0))
+
+    def start(**options):
+        options.setdefault("latency", 0.0)
+        server, api_base = start_fake_server(**options)
+        servers.append(server)
+        monkeypatch.setattr(openai, "api_base", api_base)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
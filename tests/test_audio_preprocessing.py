@@ -0,0 +1,115 @@
+import wave
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from audio_preprocessing import preprocess_audio, to_mono, to_original_time
+from transcription import encode_wav
+
+RATE = 44100
+# (start, seconds, amplitude) of each tone burst, separated by silences long enough to be cut
+BURSTS = [(1.0, 0.25, 0.3), (3.5, 0.4, 0.02), (6.2, 0.25, 0.5), (9.0, 0.3, 0.05), (11.75, 0.25, 0.3)]
+DURATION = 13.5
+
+
+# A stereo 16-bit recording of tone bursts over faint noise
+def bursts_wav():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 0.001, int(DURATION * RATE))
+    for start, seconds, amplitude in BURSTS:
+        first = int(start * RATE)
+        times = np.arange(int(seconds * RATE)) / RATE
+        # A cosine starts at its peak, so the burst's onset is its first sample
+        samples[first:first + len(times)] += amplitude * np.cos(2 * np.pi * 440 * times)
+    pcm = np.round(np.repeat(samples, 2) * 32767).astype("<i2").tobytes()
+    return encode_wav(2, 2, RATE, pcm, "bursts.wav").getvalue()
+
+
+def read_wav(audio):
+    with wave.open(BytesIO(audio), "rb") as wav:
+        frames = wav.readframes(wav.getnframes())
+        return wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), np.frombuffer(frames, dtype="<i2") / 32768
+
+
+# Onset times in seconds of the runs of samples above the level, runs closer than 0.1 s being one run
+def onsets(samples, rate, level=0.005):
+    loud = np.flatnonzero(np.abs(samples) > level)
+    starts = loud[np.concatenate(([True], np.diff(loud) > 0.1 * rate))]
+    return list(starts / rate)
+
+
+@pytest.fixture(scope="module")
+def processed():
+    return preprocess_audio(bursts_wav(), "bursts.wav")
+
+
+def test_output_is_mono_16_khz(processed):
+    channels, sample_width, frame_rate, samples = read_wav(processed["audio"])
+    assert (channels, sample_width, frame_rate) == (1, 2, 16000)
+    assert processed["file_name"] == "bursts.wav"
+    assert len(samples) / frame_rate == pytest.approx(processed["stats"]["processed_seconds"])
+
+
+def test_silences_are_cut_without_losing_speech(processed):
+    stats = processed["stats"]
+    assert stats["cuts"] == len(BURSTS) - 1
+    assert stats["processed_seconds"] < stats["original_seconds"] / 2
+
+    # Every burst lies wholly inside one of the stretches that were kept
+    timestamp_map = processed["timestamp_map"]
+    ends = [processed_start for processed_start, _ in timestamp_map[1:]] + [stats["processed_seconds"]]
+    kept = [(original, original + end - processed_start) for (processed_start, original), end in zip(timestamp_map, ends)]
+    for start, seconds, _ in BURSTS:
+        assert any(first <= start and start + seconds <= last for first, last in kept)
+
+    _, _, frame_rate, samples = read_wav(processed["audio"])
+    assert len(onsets(samples, frame_rate)) == len(BURSTS)
+
+
+def test_processed_times_map_back_to_the_original(processed):
+    _, _, frame_rate, samples = read_wav(processed["audio"])
+    found = [to_original_time(processed["timestamp_map"], seconds) for seconds in onsets(samples, frame_rate)]
+    assert found == pytest.approx([start for start, _, _ in BURSTS], abs=0.002)
+
+
+def test_to_original_time():
+    timestamp_map = [(0.0, 0.5), (2.0, 4.0), (3.0, 10.0)]
+    assert to_original_time(timestamp_map, 0.0) == 0.5
+    assert to_original_time(timestamp_map, 1.5) == 2.0
+    assert to_original_time(timestamp_map, 2.0) == 4.0
+    assert to_original_time(timestamp_map, 3.25) == 10.25
+    assert to_original_time([], 7.0) == 7.0
+
+
+def test_to_mono_8_bit():
+    # Unsigned with 128 as silence; stereo pairs are averaged
+    frames = bytes([128, 128, 0, 0, 255, 255, 0, 255])
+    samples = to_mono(frames, 2, 1)
+    assert samples.dtype == np.float32
+    assert samples.tolist() == pytest.approx([0.0, -1.0, 127 / 128, -0.5 / 128])
+
+
+def test_to_mono_24_bit():
+    values = [0, 1, -1, 8388607, -8388608, 4194304, -4194304]
+    frames = b"".join(value.to_bytes(3, "little", signed=True) for value in values)
+    assert to_mono(frames, 1, 3).tolist() == pytest.approx([value / 8388608 for value in values])
+
+    # Stereo, and the same as the 16-bit samples it extends
+    pcm16 = np.array([1000, -1000, 32767, -32768, 0, 12345], dtype="<i2")
+    frames = b"".join((int(value) << 8).to_bytes(3, "little", signed=True) for value in pcm16)
+    assert to_mono(frames, 2, 3).tolist() == pytest.approx(to_mono(pcm16.tobytes(), 2, 2).tolist())
+
+
+@pytest.mark.parametrize("level, dip", [(0.0, 1.0), (0.001, 1.0), (0.2, 1.0), (0.2, 0.25)])
+def test_audio_without_quiet_stretches_is_kept_whole(level, dip):
+    # Digital silence, faint hiss and loud steady noise, one with two seconds where the noise drops by 12 dB:
+    # there is no quiet background for speech to stand out from, so nothing is cut
+    rng = np.random.default_rng(1)
+    samples = rng.normal(0, level, 30 * RATE) if level else np.zeros(30 * RATE)
+    samples[10 * RATE:12 * RATE] *= dip
+    pcm = np.round(np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+    processed = preprocess_audio(encode_wav(1, 2, RATE, pcm, "steady.wav").getvalue(), "steady.wav")
+    assert processed["stats"]["cuts"] == 0
+    assert processed["stats"]["processed_seconds"] == pytest.approx(30.0, abs=0.01)
+    assert processed["timestamp_map"] == [(0.0, 0.0)]
@@ -0,0 +1,21 @@
+import pytest
+
+from batch_generate import generate_batch, read_batch_csv
+
+
+def test_rows_with_the_same_name_get_their_own_files(tmp_path):
+    path = tmp_path / "plans.csv"
+    path.write_text(
+        "name,document_type\nPlan,Business Plan\nplan,Business Plan\nPlan,Loan Application\n,Business Plan\nPlan_0003,Business Plan\n",
+        encoding="utf-8",
+    )
+    names = [name for name, _ in read_batch_csv(str(path))]
+    assert names == ["Plan", "plan_0002", "Plan_0003", "0004_Business_Plan", "Plan_0003_0005"]
+    # The same CSV gives the same names, so a rerun finds the files it already wrote
+    assert [name for name, _ in read_batch_csv(str(path))] == names
+
+
+def test_duplicate_names_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="plan"):
+        generate_batch([("Plan", {}), ("plan", {})], str(tmp_path))
+    assert not any(tmp_path.iterdir())
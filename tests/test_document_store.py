@@ -0,0 +1,241 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+import document_store
+from document_model import make_section, update_section
+from document_store import DocumentStore, apply_delta, text_delta
+
+PARAGRAPH = " ".join(f"The bakery opens branch number {number} with fresh bread, coffee and cakes." for number in range(40))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(str(tmp_path / "documents.sqlite3"))
+
+
+def new_document(text=PARAGRAPH):
+    return [make_section("Overview", text, [["bar", "Revenue"]]), make_section("Finance", "Funding of 500,000 over five years.")]
+
+
+def edited(document, index, text):
+    document = list(document)
+    document[index] = update_section(document[index], text)
+    return document
+
+
+def stored_sections(store):
+    with store._connect() as conn:
+        return conn.execute("SELECT kind, depth FROM sections").fetchall()
+
+
+@pytest.mark.parametrize("base, new", [
+    ("", ""),
+    ("", "Brand new text."),
+    ("Some text to remove.", ""),
+    ("One two three.", "One two three."),
+    ("One two three.", "Zero one two three."),
+    ("One two three.", "One two and a half three."),
+    ("One two three.", "One two three. Four."),
+    ("One  two\n\nthree\t", "One two\n\n\nthree "),
+    ("Café prices rise — by 5 %.", "Café prices fall — by 7 %, ünd more."),
+])
+def test_delta_round_trip(base, new):
+    assert apply_delta(base, text_delta(base, new)) == new
+
+
+def test_delta_round_trip_random_edits():
+    rng = np.random.default_rng(0)
+    words = PARAGRAPH.split(" ")
+    for _ in range(200):
+        edited_words = list(words)
+        for _ in range(int(rng.integers(1, 6))):
+            position = int(rng.integers(len(edited_words)))
+            action = rng.integers(3)
+            if action == 0:
+                edited_words.insert(position, "inserted")
+            elif action == 1:
+                del edited_words[position]
+            else:
+                edited_words[position] = edited_words[position].upper()
+        base, new = " ".join(words), " ".join(edited_words)
+        ops = text_delta(base, new)
+        assert apply_delta(base, ops) == new
+        # Most of the text is copied, not stored again
+        assert sum(len(op) for op in ops if isinstance(op, str)) < len(new) / 4
+
+
+def test_delta_chain_is_capped(store, monkeypatch):
+    monkeypatch.setattr(document_store, "DOCUMENT_DELTA_MAX_CHAIN", 3)
+    document = new_document()
+    document_id = store.create("alice", document, "Business Plan", {}, "Plan")
+    texts = [PARAGRAPH]
+    for edit in range(10):
+        texts.append(texts[-1] + f" Edit {edit}.")
+        document = edited(document, 0, texts[-1])
+        store.save_version("alice", document_id, document)
+
+    sections = stored_sections(store)
+    assert max(depth for _, depth in sections) == 3
+    # After three deltas in a row the section is stored in full again
+    assert sum(kind == "full" for kind, _ in sections) == 2 + 2
+    # Every version still loads, including from a fresh process with nothing cached
+    fresh = DocumentStore(store.path)
+    for version, text in enumerate(texts, 1):
+        assert fresh.load("alice", document_id, version)[0]["text"] == text
+
+
+def test_versions_branch_from_their_parent(store):
+    document = new_document()
+    document_id = store.create("alice", document, "Business Plan", {}, "Plan")
+    assert store.save_version("alice", document_id, document) == 1  # Nothing changed
+    version_2 = store.save_version("alice", document_id, edited(document, 1, "Funding of 600,000."))
+    # Edit version 1 again: a branch beside version 2, not on top of it
+    version_3 = store.save_version("alice", document_id, edited(document, 0, "A shorter overview."), parent=1)
+
+    assert (version_2, version_3) == (2, 3)
+    assert [(version["version"], version["parent"], version["changed"]) for version in store.versions("alice", document_id)] == [
+        (3, 1, 1), (2, 1, 1), (1, None, 2)
+    ]
+    assert store.get("alice", document_id)["head_version"] == 3
+    assert [section["text"] for section in store.load("alice", document_id, 2)] == [PARAGRAPH, "Funding of 600,000."]
+    assert [section["text"] for section in store.load("alice", document_id)] == [
+        "A shorter overview.", "Funding of 500,000 over five years."
+    ]
+
+
+def test_full_text_search_covers_every_version(store):
+    if not store.full_text_search:
+        pytest.skip("this SQLite has no FTS5")
+    document = new_document()
+    document_id = store.create("alice", document, "Business Plan", {}, "Bakery plan")
+    store.save_version("alice", document_id, edited(document, 1, "Funding from a regional development grant."))
+    other_id = store.create("alice", [make_section("Overview", "A logistics company moving freight.")], "Loan Application", {}, "Haulage")
+
+    assert [found["id"] for found in store.search("alice", "regional grant")] == [document_id]
+    # Words match as prefixes, and words from earlier versions still find the document
+    assert [found["id"] for found in store.search("alice", "fund five")] == [document_id]
+    assert [found["id"] for found in store.search("alice", "freig")] == [other_id]
+    assert store.search("alice", "regional freight") == []
+
+
+def test_like_search_without_full_text_index(store):
+    store.full_text_search = False
+    document_id = store.create("alice", new_document(), "Business Plan", {}, "Bakery expansion")
+    other_id = store.create("alice", new_document(), "Loan Application", {}, "Freight")
+
+    assert [found["id"] for found in store.search("alice", "expansion")] == [document_id]
+    assert [found["id"] for found in store.search("alice", "loan app")] == [other_id]
+    # Only titles and types are searched
+    assert store.search("alice", "coffee") == []
+    assert {found["id"] for found in store.search("alice", "  ")} == {document_id, other_id}
+
+
+def test_documents_are_only_visible_to_their_owner(store):
+    inputs = {"document_type": "Business Plan", "business_overview": "A bakery"}
+    document = new_document()
+    document_id = store.create("alice", document, "Business Plan", inputs, "Bakery plan", job_id="job-1")
+
+    assert [found["id"] for found in store.search("alice", "")] == [document_id]
+    assert store.find_by_inputs("alice", inputs) == document_id
+    assert store.find_by_job("alice", "job-1") == document_id
+
+    assert store.search("mallory", "") == []
+    assert store.search("mallory", "bakery") == []
+    assert store.list_recent("mallory") == []
+    assert store.find_by_inputs("mallory", inputs) is None
+    assert store.find_by_job("mallory", "job-1") is None
+    assert store.get("mallory", document_id) is None
+    assert store.load("mallory", document_id) is None
+    assert store.load("mallory", document_id, 1) is None
+    assert store.versions("mallory", document_id) == []
+    with pytest.raises(KeyError):
+        store.save_version("mallory", document_id, edited(document, 0, "Defaced."))
+    assert store.get("alice", document_id)["head_version"] == 1
+
+
+def test_documents_from_before_owners_can_be_claimed(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE documents (id TEXT PRIMARY KEY, title TEXT NOT NULL, document_type TEXT NOT NULL, inputs TEXT NOT NULL, "
+            "inputs_key TEXT NOT NULL, job_id TEXT, head_version INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        for document_id in ("old", "older"):
+            conn.execute("INSERT INTO documents VALUES (?, 'Old plan', 'Business Plan', '{}', '', NULL, 1, 0, 0)", (document_id,))
+    store = DocumentStore(path)
+    # Not listed for anyone until claimed
+    assert store.search("alice", "") == []
+    assert store.get("alice", "old") is None
+
+    assert store.claim("alice", "old") == 1
+    assert store.get("alice", "old")["title"] == "Old plan"
+    assert [found["id"] for found in store.search("alice", "")] == ["old"]
+    # Once claimed it is alice's alone
+    assert store.claim("mallory", "old") == 0
+    assert store.get("mallory", "old") is None
+    # The rest can be handed to one workspace at once
+    assert store.claim("bob") == 1
+    assert [found["id"] for found in store.search("bob", "")] == ["older"]
+
+
+def test_expired_documents_are_pruned(store):
+    if not store.full_text_search:
+        pytest.skip("this SQLite has no FTS5")
+    document = new_document() + [make_section("Appendix", "Notes only the old plan has.")]
+    old_id = store.create("alice", document, "Business Plan", {}, "Old plan")
+    document = edited(document, 0, PARAGRAPH + " An edit made long ago.")
+    store.save_version("alice", old_id, document)
+    shared = edited(document, 0, PARAGRAPH + " An edit both plans have.")
+    store.save_version("alice", old_id, shared)
+    # A recent document with the old one's Finance section, and its latest overview: a delta on a delta
+    recent_id = store.create("bob", [make_section("Finance", "Funding of 500,000 over five years.")], "Business Plan", {}, "New plan")
+    store.save_version("bob", recent_id, shared[1::-1])
+    with store._connect() as conn:
+        conn.execute("UPDATE documents SET updated_at = 0 WHERE id = ?", (old_id,))
+    sections_before = len(stored_sections(store))
+
+    assert store.prune(retention_days=30) == 1
+    assert store.get("alice", old_id) is None
+    assert store.versions("alice", old_id) == []
+    assert store.search("alice", "") == []
+    # Only the appendix is gone: the overview's delta chain is kept for the recent document, and still
+    # loads from a fresh process
+    assert len(stored_sections(store)) == sections_before - 1
+    fresh = DocumentStore(store.path)
+    assert [section["text"] for section in fresh.load("bob", recent_id)] == [section["text"] for section in shared[1::-1]]
+    assert [found["id"] for found in store.search("bob", "both plans")] == [recent_id]
+    assert store.search("bob", "long ago") == []
+    assert store.search("bob", "appendix notes") == []
+    assert store.prune(retention_days=30) == 0
+    # The deleted section is gone from the full-text index too
+    with store._connect() as conn:
+        assert conn.execute("SELECT rowid FROM section_search WHERE section_search MATCH 'appendix'").fetchall() == []
+
+
+def test_concurrent_saves_on_the_same_head(store):
+    document = new_document()
+    document_id = store.create("alice", document, "Business Plan", {}, "Plan")
+    threads, saves = 8, 10
+    barrier = threading.Barrier(threads)
+    versions, errors = [], []
+
+    def save(worker):
+        barrier.wait()
+        for number in range(saves):
+            try:
+                versions.append(store.save_version("alice", document_id, edited(document, 1, f"Edit {number} by worker {worker}.")))
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=save, args=(worker,)) for worker in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert sorted(versions) == list(range(2, 2 + threads * saves))
+    assert store.get("alice", document_id)["head_version"] == 1 + threads * saves
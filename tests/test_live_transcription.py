@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import llm_retry
+from audio_preprocessing import to_mono, to_pcm16
+from fake_openai_server import fake_transcribe
+from live_transcription import LiveMeeting, LiveTranscriber
+from transcription import encode_wav
+
+RATE = 16000
+
+
+# A mono 16-bit recording of noise, with silence over the given (start, end) seconds
+def noise_wav(seconds, silences=()):
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 0.1, seconds * RATE)
+    for start, end in silences:
+        samples[start * RATE:end * RATE] = 0
+    pcm = np.round(np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+    return encode_wav(1, 2, RATE, pcm, "meeting.wav").getvalue()
+
+
+# The fake ASR's words for each second of the recording, as the transcriber's chunks hear it
+def words_per_second(wav_bytes):
+    pcm = to_pcm16(to_mono(wav_bytes[44:], 1, 2))
+    return fake_transcribe(encode_wav(1, 2, RATE, pcm, "meeting.wav").getvalue())[0].split()
+
+
+def feed_all(transcriber, wav_bytes, block_seconds=0.1):
+    pcm = wav_bytes[44:]
+    block = int(block_seconds * RATE) * 2
+    for start in range(0, len(pcm), block):
+        transcriber.feed(pcm[start:start + block], 1, 2, RATE)
+
+
+# Threads of live meetings; the process-wide reaper outlives them by design
+def live_threads():
+    return [thread.name for thread in threading.enumerate()
+            if thread.name.startswith("live-") and thread.name != "live-meeting-reaper"]
+
+
+def wait_for_live_threads_to_exit(timeout=10):
+    deadline = time.monotonic() + timeout
+    while live_threads() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return live_threads()
+
+
+def test_chunks_are_merged_in_order_without_repeats(fake_api):
+    fake_api(completion_tokens=20)
+    wav_bytes = noise_wav(20)
+    # 5 s chunks advancing by 3 s; the 2 s overlap is heard twice and merged away
+    transcriber = LiveTranscriber(chunk_seconds=5, overlap_seconds=2, summary_seconds=6, max_concurrency=4)
+    feed_all(transcriber, wav_bytes)
+    transcript, summary = transcriber.stop()
+
+    assert transcript.split() == words_per_second(wav_bytes)
+    assert summary
+    stats = transcriber.stats
+    assert (stats["chunks"], stats["silent_chunks"], stats["failed_chunks"]) == (6, 0, 0)
+    assert stats["summary_updates"] >= 1
+    assert wait_for_live_threads_to_exit() == []
+
+
+def test_silent_chunks_are_not_sent(fake_api):
+    server = fake_api(completion_tokens=20)
+    # The chunk over 6-11 s is silence
+    wav_bytes = noise_wav(20, silences=[(6, 11)])
+    transcriber = LiveTranscriber(chunk_seconds=5, overlap_seconds=2, summary_seconds=600)
+    feed_all(transcriber, wav_bytes)
+    transcript, _ = transcriber.stop()
+
+    stats = transcriber.stats
+    assert (stats["chunks"], stats["silent_chunks"], stats["failed_chunks"]) == (6, 1, 0)
+    # Five chunks transcribed, then the final summary
+    assert server.counters["requests"] == 5 + 1
+    words = words_per_second(wav_bytes)
+    assert transcript.split()[:6] == words[:6]
+    assert transcript.split()[-9:] == words[11:]
+
+
+def test_failed_chunks_are_counted_and_the_meeting_goes_on(fake_api, monkeypatch):
+    monkeypatch.setattr(llm_retry, "RETRY_MAX_ATTEMPTS", 1)
+    fake_api(failure_rate=1.0)
+    transcriber = LiveTranscriber(chunk_seconds=5, overlap_seconds=2, summary_seconds=6)
+    feed_all(transcriber, noise_wav(14))
+    transcript, summary = transcriber.stop()
+
+    assert (transcript, summary) == ("", "")
+    stats = transcriber.stats
+    assert (stats["chunks"], stats["silent_chunks"], stats["failed_chunks"]) == (4, 0, 4)
+    assert transcriber.transcribed_seconds == 14
+    assert wait_for_live_threads_to_exit() == []
+
+
+def test_closing_a_meeting_cancels_its_chunks_cleanly(fake_api, caplog):
+    # A slow ASR, so chunks are still queued when the meeting is closed
+    fake_api(latency=0.3, completion_tokens=20)
+    transcriber = LiveTranscriber(chunk_seconds=2, overlap_seconds=1, summary_seconds=1, max_concurrency=1, max_pending=4)
+    meeting = LiveMeeting(transcriber, wav_bytes=noise_wav(12), speed=100)
+    while transcriber.snapshot()["pending_chunks"] < 3:
+        time.sleep(0.01)
+
+    with caplog.at_level(logging.ERROR, logger="concurrent.futures"):
+        meeting.close("Closed by the test")
+        assert wait_for_live_threads_to_exit() == []
+    # Callbacks of cancelled chunks ran without raising, and every chunk sent is accounted for
+    assert caplog.records == []
+    snapshot = transcriber.snapshot()
+    assert snapshot["pending_chunks"] == 0
+    assert snapshot["failed_chunks"] >= 1
+    assert meeting.error == "Closed by the test"
+    # Stopping afterwards just returns what was transcribed before the close
+    assert meeting.stop() == (transcriber.transcript(), transcriber.summary)
+
+
+@pytest.fixture(autouse=True)
+def no_leftover_threads():
+    yield
+    assert wait_for_live_threads_to_exit() == []
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from document_generator import generate_section
+from llm_cache import LLMCache, make_cache_key
+from test_llm_retry import INPUTS
+
+SECTION = "Executive Summary"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_a_new_budget_reuses_a_complete_reply(fake_api, stream):
+    server = fake_api(completion_tokens=10)
+    first, stats = generate_section(SECTION, INPUTS, 50, stream=stream)
+    assert not stats["cached"]
+    second, stats = generate_section(SECTION, INPUTS, 80, stream=stream)
+    assert stats["cached"] and second == first
+    assert server.counters["requests"] == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_a_cut_off_reply_is_not_served_to_a_larger_budget(fake_api, stream):
+    server = fake_api(completion_tokens=10)
+    cut_off, stats = generate_section(SECTION, INPUTS, 4, stream=stream)
+    assert not stats["cached"] and len(cut_off.split()) == 4
+
+    # No more room than it had: the cut-off reply is all this budget could give anyway
+    again, stats = generate_section(SECTION, INPUTS, 3, stream=stream)
+    assert stats["cached"] and again == cut_off
+
+    full, stats = generate_section(SECTION, INPUTS, 50, stream=stream)
+    assert not stats["cached"] and len(full.split()) == 10
+    assert server.counters["requests"] == 2
+    # The complete reply replaced it, for any budget
+    _, stats = generate_section(SECTION, INPUTS, 4, stream=stream)
+    assert stats["cached"]
+
+
+def test_key_covers_everything_but_max_tokens():
+    request = {"model": "gpt-4", "messages": [{"role": "user", "content": "Hi"}], "max_tokens": 10, "temperature": 0.7}
+    assert make_cache_key(request) == make_cache_key(dict(request, max_tokens=500))
+    assert make_cache_key(request) != make_cache_key(dict(request, temperature=0.2))
+    assert make_cache_key(request) != make_cache_key(dict(request, model="gpt-3.5-turbo"))
+
+
+def test_cache_from_before_budgets_were_recorded(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO responses VALUES ('old', 'Old reply', 9, strftime('%s', 'now'), 0)")
+    cache = LLMCache(path=path)
+    assert cache.get("old", 100) == "Old reply"
+    cache.set("new", "Cut off", max_tokens=2, finish_reason="length")
+    assert cache.get("new", 2) == "Cut off"
+    assert cache.get("new", 3) is None
+    assert cache.get("new") is None
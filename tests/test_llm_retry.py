@@ -0,0 +1,148 @@
+import time
+
+import openai
+import pytest
+
+import llm_retry
+from document_generator import DOCUMENT_SECTIONS, SectionGenerationError, generate_document
+from llm_retry import call_with_retry, retry_after, retry_delay
+
+INPUTS = {
+    "document_type": "Business Plan",
+    "language": "UK English",
+    "writing_person": "1st Person",
+    "writing_style": "Formal",
+    "document_length": "Short",
+    "template": "Standard",
+    "business_type": "Start-up",
+    "bee_level": "Level 1",
+    "directors": "Jane Doe",
+    "staffing": "12 staff",
+    "funding_amount": "500,000",
+    "grant_amount": "100,000",
+    "finance_term": "5 years",
+    "business_overview": "A bakery chain expanding into three new cities.",
+}
+
+
+def chat():
+    return openai.ChatCompletion.create(model="gpt-4", messages=[{"role": "user", "content": "Hello"}], max_tokens=5)
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(llm_retry, "RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(llm_retry, "RETRY_MAX_DELAY", 1.0)
+
+
+def test_transient_errors_are_retried_until_success(fake_api, fast_retries):
+    server = fake_api(failure_rate=1.0, retry_after=0.01)
+    attempts = []
+
+    def attempt():
+        attempts.append(1)
+        if len(attempts) == 3:
+            server.config["failure_rate"] = 0.0
+        return chat()
+
+    retries = []
+    response = call_with_retry(attempt, max_attempts=5, on_retry=lambda number, error, delay: retries.append(number))
+    assert response["choices"][0]["message"]["content"]
+    assert len(attempts) == 3
+    assert retries == [1, 2]
+    assert server.counters["requests"] == 3
+    assert server.counters["failures"] == 2
+
+
+def test_gives_up_after_max_attempts(fake_api, fast_retries):
+    server = fake_api(failure_rate=1.0, retry_after=0.01)
+    with pytest.raises((openai.error.RateLimitError, openai.error.ServiceUnavailableError)):
+        call_with_retry(chat, max_attempts=3)
+    assert server.counters["requests"] == 3
+
+
+def test_client_errors_are_not_retried():
+    attempts = []
+
+    def attempt():
+        attempts.append(1)
+        raise openai.error.InvalidRequestError("bad request", None)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        call_with_retry(attempt, max_attempts=5)
+    assert len(attempts) == 1
+
+
+def test_retry_after_from_a_429_is_honoured(fake_api, fast_retries):
+    # One request per minute: the second request is rate limited with the server's Retry-After
+    fake_api(rpm_limit=1, retry_after=7)
+    chat()
+    with pytest.raises(openai.error.RateLimitError) as error:
+        chat()
+    assert retry_after(error.value) == 7
+    assert retry_delay(error.value, 1, base_delay=0.01, max_delay=30) == 7
+    # ...but never longer than the maximum delay
+    assert retry_delay(error.value, 1, base_delay=0.01, max_delay=2) == 2
+
+
+def test_retry_after_formats():
+    def error(headers):
+        return openai.error.RateLimitError("rate limited", headers=headers)
+
+    assert retry_after(error({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(error({"Retry-After": "3"})) == 3
+    http_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert 55 <= retry_after(error({"Retry-After": http_date})) <= 60
+    assert retry_after(error({"Retry-After": "soon"})) is None
+    assert retry_after(error({})) is None
+
+
+def test_retry_waits_for_the_server_hint(fake_api, fast_retries):
+    server = fake_api(rpm_limit=1, retry_after=0.2)
+    chat()
+    delays = []
+
+    def attempt():
+        # Let the next attempt through once the client has waited
+        if delays:
+            server.config["rpm_limit"] = 0
+        return chat()
+
+    call_with_retry(attempt, max_attempts=3, on_retry=lambda number, error, delay: delays.append(delay))
+    assert delays and delays[0] >= 0.2
+
+
+def test_streamed_document_survives_injected_faults(fake_api, fast_retries, monkeypatch):
+    monkeypatch.setattr(llm_retry, "RETRY_MAX_ATTEMPTS", 20)
+    server = fake_api(completion_tokens=30, failure_rate=0.3, retry_after=0.01, seed=1)
+    parts, _, section_stats = generate_document(INPUTS, bypass_cache=True, stream=True)
+
+    assert all(parts)
+    retries = sum(stats["retries"] for stats in section_stats)
+    assert retries > 0
+    # Every injected failure was retried exactly once
+    assert retries == server.counters["failures"]
+    # Tokens from broken streams are reported as wasted, and only those
+    kept = sum(stats["completion_tokens"] for stats in section_stats)
+    assert server.counters["served_tokens"] - kept == sum(stats["wasted_tokens"] for stats in section_stats)
+
+
+def test_resume_requests_only_the_missing_sections(fake_api, monkeypatch):
+    monkeypatch.setattr(llm_retry, "RETRY_MAX_ATTEMPTS", 1)
+    server = fake_api(completion_tokens=10, failure_rate=0.5, retry_after=0.01, seed=3)
+    saved = {}
+    with pytest.raises(SectionGenerationError) as error:
+        generate_document(INPUTS, bypass_cache=True,
+                          on_progress=lambda index, section, completed, total, stats, text: saved.__setitem__(index, (text, stats)))
+    sections = DOCUMENT_SECTIONS[INPUTS["document_type"]]
+    assert error.value.failed_sections
+    assert len(saved) + len(error.value.failed_sections) == len(sections)
+
+    server.config["failure_rate"] = 0.0
+    requests_before = server.counters["requests"]
+    parts, _, section_stats = generate_document(INPUTS, bypass_cache=True, completed_parts=saved)
+    assert server.counters["requests"] - requests_before == len(error.value.failed_sections)
+    assert all(parts)
+    for index, (text, stats) in saved.items():
+        assert parts[index] == text
+        assert section_stats[index] is stats
@@ -0,0 +1,70 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import monte_carlo
+from monte_carlo import HISTOGRAM_LIMIT, PERCENTILES, PercentileHistogram, simulate
+
+BASE = {"Revenue": 1_000_000.0, "Expenses": 650_000.0, "Assets": 5_000_000.0, "Liabilities": 2_000_000.0,
+        "Equity": 3_000_000.0, "Profit": 350_000.0}
+CHECKED_PERCENTILES = [0, 1, 5, 25, 50, 75, 95, 99, 100]
+
+
+# Width of the histogram bin holding value, in the value's own units
+def bin_width(histogram, value):
+    width = 2 * HISTOGRAM_LIMIT / len(histogram.counts)
+    return histogram.scale * np.cosh(np.arcsinh(value / histogram.scale)) * width
+
+
+@pytest.mark.parametrize("distribution", ["normal", "lognormal", "mixed signs"])
+def test_histogram_percentiles_match_numpy(distribution):
+    rng = np.random.default_rng(1)
+    if distribution == "normal":
+        values = rng.normal(350_000, 120_000, 200_000)
+    elif distribution == "lognormal":
+        values = rng.lognormal(0, 1.5, 200_000)
+    else:
+        values = np.concatenate([rng.normal(-0.2, 0.05, 100_000), rng.normal(3.0, 1.0, 100_000)])
+
+    histogram = PercentileHistogram()
+    # Added in chunks, as simulate does
+    for chunk in np.array_split(values, 7):
+        histogram.add(chunk)
+    estimates = histogram.percentiles(CHECKED_PERCENTILES)
+    exact = np.percentile(values, CHECKED_PERCENTILES)
+    for estimate, value in zip(estimates, exact):
+        assert abs(estimate - value) <= 2 * bin_width(histogram, value)
+
+
+def test_histogram_counts_infinities_apart():
+    histogram = PercentileHistogram()
+    histogram.add(np.array([-np.inf] + [1.0] * 8 + [np.inf]))
+    assert histogram.percentiles([0, 50, 100]) == [-np.inf, 1.0, np.inf]
+    assert np.isnan(PercentileHistogram().percentiles([50])[0])
+
+
+def test_same_seed_gives_identical_results():
+    first = simulate(BASE, 30_000, periods=5, seed=7, chunk_size=4_000)
+    second = simulate(BASE, 30_000, periods=5, seed=7, chunk_size=4_000)
+    other = simulate(BASE, 30_000, periods=5, seed=8, chunk_size=4_000)
+
+    assert first["final"] == second["final"]
+    for name, bands in first["bands"].items():
+        for percentile in PERCENTILES:
+            np.testing.assert_array_equal(bands[percentile], second["bands"][name][percentile])
+    assert first["final"]["Profit"] != other["final"]["Profit"]
+
+
+def test_memory_does_not_grow_with_paths():
+    def peak(paths):
+        tracemalloc.start()
+        simulate(BASE, paths, periods=5, seed=0, chunk_size=5_000)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_bytes
+
+    # Both runs are past the sample kept for the bands, so only the number of chunks differs
+    assert 20_000 > monte_carlo.BAND_SAMPLE_PATHS
+    small, large = peak(20_000), peak(160_000)
+    assert large < small * 1.1
@@ -0,0 +1,45 @@
+import openai
+import pytest
+
+from rate_limiter import RateLimiter
+
+
+def available(limiter):
+    return limiter.stats()["tokens_available"]
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError("read timed out"),
+    openai.error.ServiceUnavailableError("server overloaded"),
+    openai.error.APIConnectionError("connection reset"),
+])
+def test_failed_call_gives_back_its_reservation(error):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=60_000)
+    with pytest.raises(type(error)):
+        with limiter.reserve(50_000):
+            raise error
+    # Only the refill since the test started can make up the difference
+    assert available(limiter) == pytest.approx(60_000, abs=100)
+
+
+def test_rate_limited_call_gives_back_its_reservation():
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=60_000)
+    with pytest.raises(openai.error.RateLimitError):
+        with limiter.reserve(50_000):
+            raise openai.error.RateLimitError("rate limited", headers={"retry-after-ms": "10"})
+    assert available(limiter) == pytest.approx(60_000, abs=100)
+    assert limiter.stats()["rate_limited"] == 1
+
+
+def test_used_tokens_are_kept_even_when_the_call_fails():
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=60_000)
+    with limiter.reserve(50_000) as reservation:
+        reservation["used"] = 20_000
+    assert available(limiter) == pytest.approx(40_000, abs=100)
+
+    # A stream that broke after using some of its reservation
+    with pytest.raises(openai.error.APIConnectionError):
+        with limiter.reserve(30_000) as reservation:
+            reservation["used"] = 5_000
+            raise openai.error.APIConnectionError("stream broken")
+    assert available(limiter) == pytest.approx(35_000, abs=100)
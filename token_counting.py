@@ -0,0 +1,30 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to an estimate when tiktoken isn't installed
+    tiktoken = None
+
+_encodings = {}
+
+
+# Function to count the tokens in text locally, without an API call
+def count_tokens(text, model="gpt-4"):
+    if not text:
+        return 0
+    if tiktoken is not None:
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            _encodings[model] = encoding
+        return len(encoding.encode(text))
+    # Roughly one token per 4 characters of English, and never fewer than one per word or symbol
+    return max(len(text) // 4, len(re.findall(r"\w+|[^\w\s]", text)))
+
+
+# Function to count the tokens of a chat request's messages, including per-message overhead
+def count_message_tokens(messages, model="gpt-4"):
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 3
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import re
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import openai
+
+from llm_retry import call_with_retry
+from metrics import observe, timed
+from rate_limiter import get_rate_limiter
+
+try:
+    from pydub import AudioSegment
+except ImportError:  # pydub (and the ffmpeg binary it runs) decode mp3/m4a uploads; see README
+    AudioSegment = None
+
+# Long recordings are split into overlapping segments in memory, transcribed concurrently,
+# and stitched back together with the repeated words in each overlap removed.
+SEGMENT_SECONDS = int(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "120"))
+OVERLAP_SECONDS = int(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "5"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TRANSCRIBE_MAX_CONCURRENCY", "4"))
+# Longest run of words we look for when matching the end of one segment to the start of the next
+MAX_OVERLAP_WORDS = 60
+# Single-word matches are too often coincidence ("the", "and") to drop
+MIN_OVERLAP_WORDS = 2
+# Largest file the transcription API accepts in one request
+API_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+
+# Function to decode an upload to PCM: returns (channels, sample_width, frame_rate, frames) or None
+def decode_audio(audio_bytes, file_name):
+    if file_name.lower().endswith(".wav"):
+        with wave.open(BytesIO(audio_bytes), "rb") as wav:
+            return wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.readframes(wav.getnframes())
+    if AudioSegment is not None:
+        try:
+            audio = AudioSegment.from_file(BytesIO(audio_bytes), format=os.path.splitext(file_name)[1].lstrip(".") or None)
+        except Exception:
+            return None
+        return audio.channels, audio.sample_width, audio.frame_rate, audio.raw_data
+    return None
+
+
+# Function to wrap PCM frames in an in-memory WAV file the API client can upload
+def encode_wav(channels, sample_width, frame_rate, frames, name):
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(frame_rate)
+        wav.writeframes(frames)
+    buffer.seek(0)
+    buffer.name = name  # openai uses the file name for the multipart upload
+    return buffer
+
+
+# Function to split audio into overlapping segments without touching the disk.
+# Returns a list of {"index", "start", "end", "file"} with times in seconds.
+# Audio we can't decode is sent whole as a single segment, unless it is too big for the API.
+def split_audio(audio_bytes, file_name, segment_seconds=SEGMENT_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    decoded = decode_audio(audio_bytes, file_name)
+    if decoded is None:
+        if len(audio_bytes) > API_MAX_UPLOAD_BYTES:
+            reason = "pydub or ffmpeg is not installed" if AudioSegment is None else "it could not be decoded (is ffmpeg installed?)"
+            raise ValueError(
+                f"{os.path.basename(file_name)} is {len(audio_bytes) / 2**20:.0f} MiB, over the API's "
+                f"{API_MAX_UPLOAD_BYTES // 2**20} MiB limit, and can't be split into segments because {reason}"
+            )
+        whole = BytesIO(audio_bytes)
+        whole.name = os.path.basename(file_name)
+        return [{"index": 0, "start": 0.0, "end": None, "file": whole}]
+
+    channels, sample_width, frame_rate, frames = decoded
+    frame_size = channels * sample_width
+    total_frames = len(frames) // frame_size
+    step = max(1, (segment_seconds - overlap_seconds) * frame_rate)
+    length = segment_seconds * frame_rate
+
+    segments = []
+    start = 0
+    while True:
+        end = min(start + length, total_frames)
+        segments.append({
+            "index": len(segments),
+            "start": start / frame_rate,
+            "end": end / frame_rate,
+            "file": encode_wav(channels, sample_width, frame_rate, frames[start * frame_size:end * frame_size], f"segment_{len(segments)}.wav"),
+        })
+        if end >= total_frames:
+            return segments
+        start += step
+
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+# Function to join two transcripts, dropping the words the second repeats from the end of the first
+def merge_overlap(previous_text, next_text, max_words=MAX_OVERLAP_WORDS, min_words=MIN_OVERLAP_WORDS):
+    if not previous_text:
+        return next_text
+    previous_words = previous_text.split()
+    next_words = next_text.split()
+    tail = [_normalize(word) for word in previous_words[-max_words:]]
+    head = [_normalize(word) for word in next_words[:max_words]]
+
+    for size in range(min(len(tail), len(head)), min_words - 1, -1):
+        if tail[-size:] == head[:size]:
+            next_words = next_words[size:]
+            break
+    return " ".join(previous_words + next_words)
+
+
+# Function to transcribe one segment; returns its text plus timing
+def transcribe_segment(segment, model="whisper-1"):
+    start = time.perf_counter()
+
+    def attempt():
+        segment["file"].seek(0)  # A failed attempt may have read part of the upload
+        # Whisper is limited by requests, not tokens
+        with get_rate_limiter().reserve(0):
+            return openai.Audio.transcribe(model, segment["file"])
+
+    response = call_with_retry(attempt)
+    seconds = time.perf_counter() - start
+    observe("transcribe_segment", seconds)
+    return response["text"].strip(), {
+        "segment": segment["index"],
+        "start": segment["start"],
+        "end": segment["end"],
+        "seconds": seconds,
+    }
+
+
+# Function to transcribe a recording in overlapping segments on a bounded thread pool.
+# Returns (transcript, segment_stats) with segment_stats in audio order.
+@timed("transcription")
+def transcribe_audio(audio_bytes, file_name, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                     segment_seconds=SEGMENT_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    segments = split_audio(audio_bytes, file_name, segment_seconds, overlap_seconds)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        # Workers inherit the caller's context, e.g. its rate-limit session
+        contexts = [contextvars.copy_context() for _ in segments]
+        results = list(executor.map(lambda context, segment: context.run(transcribe_segment, segment), contexts, segments))
+
+    transcript = ""
+    for text, _ in results:
+        transcript = merge_overlap(transcript, text)
+    return transcript, [stats for _, stats in results]